@@ -0,0 +1,40 @@
+"""
+Compares the size of the ai_analyze prompt data before (the full filtered CSV)
+and after build_analysis_context, for growing ledgers. Token counts use the
+same ~4 characters per token estimate as the context builder.
+
+Run from the repository root:
+    python -m benchmarks.bench_analysis_context --rows 1000 10000 100000 1000000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.analysis_context import DEFAULT_TOKEN_BUDGET, build_analysis_context, estimate_tokens
+from src.database_tools import Database_Tools
+
+QUESTION = "How much did I spend on coffee compared to groceries?"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Token budget")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'full CSV tokens':>16} {'context tokens':>15} {'build ms':>9}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            database = Database_Tools(write_ledger(directory, rows))
+            full_csv = database.export_data(file_format="csv")
+
+            start = time.perf_counter()
+            context = build_analysis_context(database, QUESTION, token_budget=args.budget)
+            elapsed = time.perf_counter() - start
+
+        print(f"{rows:>10,} {estimate_tokens(full_csv):>16,} {estimate_tokens(context):>15,} {elapsed * 1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Times batch_insert_data on a bank-statement sized batch (the path used by
+the batch_add_records Gemini tool).
+
+Run from the repository root:
+    python -m benchmarks.bench_batch_insert --batch 100000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.synthetic_ledger import generate_ledger, write_ledger
+from src.database_tools import Database_Tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000, help="Existing ledger size")
+    parser.add_argument("--batch", type=int, default=100_000, help="Records per batch")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = generate_ledger(args.batch, seed=1).drop(columns="id").to_dict(orient="records")
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database_Tools(write_ledger(directory, args.rows))
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            database.batch_insert_data(records)
+            timings.append(time.perf_counter() - start)
+
+    print(f"existing rows: {args.rows}, batch: {args.batch}")
+    for run, seconds in enumerate(timings, 1):
+        print(f"run {run}: {seconds * 1000:.0f} ms ({args.batch / seconds:,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Measures Database_Tools start-up time from the CSV ledger versus from its
+binary snapshot, i.e. what every uvicorn worker or --reload restart pays
+before it can serve.
+
+Run from the repository root:
+    python -m benchmarks.bench_cold_start --rows 10000 1000000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+
+
+def timed_open(csv_path, binary_snapshot, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        database = Database_Tools(csv_path, binary_snapshot=binary_snapshot)
+        best = min(best, time.perf_counter() - start)
+        database.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'csv ms':>10} {'snapshot ms':>12} {'speedup':>8}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = write_ledger(directory, rows)
+            from_csv = timed_open(csv_path, False, args.repeat)
+            # The first open writes the snapshot, the timed ones load it
+            Database_Tools(csv_path, binary_snapshot=True).close()
+            from_snapshot = timed_open(csv_path, True, args.repeat)
+        print(f"{rows:>10,} {from_csv * 1000:>10.0f} {from_snapshot * 1000:>12.0f} {from_csv / from_snapshot:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares mutation throughput and latency of the CSV engine's durability
+modes: 'sync' (one fsync per mutation), 'group' (concurrent writers share
+fsyncs, each still waits for its own) and 'async' (write-behind, nobody
+waits). Several threads insert records concurrently, like requests served
+from the thread pool. A second table times the journal alone (append plus
+waiting for durability), which is what the modes change; on disks with cheap
+fsyncs the ledger numbers are dominated by the in-memory insert.
+
+Run from the repository root:
+    python -m benchmarks.bench_durability --rows 100000 --threads 8 --writes 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+from src.journal import Journal
+from src.storage import DURABILITY_MODES
+
+
+def run_threads(mutate, threads, writes):
+    """
+    Calls mutate(worker, i) from several threads at once.
+
+    Returns:
+        tuple: (mutations per second, per-mutation latencies).
+    """
+    latencies = [[] for _ in range(threads)]
+    start_barrier = threading.Barrier(threads + 1)
+
+    def writer(worker):
+        start_barrier.wait()
+        for i in range(writes):
+            start = time.perf_counter()
+            mutate(worker, i)
+            latencies[worker].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=writer, args=(worker,)) for worker in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return threads * writes / elapsed, np.concatenate(latencies)
+
+
+def bench_ledger(directory, rows, durability, threads, writes):
+    database = Database_Tools(write_ledger(directory, rows), durability=durability)
+    throughput, latencies = run_threads(
+        lambda worker, i: database.insert_data("expense", 10 + i, f"bench {worker}-{i}", "Food", "2025-03-01"),
+        threads, writes,
+    )
+    # Write-behind mutations are only guaranteed on disk after close
+    database.close()
+    return throughput, latencies, database.journal.fsyncs
+
+
+def bench_journal(directory, durability, threads, writes):
+    journal = Journal(os.path.join(directory, "bench.journal"), durability=durability)
+    lock = threading.Lock()
+
+    def append(worker, i):
+        # Appends are serialized like commits under the write lock; waiting happens outside it
+        with lock:
+            journal.append({"op": "insert", "note": f"bench {worker}-{i}", "amount": 10 + i})
+            ticket = journal.appended
+        if durability == "group":
+            journal.wait_synced(ticket)
+
+    throughput, latencies = run_threads(append, threads, writes)
+    journal.close()
+    return throughput, latencies, journal.fsyncs
+
+
+def print_row(durability, throughput, latencies, fsyncs):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{durability:<8}{throughput:>10.0f}{p50:>10.3f}{p99:>10.3f}{fsyncs:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200, help="Inserts per thread")
+    args = parser.parse_args()
+
+    header = f"{'mode':<8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'fsyncs':>10}"
+    print(f"threads: {args.threads}, mutations per thread: {args.writes}")
+    print(f"\nledger inserts ({args.rows:,} rows)\n{header}")
+    for durability in DURABILITY_MODES:
+        with tempfile.TemporaryDirectory() as directory:
+            print_row(durability, *bench_ledger(directory, args.rows, durability, args.threads, args.writes))
+    print(f"\njournal only\n{header}")
+    for durability in DURABILITY_MODES:
+        with tempfile.TemporaryDirectory() as directory:
+            print_row(durability, *bench_journal(directory, durability, args.threads, args.writes))
+
+
+if __name__ == "__main__":
+    main()
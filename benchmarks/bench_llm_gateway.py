@@ -0,0 +1,55 @@
+"""
+Measures the per-request setup overhead that the long-lived LLM_Gateway
+removes from /genai: building a genai.Client, the 13 function declarations,
+the Tool and its GenerateContentConfig on every call. No network calls are made.
+
+Run from the repository root:
+    python -m benchmarks.bench_llm_gateway --iterations 200
+"""
+import argparse
+import time
+
+from google import genai
+from google.genai import types
+
+from src.llm_gateway import LLM_Gateway, build_tool
+
+
+def per_request_setup():
+    # What genai_api used to do before reaching generate_content
+    client = genai.Client(api_key="benchmark-key")
+    tool = build_tool()
+    config = types.GenerateContentConfig(tools=[tool])
+    return client, config
+
+
+def gateway_setup(gateway):
+    return gateway.client, gateway.tool_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        per_request_setup()
+    rebuilt = (time.perf_counter() - start) / args.iterations
+
+    start = time.perf_counter()
+    gateway = LLM_Gateway(api_key="benchmark-key", instructions="", function_mapping={})
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        gateway_setup(gateway)
+    reused = (time.perf_counter() - start) / args.iterations
+
+    print(f"rebuilt per request: {rebuilt * 1e6:,.0f} us/request")
+    print(f"shared gateway:      {reused * 1e6:,.2f} us/request (one-time startup {startup * 1e3:.1f} ms)")
+    print(f"overhead removed:    {(rebuilt - reused) * 1e6:,.0f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+End-to-end load test of the API with a local Gemini stand-in
+(benchmarks/fake_genai.py), so no API quota is spent and model latency is
+controlled. Closed-loop asyncio clients send a mixed workload:
+- /genai prompts that add records (scripted Gemini calls and local intents);
+- /genai queries (scripted calls, cached prompts and local intents);
+- /transactions pages, creates, updates and deletes.
+The report gives throughput and p50/p95/p99 latency per concurrency level,
+plus per-operation latency and the /genai resolution paths.
+
+By default the app runs in-process on a synthetic tenant ledger in a
+temporary directory, and the load generator shares its event loop. To
+include the HTTP server, start it with the stand-in and point --url at it:
+    BOOKKEEPING_FAKE_GEMINI_MS=300 uvicorn src.main:app --workers 4
+    python -m benchmarks.bench_load --url http://127.0.0.1:8000 --tenant loadtest
+
+Run from the repository root:
+    python -m benchmarks.bench_load --rows 100000 --concurrency 1 4 16 64 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic_ledger import generate_ledger
+
+# Operation -> weight in the mix
+WORKLOAD = {
+    "genai add": 20,
+    "genai query": 30,
+    "list page": 20,
+    "create": 15,
+    "update": 10,
+    "delete": 5,
+}
+# Prompts for the scripted stand-in (see fake_genai.DEFAULT_SCRIPT) and for the local intent parser
+GENAI_ADD_PROMPTS = [
+    "add expense coffee with the team",
+    "add pay freelance invoice",
+    "batch add this week's receipts",
+    "spent 12 dollars on lunch yesterday",
+]
+GENAI_QUERY_PROMPTS = [
+    "monthly total of my expenses",
+    "notes of my march expenses",
+    "categories I spent on in march",
+    "average expense in march",
+    "history of march expenses",
+    "analyze where my money went in march",
+    "total by type for expenses",
+    "how much did I spend in march 2024",
+    "break down my spending by category for 2024",
+    "find my coffee purchases in 2024",
+]
+
+
+class LoadState:
+    """
+    Ids the workload may update or delete. Clients share one event loop, so
+    no locking is needed.
+    """
+
+    def __init__(self, rows, seed):
+        self.random = random.Random(seed)
+        self.existing_ids = rows
+        self.created_ids = []
+        self.sequence = 0
+
+    def next_number(self):
+        self.sequence += 1
+        return self.sequence
+
+
+async def send(client, operation, state):
+    """
+    Sends one request of the given operation.
+
+    Returns:
+        httpx.Response: The response.
+    """
+    if operation == "genai add":
+        prompt = state.random.choice(GENAI_ADD_PROMPTS)
+        return await client.get(f"/genai/{prompt} #{state.next_number()}")
+    if operation == "genai query":
+        return await client.get(f"/genai/{state.random.choice(GENAI_QUERY_PROMPTS)}")
+    if operation == "list page":
+        return await client.get("/transactions", params={"cursor": "", "limit": 50, "descending": "true", "year": 2024})
+    if operation == "update" and (state.created_ids or state.existing_ids):
+        record_id = state.random.choice(state.created_ids) if state.created_ids else state.random.randint(1, state.existing_ids)
+        return await client.put(f"/transactions/{record_id}", json={"amount": -20.0, "note": "Updated by load test"})
+    if operation == "delete" and state.created_ids:
+        record_id = state.created_ids.pop(state.random.randrange(len(state.created_ids)))
+        return await client.delete(f"/transactions/{record_id}")
+    # "create", or a delete before anything was created
+    response = await client.post("/transactions", json={
+        "date": "03.15.2024", "day": "Fri", "category": "Food",
+        "note": f"Load test {state.next_number()}", "amount": -12.5,
+    })
+    if response.status_code == 201:
+        state.created_ids.append(response.json()["data"]["id"])
+    return response
+
+
+async def run_level(client, concurrency, requests, state):
+    """
+    Runs `requests` requests with `concurrency` closed-loop clients.
+
+    Returns:
+        dict: Throughput, overall and per-operation latencies, errors and /genai paths.
+    """
+    operations = list(WORKLOAD)
+    weights = list(WORKLOAD.values())
+    latencies = defaultdict(list)
+    errors = Counter()
+    paths = Counter()
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            operation = state.random.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await send(client, operation, state)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                response, failed = None, True
+            latencies[operation].append(time.perf_counter() - start)
+            if failed:
+                errors[operation] += 1
+            elif operation.startswith("genai"):
+                paths[response.json().get("path", "unknown")] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    every = np.concatenate([np.array(values) for values in latencies.values()]) * 1000
+    p50, p95, p99 = np.percentile(every, [50, 95, 99])
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+        "errors": dict(errors),
+        "genai_paths": dict(paths),
+        "operations": {
+            operation: {
+                "requests": len(values),
+                "p50_ms": float(np.percentile(values, 50) * 1000),
+                "p99_ms": float(np.percentile(values, 99) * 1000),
+            }
+            for operation, values in latencies.items()
+        },
+    }
+
+
+def print_report(levels):
+    print(f"\n{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for level in levels:
+        print(f"{level['concurrency']:>11} {level['throughput_rps']:>9.1f} {level['p50_ms']:>9.1f} "
+              f"{level['p95_ms']:>9.1f} {level['p99_ms']:>9.1f} {sum(level['errors'].values()):>7}")
+    top = levels[-1]
+    print(f"\nper operation at concurrency {top['concurrency']}")
+    for operation, timing in sorted(top["operations"].items()):
+        print(f"  {operation:<12} {timing['requests']:>6} requests  p50 {timing['p50_ms']:8.1f} ms  p99 {timing['p99_ms']:8.1f} ms")
+    print(f"/genai paths: {top['genai_paths']}")
+    if top["errors"]:
+        print(f"errors: {top['errors']}")
+
+
+async def run(args):
+    headers = {"X-Tenant-ID": args.tenant}
+    if args.url:
+        transport, base_url, app_module, directory = None, args.url, None, None
+    else:
+        # Configure the app before importing it: a tenant ledger in a temporary directory and the stand-in
+        directory = tempfile.mkdtemp(prefix="bench_load_")
+        generate_ledger(args.rows).to_csv(os.path.join(directory, f"{args.tenant}.csv"), index=False)
+        os.environ["BOOKKEEPING_TENANT_DIRECTORY"] = directory
+        os.environ["BOOKKEEPING_FAKE_GEMINI_MS"] = str(args.gemini_ms)
+        os.environ["BOOKKEEPING_FAKE_GEMINI_JITTER"] = str(args.gemini_jitter)
+        # Keep sampled request traces out of the report; failed requests are still logged
+        if not args.verbose:
+            os.environ.setdefault("BOOKKEEPING_LOG_LEVEL", "WARNING")
+        from src import main as app_module
+        transport, base_url = httpx.ASGITransport(app=app_module.app), "http://loadtest"
+
+    state = LoadState(args.rows, args.seed)
+    levels = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, headers=headers, timeout=120, limits=limits) as client:
+        for concurrency in args.concurrency:
+            level = await run_level(client, concurrency, args.requests, state)
+            levels.append(level)
+            print(f"concurrency {concurrency:>4}: {level['throughput_rps']:8.1f} req/s, p99 {level['p99_ms']:8.1f} ms")
+
+    if app_module is not None:
+        print(f"Gemini stand-in: {app_module.fake_gemini_client.stats()}")
+        await app_module.llm_gateway.aclose()
+        app_module.ledger_pool.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level")
+    parser.add_argument("--rows", type=int, default=100_000, help="Size of the synthetic ledger (in-process only)")
+    parser.add_argument("--gemini-ms", type=float, default=300.0, help="Median latency of the Gemini stand-in (in-process only)")
+    parser.add_argument("--gemini-jitter", type=float, default=0.5, help="Log-normal sigma of the stand-in's latency (in-process only)")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--tenant", default="loadtest", help="Tenant whose ledger takes the load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also save the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's sampled request traces")
+    args = parser.parse_args()
+
+    levels = asyncio.run(run(args))
+    print_report(levels)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "levels": levels}, f, indent=2, default=float)
+        print(f"report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
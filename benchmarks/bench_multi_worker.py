@@ -0,0 +1,60 @@
+"""
+Measures what CSV-engine process sync costs each worker: the staleness
+check every read makes when nothing has changed, the catch-up after another
+worker committed a burst of mutations, and the full reload that catch-up
+replaces.
+The two "workers" are two Database_Tools instances on the same ledger; their
+lock files are opened separately, so they coordinate like processes do.
+
+Run from the repository root:
+    python -m benchmarks.bench_multi_worker --rows 1000000 --writes 100
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--writes", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = write_ledger(directory, args.rows)
+        writer = Database_Tools(csv_path)
+        reader = Database_Tools(csv_path)
+
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            reader.refresh()
+        unchanged = (time.perf_counter() - start) / args.reads
+
+        for i in range(args.writes):
+            writer.insert_data("expense", 10 + i, f"bench {i}", "Food", "2025-03-01")
+        start = time.perf_counter()
+        reader.refresh()
+        catch_up = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with reader.write_lock:
+            reader.reload()
+        reload = time.perf_counter() - start
+
+        consistent = reader.current_total == writer.current_total and len(reader.data) == len(writer.data)
+        writer.close()
+        reader.close()
+
+    print(f"rows: {args.rows:,}, writes by the other worker: {args.writes}")
+    print(f"check, no changes:    {unchanged * 1e6:8.1f} us")
+    print(f"incremental catch-up: {catch_up * 1000:8.1f} ms")
+    print(f"full reload:          {reload * 1000:8.1f} ms")
+    print(f"copies consistent:    {consistent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares the CSV/pandas engine with the SQLite engine on the same synthetic
+ledger: cold open, a few aggregate queries, a keyset page and single inserts.
+
+Run from the repository root:
+    python -m benchmarks.bench_storage_engines --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+from src.sqlite_tools import SQLite_Tools
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def run(name, open_engine, repeat):
+    open_ms, database = timed(open_engine)
+    results = {"open": open_ms}
+    results["monthly total"], _ = timed(lambda: database.calculate_monthly_total("expense", 3, 2024), repeat)
+    results["average"], _ = timed(lambda: database.calculate_average_amount("pay", year=2023), repeat)
+    results["list categories"], _ = timed(lambda: database.list_categories(year=2024), repeat)
+    results["keyset page"], _ = timed(lambda: database.query_page(50, year=2024, descending=True), repeat)
+    results["insert"], _ = timed(lambda: database.insert_data("expense", 4.5, "Coffee", "Food", "2024-06-01"), repeat)
+    database.close()
+    print(name)
+    for operation, ms in results.items():
+        print(f"  {operation:<16} {ms:10.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = write_ledger(directory, args.rows)
+        sqlite_path = os.path.join(directory, "database.sqlite3")
+        # Import once so the timed open measures an existing database
+        SQLite_Tools(sqlite_path, import_csv=csv_path).close()
+
+        run("csv (pandas)", lambda: Database_Tools(csv_path), args.repeat)
+        run("sqlite", lambda: SQLite_Tools(sqlite_path), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
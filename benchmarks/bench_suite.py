@@ -0,0 +1,198 @@
+"""
+Microbenchmark suite for the storage engine's public methods at several
+ledger sizes. Every method is timed on a synthetic ledger, and the results
+are saved as JSON so runs can be compared. With --baseline the run is
+compared against an earlier results file, and the script exits with status 1
+when any method got slower than the threshold allows.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --sizes 1000 100000 1000000
+    python -m benchmarks.bench_suite --baseline benchmarks/results/before.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_ledger import generate_ledger, write_ledger
+from src.database_tools import Database_Tools
+from src.sqlite_tools import SQLite_Tools
+
+RESULTS_DIRECTORY = os.path.join("benchmarks", "results")
+# Records per batch_insert_data call, about one bank statement
+BATCH_SIZE = 100
+
+
+def measure(func, repeat, budget):
+    """
+    Calls func up to `repeat` times, stopping early once `budget` seconds have
+    been spent (it always runs at least once).
+
+    Returns:
+        dict: Median, minimum and maximum milliseconds and the number of runs.
+    """
+    timings = []
+    spent = 0.0
+    for run in range(repeat):
+        start = time.perf_counter()
+        func(run)
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed * 1000)
+        spent += elapsed
+        if spent >= budget:
+            break
+    return {
+        "median_ms": float(np.median(timings)),
+        "min_ms": float(np.min(timings)),
+        "max_ms": float(np.max(timings)),
+        "runs": len(timings),
+    }
+
+
+def cases(database, rows):
+    """
+    Returns (name, func) pairs covering every public method. Each func takes
+    the run number, so mutations can pick a different record every run. Reads
+    come first, so they all see the generated ledger.
+    """
+    batch = generate_ledger(BATCH_SIZE, seed=1).drop(columns="id").to_dict(orient="records")
+    rng = np.random.default_rng(0)
+    update_ids = rng.permutation(np.arange(1, rows + 1))[:1000].tolist()
+    # Deletes take ids from the other end of the permutation so they never hit an updated record
+    delete_ids = rng.permutation(np.arange(1, rows + 1))[-1000:].tolist()
+
+    return [
+        ("calculate_monthly_total", lambda run: database.calculate_monthly_total("expense", 3, 2024)),
+        ("calculate_average_amount", lambda run: database.calculate_average_amount("pay", year=2023)),
+        ("calculate_monthly_total[30 days]", lambda run: database.calculate_monthly_total(
+            "expense", start_date="2024-06-01", end_date="2024-06-30")),
+        ("filter_data[Q3]", lambda run: database.filter_data(start_date="2024-07-01", end_date="2024-09-30")),
+        ("summarize[category, month]", lambda run: database.summarize(["category", "month"], "expense", year=2024)),
+        ("search_notes[prefix, 20]", lambda run: database.search_notes("weekly groc", limit=20)),
+        ("search_notes[expense, 2024]", lambda run: database.search_notes("coffee", "expense", year=2024)),
+        ("list_notes", lambda run: database.list_notes("expense", 3, 2024)),
+        ("list_categories", lambda run: database.list_categories(year=2024)),
+        ("export_data[json, month]", lambda run: database.export_data("json", "expense", 3, 2024)),
+        ("export_data[csv, month]", lambda run: database.export_data("csv", "expense", 3, 2024)),
+        ("export_data[list, month]", lambda run: database.export_data("list", "expense", 3, 2024)),
+        ("export_data[json, all]", lambda run: database.export_data("json")),
+        ("export_data[csv, all]", lambda run: database.export_data("csv")),
+        ("insert_data", lambda run: database.insert_data("expense", 4.5, "Coffee", "Food", "2024-06-01")),
+        ("update_data", lambda run: database.update_data(update_ids[run % len(update_ids)], amount=12.5, note="Updated")),
+        ("delete_data", lambda run: database.delete_data(delete_ids[run])),
+        (f"batch_insert_data[{BATCH_SIZE}]", lambda run: database.batch_insert_data(batch)),
+    ]
+
+
+def open_engine(engine, directory, rows):
+    csv_path = write_ledger(directory, rows)
+    if engine == "sqlite":
+        return SQLite_Tools(os.path.join(directory, "database.sqlite3"), import_csv=csv_path)
+    # No background compaction, so it does not run into the timings
+    return Database_Tools(csv_path, compact_threshold=sys.maxsize)
+
+
+def run_suite(engine, sizes, repeat, budget, only=None):
+    results = {}
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            database = open_engine(engine, directory, rows)
+            results[str(rows)] = {}
+            for name, func in cases(database, rows):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                # Repeat is capped by the number of distinct records a mutation can use
+                results[str(rows)][name] = measure(func, min(repeat, 1000), budget)
+                print(f"{rows:>9,} rows  {name:<34} {results[str(rows)][name]['median_ms']:10.3f} ms")
+            database.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results, baseline, threshold, noise_floor_ms):
+    """
+    Prints the ratio of every median to the baseline's.
+
+    Returns:
+        list: (rows, name, ratio) of the methods that regressed by more than
+        `threshold` (0.2 = 20% slower) and by more than `noise_floor_ms`.
+    """
+    regressions = []
+    print(f"\n{'rows':>9}  {'method':<34} {'baseline ms':>12} {'now ms':>10} {'ratio':>7}")
+    for rows, methods in results.items():
+        for name, timing in methods.items():
+            before = baseline.get(rows, {}).get(name)
+            if before is None:
+                continue
+            ratio = timing["median_ms"] / max(before["median_ms"], 1e-9)
+            regressed = ratio > 1 + threshold and timing["median_ms"] - before["median_ms"] > noise_floor_ms
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{int(rows):>9,}  {name:<34} {before['median_ms']:12.3f} {timing['median_ms']:10.3f} {ratio:7.2f}{flag}")
+            if regressed:
+                regressions.append((rows, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=("csv", "sqlite"), default="csv")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=50, help="Maximum runs per method")
+    parser.add_argument("--budget", type=float, default=2.0, help="Seconds after which a method stops repeating")
+    parser.add_argument("--only", nargs="+", help="Only run methods whose name contains one of these")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<engine>-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument("--noise-floor-ms", type=float, default=0.05, help="Smaller slowdowns are never regressions")
+    args = parser.parse_args()
+
+    results = run_suite(args.engine, args.sizes, args.repeat, args.budget, args.only)
+    report = {"engine": args.engine, "environment": environment(), "results": results}
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIRECTORY, f"{args.engine}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("engine", "csv") != args.engine:
+            print(f"warning: the baseline was measured on the {baseline.get('engine')} engine")
+        regressions = compare(results, baseline["results"], args.threshold, args.noise_floor_ms)
+        if regressions:
+            print(f"\n{len(regressions)} method(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
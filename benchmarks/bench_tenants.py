@@ -0,0 +1,69 @@
+"""
+Serves many tenant ledgers from a Ledger_Pool with a skewed access pattern
+(a few tenants are active, the rest rarely come back) and reports resident
+ledgers and memory against the total number of tenants, plus the latency of
+hits (ledger resident) versus cold opens.
+
+Run from the repository root:
+    python -m benchmarks.bench_tenants --tenants 200 --rows 20000 --active 10 --requests 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_ledger import generate_ledger
+from src.database_tools import Database_Tools
+from src.tenants import Ledger_Pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=20_000, help="Rows per tenant ledger")
+    parser.add_argument("--active", type=int, default=10, help="Tenants receiving 90% of the requests")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-ledgers", type=int, default=32)
+    parser.add_argument("--max-mb", type=float, default=128)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = generate_ledger(args.rows)
+        for tenant in range(args.tenants):
+            ledger.to_csv(os.path.join(directory, f"t{tenant}.csv"), index=False)
+
+        pool = Ledger_Pool(
+            open_ledger=lambda tenant: Database_Tools(os.path.join(directory, f"{tenant}.csv")),
+            max_ledgers=args.max_ledgers,
+            max_bytes=int(args.max_mb * 2**20),
+        )
+        rng = np.random.default_rng(0)
+        hot = rng.random(args.requests) < 0.9
+        choices = np.where(hot, rng.integers(0, args.active, args.requests), rng.integers(0, args.tenants, args.requests))
+
+        hits, misses, peak_bytes = [], [], 0
+        for choice in choices:
+            tenant = f"t{choice}"
+            loads = pool.loads
+            start = time.perf_counter()
+            database = pool.acquire(tenant)
+            database.calculate_monthly_total("expense", 3, 2024)
+            pool.release(tenant)
+            (misses if pool.loads > loads else hits).append(time.perf_counter() - start)
+            peak_bytes = max(peak_bytes, pool.stats()["resident_bytes"])
+        stats = pool.stats()
+        pool.close()
+
+    print(f"tenants: {args.tenants}, rows each: {args.rows:,}, requests: {args.requests}")
+    print(f"resident at end:  {stats['resident']} ledgers, {stats['resident_bytes'] / 2**20:.1f} MiB "
+          f"(peak {peak_bytes / 2**20:.1f} MiB, budget {args.max_mb:.0f} MiB)")
+    print(f"all tenants:      ~{stats['resident_bytes'] / max(stats['resident'], 1) * args.tenants / 2**20:.1f} MiB if all were resident")
+    print(f"loads/evictions:  {stats['loads']}/{stats['evictions']}")
+    print(f"hit  p50: {np.median(hits) * 1000:7.2f} ms  ({len(hits)} requests)")
+    print(f"cold p50: {np.median(misses) * 1000:7.2f} ms  ({len(misses)} requests)")
+
+
+if __name__ == "__main__":
+    main()
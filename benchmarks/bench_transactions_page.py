@@ -0,0 +1,74 @@
+"""
+Compares the old GET /transactions serialization (export the filtered ledger
+as JSON, json.loads it, slice, then reformat dates row by row) with the
+select-then-stream path and keyset pagination, for one page of a large
+ledger. Reports wall time and peak Python allocations measured with tracemalloc.
+
+Run from the repository root:
+    python -m benchmarks.bench_transactions_page --rows 1000000 --offset 500000 --limit 50
+"""
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+from src.date_index import encode_cursor
+from src.transaction_stream import STREAM_CHUNK_ROWS, chunk_to_json
+
+
+def legacy_page(database, offset, limit):
+    transactions = json.loads(database.export_data(file_format="json"))
+    transactions = transactions[offset:][:limit]
+    for transaction in transactions:
+        date_obj = datetime.strptime(transaction['date'], '%Y-%m-%d')
+        transaction['date'] = date_obj.strftime('%m.%d.%Y')
+        transaction['day'] = date_obj.strftime('%a')
+    return json.dumps({"success": True, "data": transactions})
+
+
+def streamed_page(database, offset, limit):
+    frame, positions = database.select_rows(offset=offset, limit=limit)
+    return [chunk_to_json(frame, positions[start:start + STREAM_CHUNK_ROWS])
+            for start in range(0, len(positions), STREAM_CHUNK_ROWS)]
+
+
+def keyset_page(database, offset, limit):
+    # The cursor a client would hold after reading `offset` rows in (date, id) order
+    cursor = encode_cursor(database.date_index.keys[offset - 1]) if offset else None
+    frame, positions, _ = database.query_page(limit, cursor=cursor)
+    return [chunk_to_json(frame, positions[start:start + STREAM_CHUNK_ROWS])
+            for start in range(0, len(positions), STREAM_CHUNK_ROWS)]
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--offset", type=int, default=500_000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database_Tools(write_ledger(directory, args.rows))
+        for name, func in (("legacy", legacy_page), ("streamed", streamed_page), ("keyset", keyset_page)):
+            # Warm-up call: the first id lookup builds the index's hash table once per process
+            func(database, args.offset, args.limit)
+            elapsed, peak = measure(func, database, args.offset, args.limit)
+            print(f"{name:>8}: {elapsed * 1000:8.1f} ms, peak {peak / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
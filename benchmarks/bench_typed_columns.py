@@ -0,0 +1,66 @@
+"""
+Compares the aggregate methods on typed columns against the previous string
+representation (amount as formatted text, date as 'YYYY-MM-DD').
+
+Run from the repository root:
+    python -m benchmarks.bench_typed_columns --rows 1000000
+"""
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+
+
+def legacy_queries(df):
+    # The pre-typed implementation: cast and parse the full column on every call.
+    df['amount'].astype(float).sum()
+    filtered = df[df['type'].str.lower() == 'expense']
+    filtered = filtered[pd.to_datetime(filtered['date']).dt.month == 3]
+    filtered = filtered[pd.to_datetime(filtered['date']).dt.year == 2024]
+    filtered['amount'].astype(float).sum()
+    filtered = df[df['type'].str.lower() == 'pay']
+    filtered = filtered[pd.to_datetime(filtered['date']).dt.year == 2024]
+    round(filtered['amount'].astype(float).mean(), 2)
+
+
+def typed_queries(database):
+    database.calculate_total_amount()
+    database.calculate_monthly_total('expense', 3, 2024)
+    database.calculate_average_amount('pay', None, 2024)
+
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_ledger(directory, args.rows)
+        legacy = pd.read_csv(path, dtype={'amount': str})
+        database = Database_Tools(path)
+
+        legacy_time = best_of(args.repeat, legacy_queries, legacy)
+        typed_time = best_of(args.repeat, typed_queries, database)
+
+    print(f"rows: {args.rows}")
+    print(f"string columns: {legacy_time * 1000:.1f} ms")
+    print(f"typed columns:  {typed_time * 1000:.1f} ms")
+    print(f"speedup:        {legacy_time / typed_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import math
+import random
+import time
+
+from google.genai import types
+
+from src.llm_gateway import build_tool
+
+# gemini_instructions end with this marker; the user's prompt follows it.
+USER_PROMPT_MARKER = "User prompt: "
+
+# One scripted call per declared tool. A prompt that starts with a key (case-insensitive)
+# resolves to its call; the first matching key wins, so longer keys come first.
+DEFAULT_SCRIPT = {
+    "batch add": ("batch_add_records", {"records": [
+        {"type": "expense", "amount": 12.5, "note": "Lunch", "category": "Food", "date": "2024-03-14"},
+        {"type": "expense", "amount": 40.0, "note": "Groceries", "category": "Groceries", "date": "2024-03-15"},
+        {"type": "pay", "amount": 250.0, "note": "Freelance Work", "category": "Salary", "date": "2024-03-15"},
+    ]}),
+    "add expense": ("add_expense", {"amount": 4.5, "note": "Coffee", "category": "Food", "date": "2024-03-15"}),
+    "add pay": ("add_pay", {"amount": 1200.0, "note": "Monthly Income", "category": "Salary", "date": "2024-03-01"}),
+    "update expense": ("update_expense", {"record_id": 1, "amount": 9.5}),
+    "update pay": ("update_pay", {"record_id": 2, "note": "Corrected"}),
+    "delete": ("delete_record", {}),
+    "total by type": ("get_total_amount_by_type", {"record_type": "expense"}),
+    "monthly total": ("get_monthly_total", {"record_type": "expense", "month": 3, "year": 2024}),
+    "notes": ("get_notes_list", {"record_type": "expense", "month": 3, "year": 2024}),
+    "categories": ("get_category_list", {"record_type": "expense", "month": 3, "year": 2024}),
+    "average": ("get_average_amount", {"record_type": "expense", "month": 3, "year": 2024}),
+    "history": ("get_transaction_history", {"record_type": "expense", "month": 3, "year": 2024}),
+    "break down": ("get_summary", {"group_by": ["category"], "record_type": "expense", "year": 2024}),
+    "find": ("search_transactions", {"query": "coffee", "record_type": "expense", "year": 2024}),
+    "analyze": ("ai_analyze", {"question": "Where does my money go?", "record_type": "expense", "month": 3, "year": 2024}),
+}
+ANALYSIS_TEXT = "Most of the spending went to Food and Groceries; Housing is the largest single expense."
+UNMATCHED_TEXT = "Sorry, I can't map that request to a bookkeeping function."
+
+
+
+class FakeGeminiClient:
+    """
+    Local stand-in for genai.Client, for load tests that must not spend API
+    quota or depend on the network. It answers generate_content with a
+    scripted function call when tools are offered (LLM_Gateway.choose_function)
+    and with canned text otherwise (LLM_Gateway.generate_text, used by
+    ai_analyze). Every response is delayed by a log-normal latency, as real
+    model calls are.
+    """
+
+    def __init__(self, script=None, latency_ms=300.0, jitter=0.5, seed=None):
+        """
+        Args:
+            script (dict, optional): Maps prompt prefixes to (function name, args). Defaults to DEFAULT_SCRIPT.
+            latency_ms (float, optional): Median latency of a call.
+            jitter (float, optional): Sigma of the log-normal latency; 0 makes every call take latency_ms.
+            seed (int, optional): Seed for the latency draws.
+
+        Raises:
+            ValueError: If the script calls a function that is not declared to Gemini.
+        """
+        self.script = DEFAULT_SCRIPT if script is None else script
+        declared = {declaration.name for declaration in build_tool().function_declarations}
+        unknown = {name for name, _ in self.script.values()} - declared
+        if unknown:
+            raise ValueError(f"Scripted functions are not declared tools: {sorted(unknown)}")
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.calls = 0
+        self.total_latency_ms = 0.0
+        self._random = random.Random(seed)
+        self.aio = FakeAio(self)
+
+    def latency(self):
+        """
+        Draws the latency of one call in seconds.
+        """
+        return self.latency_ms * math.exp(self._random.gauss(0.0, self.jitter)) / 1000 if self.jitter else self.latency_ms / 1000
+
+    def respond(self, contents, config):
+        """
+        Builds the response to a generate_content call.
+
+        Returns:
+            types.GenerateContentResponse: A function call or a text answer.
+        """
+        if not (config is not None and config.tools):
+            return self.text_response(ANALYSIS_TEXT)
+        prompt = contents[0].rsplit(USER_PROMPT_MARKER, 1)[-1].strip().lower()
+        for prefix, (name, args) in self.script.items():
+            if prompt.startswith(prefix):
+                part = types.Part(function_call=types.FunctionCall(name=name, args=dict(args)))
+                return types.GenerateContentResponse(
+                    candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+                )
+        return self.text_response(UNMATCHED_TEXT)
+
+    @staticmethod
+    def text_response(text):
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+        )
+
+    def stats(self):
+        """
+        Returns the number of calls and their mean simulated latency.
+        """
+        return {
+            "calls": self.calls,
+            "mean_latency_ms": round(self.total_latency_ms / self.calls, 2) if self.calls else 0.0,
+        }
+
+
+
+class FakeAio:
+    """
+    The client's `aio` namespace: async models plus aclose().
+    """
+
+    def __init__(self, client):
+        self.models = FakeModels(client)
+
+    async def aclose(self):
+        pass
+
+
+
+class FakeModels:
+    """
+    The `aio.models` namespace with an async generate_content.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def generate_content(self, model, contents, config=None):
+        start = time.perf_counter()
+        await asyncio.sleep(self.client.latency())
+        self.client.calls += 1
+        self.client.total_latency_ms += (time.perf_counter() - start) * 1000
+        return self.client.respond(contents, config)
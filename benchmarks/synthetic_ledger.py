@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pandas as pd
+
+# The categories the Gemini instructions offer the model
+EXPENSE_CATEGORIES = ["Food", "Groceries", "Transportation", "Housing", "Entertainment", "Shopping",
+                      "Utilities", "Health", "Education", "Travel", "Other"]
+PAY_CATEGORIES = ["Salary", "Bonus", "Gift", "Investment", "Refund", "Other"]
+NOTES = ["Weekly Groceries", "Restaurant Dinner", "Monthly Rent", "Bus Pass", "Coffee", "Movie Night",
+         "Phone Bill", "Pharmacy", "Course Fee", "Flight Tickets", "Monthly Income", "Freelance Work"]
+
+
+def generate_ledger(rows, seed=0, start="2020-01-01", end="2025-12-31"):
+    """
+    Generates a synthetic ledger in the on-disk schema (id,type,amount,note,category,date).
+
+    Args:
+        rows (int): Number of records to generate.
+        seed (int): Random seed so runs are comparable.
+        start (str): First possible date.
+        end (str): Last possible date.
+
+    Returns:
+        pd.DataFrame: The ledger with string dates and signed amounts.
+    """
+    rng = np.random.default_rng(seed)
+    is_expense = rng.random(rows) < 0.8
+    amount = np.round(rng.gamma(2.0, 40.0, rows), 2)
+    amount = np.where(is_expense, -amount, amount * 10)
+    category = np.where(
+        is_expense,
+        np.array(EXPENSE_CATEGORIES)[rng.integers(0, len(EXPENSE_CATEGORIES), rows)],
+        np.array(PAY_CATEGORIES)[rng.integers(0, len(PAY_CATEGORIES), rows)],
+    )
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    dates = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, rows), unit="D")
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "type": np.where(is_expense, "expense", "pay"),
+        "amount": amount,
+        "note": np.array(NOTES)[rng.integers(0, len(NOTES), rows)],
+        "category": category,
+        "date": dates.strftime("%Y-%m-%d"),
+    })
+
+
+def write_ledger(directory, rows, seed=0):
+    """
+    Writes a synthetic ledger CSV into a directory and returns its path.
+    """
+    path = os.path.join(directory, "database.csv")
+    generate_ledger(rows, seed).to_csv(path, index=False)
+    return path
@@ -0,0 +1,375 @@
+import numpy as np
+
+
+class Bucket:
+    """
+    Running totals for one (type, year, month, category) group. Amounts are kept
+    in integer cents so repeated deltas do not accumulate float error.
+
+    Only the smallest and largest amount are kept, not every amount. Removing
+    one of them marks the bucket stale; its min/max are then recomputed from
+    the ledger the next time they are asked for (see AggregateStore.extremes).
+    """
+
+    __slots__ = ("sum_cents", "count", "min_cents", "max_cents", "stale")
+
+    def __init__(self):
+        self.sum_cents = 0
+        self.count = 0
+        self.min_cents = None
+        self.max_cents = None
+        self.stale = False
+
+    def add(self, cents):
+        self.sum_cents += cents
+        self.count += 1
+        if not self.stale:
+            self.min_cents = cents if self.min_cents is None else min(self.min_cents, cents)
+            self.max_cents = cents if self.max_cents is None else max(self.max_cents, cents)
+
+    def remove(self, cents):
+        self.sum_cents -= cents
+        self.count -= 1
+        if cents == self.min_cents or cents == self.max_cents:
+            self.stale = True
+
+    def __eq__(self, other):
+        if (self.sum_cents, self.count) != (other.sum_cents, other.count):
+            return False
+        # A stale bucket's min/max are unknown until they are recomputed
+        return self.stale or other.stale or (self.min_cents, self.max_cents) == (other.min_cents, other.max_cents)
+
+
+class AggregateStore:
+    """
+    Sum, count and min/max of amounts keyed by (type, year, month, category).
+
+    Database_Tools applies every insert/update/delete to the store as a delta, so
+    totals and averages are answered from a few hundred buckets at most instead
+    of scanning the ledger.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    @staticmethod
+    def to_cents(amount):
+        return int(round(float(amount) * 100))
+
+    @staticmethod
+    def bucket_key(record_type, date, category):
+        return (str(record_type).lower(), int(date.year), int(date.month), str(category))
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Builds the store from scratch with one grouped pass over a typed ledger.
+
+        Args:
+            df (pd.DataFrame): Data with typed columns.
+
+        Returns:
+            AggregateStore: The populated store.
+        """
+        store = cls()
+        store.add_frame(df)
+        return store
+
+    def add_frame(self, df):
+        """
+        Applies a block of inserted rows with one grouped pass.
+
+        Args:
+            df (pd.DataFrame): Rows with typed columns.
+        """
+        if df.empty:
+            return
+        types = df['type'].astype('category').cat
+        categories = df['category'].astype('category').cat
+        type_labels = [str(c).lower() for c in types.categories]
+        category_labels = [str(c) for c in categories.categories]
+        type_codes = types.codes.to_numpy().astype('int64')
+        category_codes = categories.codes.to_numpy().astype('int64')
+        years = df['date'].dt.year.to_numpy().astype('int64')
+        months = df['date'].dt.month.to_numpy().astype('int64')
+        cents = (df['amount'] * 100).round().to_numpy(dtype='int64')
+
+        # Sort once by group and reduce each run instead of iterating a groupby
+        order = np.lexsort((category_codes, months, years, type_codes))
+        group = np.stack([type_codes, years, months, category_codes], axis=1)[order]
+        starts = np.concatenate(([0], np.flatnonzero((np.diff(group, axis=0) != 0).any(axis=1)) + 1))
+        cents = cents[order]
+        firsts = [(type_labels[t], y, m, category_labels[c]) for t, y, m, c in group[starts].tolist()]
+        counts = np.diff(np.append(starts, len(cents))).tolist()
+
+        for key, sum_cents, count, low, high in zip(
+            firsts, np.add.reduceat(cents, starts).tolist(), counts,
+            np.minimum.reduceat(cents, starts).tolist(), np.maximum.reduceat(cents, starts).tolist(),
+        ):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = Bucket()
+            bucket.sum_cents += sum_cents
+            bucket.count += count
+            if not bucket.stale:
+                bucket.min_cents = low if bucket.min_cents is None else min(bucket.min_cents, low)
+                bucket.max_cents = high if bucket.max_cents is None else max(bucket.max_cents, high)
+
+    @staticmethod
+    def group_totals(df):
+        """
+        Computes the sum and count of every (type, year, month, category) group of
+        a typed ledger with vectorized counting, without building any buckets.
+        Much cheaper than from_dataframe, so it is used to verify a store.
+
+        Args:
+            df (pd.DataFrame): Data with typed columns.
+
+        Returns:
+            dict: Maps each group's key to (sum_cents, count).
+        """
+        if df.empty:
+            return {}
+        types = df['type'].astype('category').cat
+        categories = df['category'].astype('category').cat
+        type_labels = [str(c).lower() for c in types.categories]
+        category_labels = [str(c) for c in categories.categories]
+        years = df['date'].dt.year.to_numpy().astype('int64')
+        first_year = int(years.min())
+        shape = (len(type_labels), int(years.max()) - first_year + 1, 12, len(category_labels))
+        groups = np.ravel_multi_index((
+            types.codes.to_numpy().astype('int64'),
+            years - first_year,
+            df['date'].dt.month.to_numpy().astype('int64') - 1,
+            categories.codes.to_numpy().astype('int64'),
+        ), shape)
+        cents = (df['amount'] * 100).round().to_numpy(dtype='int64')
+
+        keys, inverse = np.unique(groups, return_inverse=True)
+        # Float sums of integer cents are exact below 2**53
+        sums = np.bincount(inverse, weights=cents).round().astype('int64')
+        counts = np.bincount(inverse)
+        totals = {}
+        for t, y, m, c, total_cents, count in zip(*(part.tolist() for part in np.unravel_index(keys, shape)),
+                                                   sums.tolist(), counts.tolist()):
+            # Types differing only in case share a bucket
+            key = (type_labels[t], first_year + y, m + 1, category_labels[c])
+            previous_cents, previous_count = totals.get(key, (0, 0))
+            totals[key] = (previous_cents + total_cents, previous_count + count)
+        return totals
+
+    def totals(self):
+        """
+        Returns the sum and count of every bucket, in the form of group_totals().
+        """
+        return {key: (bucket.sum_cents, bucket.count) for key, bucket in self.buckets.items()}
+
+    def to_arrays(self):
+        """
+        Returns the store as numpy arrays for persisting, one entry per bucket.
+        Stale buckets are saved with min/max 0 and recomputed after loading.
+        """
+        keys = list(self.buckets)
+        buckets = list(self.buckets.values())
+        return {
+            'types': np.array([key[0] for key in keys], dtype=str),
+            'years': np.array([key[1] for key in keys], dtype='int64'),
+            'months': np.array([key[2] for key in keys], dtype='int64'),
+            'categories': np.array([key[3] for key in keys], dtype=str),
+            'sum_cents': np.array([bucket.sum_cents for bucket in buckets], dtype='int64'),
+            'counts': np.array([bucket.count for bucket in buckets], dtype='int64'),
+            'min_cents': np.array([0 if bucket.stale else bucket.min_cents for bucket in buckets], dtype='int64'),
+            'max_cents': np.array([0 if bucket.stale else bucket.max_cents for bucket in buckets], dtype='int64'),
+            'stale': np.array([bucket.stale for bucket in buckets], dtype=bool),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuilds a store saved with to_arrays().
+
+        Raises:
+            ValueError: If the arrays are inconsistent.
+        """
+        names = ('types', 'years', 'months', 'categories', 'sum_cents', 'counts', 'min_cents', 'max_cents', 'stale')
+        if len({len(arrays[name]) for name in names}) > 1:
+            raise ValueError("The saved aggregates are inconsistent.")
+        store = cls()
+        for record_type, year, month, category, sum_cents, count, min_cents, max_cents, stale in zip(
+            *(arrays[name].tolist() for name in names)
+        ):
+            bucket = store.buckets[(record_type, year, month, category)] = Bucket()
+            bucket.sum_cents = sum_cents
+            bucket.count = count
+            bucket.min_cents = min_cents
+            bucket.max_cents = max_cents
+            bucket.stale = stale
+        return store
+
+    def add(self, record_type, date, category, amount):
+        """
+        Applies an inserted row.
+
+        Args:
+            record_type (str): The type of the record.
+            date (pd.Timestamp): The date of the record.
+            category (str): The category of the record.
+            amount (float): The signed amount of the record.
+        """
+        key = self.bucket_key(record_type, date, category)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket()
+        bucket.add(self.to_cents(amount))
+
+    def remove(self, record_type, date, category, amount):
+        """
+        Applies a deleted row (or the old values of an updated row).
+        """
+        key = self.bucket_key(record_type, date, category)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        bucket.remove(self.to_cents(amount))
+        if bucket.count == 0:
+            del self.buckets[key]
+
+    def matching(self, record_type=None, year=None, month=None, category=None):
+        """
+        Yields the buckets that match the given filters; None matches everything.
+        """
+        record_type = record_type.lower() if record_type is not None else None
+        for (b_type, b_year, b_month, b_category), bucket in self.buckets.items():
+            if record_type is not None and b_type != record_type:
+                continue
+            if year is not None and b_year != year:
+                continue
+            if month is not None and b_month != month:
+                continue
+            if category is not None and b_category != category:
+                continue
+            yield bucket
+
+    def total(self, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the sum of amounts for the filters.
+        """
+        return sum(b.sum_cents for b in self.matching(record_type, year, month, category)) / 100
+
+    def count(self, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the number of records for the filters.
+        """
+        return sum(b.count for b in self.matching(record_type, year, month, category))
+
+    def average(self, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the average amount for the filters, or 0.0 when nothing matches.
+        """
+        total_cents = 0
+        count = 0
+        for bucket in self.matching(record_type, year, month, category):
+            total_cents += bucket.sum_cents
+            count += bucket.count
+        if count == 0:
+            return 0.0
+        return round(total_cents / count / 100, 2)
+
+    def summarize(self, group_by, record_type=None, year=None, month=None):
+        """
+        Groups the matching buckets by some of their key fields in one pass.
+
+        Args:
+            group_by (tuple): Names from ('type', 'year', 'month', 'category').
+
+        Returns:
+            list: See group().
+        """
+        record_type = record_type.lower() if record_type is not None else None
+        totals = (
+            (key, (bucket.sum_cents, bucket.count)) for key, bucket in self.buckets.items()
+            if (record_type is None or key[0] == record_type)
+            and (year is None or key[1] == year)
+            and (month is None or key[2] == month)
+        )
+        return self.group(totals, group_by)
+
+    @staticmethod
+    def group(totals, group_by):
+        """
+        Rolls per-bucket totals up to some of the key fields.
+
+        Args:
+            totals (iterable): (key, (sum_cents, count)) pairs, as from totals() or group_totals().
+            group_by (tuple): Names from ('type', 'year', 'month', 'category').
+
+        Returns:
+            list: One dict per group, ordered by the group's values, with the
+                group's values, 'total', 'count' and 'average'.
+        """
+        positions = [('type', 'year', 'month', 'category').index(name) for name in group_by]
+        groups = {}
+        for key, (sum_cents, count) in totals:
+            group = tuple(key[position] for position in positions)
+            sums = groups.get(group)
+            if sums is None:
+                sums = groups[group] = [0, 0]
+            sums[0] += sum_cents
+            sums[1] += count
+        return [
+            {**dict(zip(group_by, group)), 'total': total_cents / 100, 'count': count,
+             'average': round(total_cents / count / 100, 2)}
+            for group, (total_cents, count) in sorted(groups.items())
+            if count
+        ]
+
+    def extremes(self, df, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the (min_cents, max_cents) of every matching bucket, first
+        recomputing stale buckets from the rows of their group.
+
+        Args:
+            df (pd.DataFrame): The typed ledger the store describes.
+
+        Returns:
+            list: One (min_cents, max_cents) pair per matching bucket.
+        """
+        record_type = record_type.lower() if record_type is not None else None
+        pairs = []
+        for key, bucket in list(self.buckets.items()):
+            b_type, b_year, b_month, b_category = key
+            if (record_type is not None and b_type != record_type) or (year is not None and b_year != year) or \
+                    (month is not None and b_month != month) or (category is not None and b_category != category):
+                continue
+            if bucket.stale:
+                rows = df[(df['type'].astype(str).str.lower() == b_type) & (df['date'].dt.year == b_year)
+                          & (df['date'].dt.month == b_month) & (df['category'].astype(str) == b_category)]
+                cents = (rows['amount'] * 100).round().to_numpy(dtype='int64')
+                if not len(cents):
+                    continue
+                bucket.min_cents, bucket.max_cents, bucket.stale = int(cents.min()), int(cents.max()), False
+            pairs.append((bucket.min_cents, bucket.max_cents))
+        return pairs
+
+    def minimum(self, df, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the smallest amount for the filters, or None when nothing matches.
+
+        Args:
+            df (pd.DataFrame): The typed ledger the store describes (see extremes).
+        """
+        pairs = self.extremes(df, record_type, year, month, category)
+        return min(low for low, _ in pairs) / 100 if pairs else None
+
+    def maximum(self, df, record_type=None, year=None, month=None, category=None):
+        """
+        Returns the largest amount for the filters, or None when nothing matches.
+
+        Args:
+            df (pd.DataFrame): The typed ledger the store describes (see extremes).
+        """
+        pairs = self.extremes(df, record_type, year, month, category)
+        return max(high for _, high in pairs) / 100 if pairs else None
+
+    def __eq__(self, other):
+        return self.buckets == other.buckets
@@ -0,0 +1,147 @@
+import re
+
+# Rough characters-per-token ratio for English/CSV text; good enough to stay under a budget.
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 8000
+# Shortest plausible CSV line for a transaction, used to cap how many rows are formatted.
+MIN_ROW_CHARS = 30
+TOP_NOTES = 15
+STOPWORDS = {
+    "the", "and", "for", "with", "what", "which", "how", "much", "many", "did", "does", "was", "were",
+    "are", "is", "my", "me", "on", "in", "of", "to", "a", "an", "i", "at", "by", "from", "this", "that",
+    "spend", "spent", "spending", "money", "expense", "expenses", "income", "pay", "paid", "month",
+    "year", "total", "most", "more", "less", "than", "any", "all", "there", "have", "has", "about",
+}
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a piece of text.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The approximate token count.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def question_terms(question):
+    """
+    Extracts the keywords of a question that are worth matching against notes and categories.
+    """
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    return sorted({w for w in words if len(w) > 2 and w not in STOPWORDS})
+
+
+def build_analysis_context(database, question, record_type=None, month=None, year=None,
+                           start_date=None, end_date=None, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Builds the data section of the ai_analyze prompt.
+
+    If the filtered ledger fits in the token budget it is sent as CSV, as before.
+    Otherwise the context is made of precomputed aggregates (totals per month and
+    category, the most frequent and largest notes, counts) plus only the rows that
+    mention the question's keywords, cut off at the budget.
+
+    Args:
+        database (Database_Tools): The ledger.
+        question (str): The user's question.
+        record_type (str, optional): The type of the record ('expense' or 'pay').
+        month (int, optional): The month to analyze (1-12).
+        year (int, optional): The year to analyze.
+        start_date (str, optional): First date to analyze (YYYY-MM-DD).
+        end_date (str, optional): Last date to analyze (YYYY-MM-DD).
+        token_budget (int, optional): Approximate maximum size of the context in tokens.
+
+    Returns:
+        str or None: The context text, or None if no transactions match the filters.
+    """
+    rows = database.filter_data(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+    if rows.empty:
+        return None
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    # Formatting the whole ledger is only worth it when it can possibly fit.
+    if len(rows) * MIN_ROW_CHARS <= budget_chars:
+        full_csv = database.to_external(rows).to_csv(index=False)
+        if len(full_csv) <= budget_chars:
+            return f"Here is the transaction history in CSV format:\n{full_csv}"
+
+    sections = [summary_section(rows)]
+
+    periods = rows['date'].dt.to_period('M').astype(str)
+    monthly = rows.groupby([periods, rows['category'].astype(str)], observed=True)['amount'] \
+        .agg(['sum', 'count']).round(2)
+    monthly.index.names = ['month', 'category']
+    monthly_csv = monthly.to_csv()
+    if len(monthly_csv) > budget_chars * 0.4:
+        # Long histories: fall back to per-month totals by type and overall per-category totals
+        monthly = rows.groupby([periods, rows['type'].astype(str)], observed=True)['amount'] \
+            .agg(['sum', 'count']).round(2)
+        monthly.index.names = ['month', 'type']
+        by_category = rows.groupby(rows['category'].astype(str), observed=True)['amount'] \
+            .agg(['sum', 'count']).round(2)
+        by_category.index.name = 'category'
+        monthly_csv = monthly.to_csv() + "\nTotals per category:\n" + by_category.to_csv()
+    sections.append(f"Totals per month:\n{monthly_csv}")
+
+    notes = rows.groupby(rows['note'].astype(str))['amount'].agg(['sum', 'count']).round(2)
+    notes.index.name = 'note'
+    frequent = notes.sort_values('count', ascending=False).head(TOP_NOTES)
+    largest = notes.reindex(notes['sum'].abs().sort_values(ascending=False).index).head(TOP_NOTES)
+    sections.append(f"Most frequent notes:\n{frequent.to_csv()}")
+    sections.append(f"Largest notes by total amount:\n{largest.to_csv()}")
+
+    remaining = budget_chars - sum(len(s) for s in sections)
+    sample = relevant_rows(rows, question, max(remaining, 0) // MIN_ROW_CHARS)
+    if not sample.empty and remaining > 0:
+        lines = database.to_external(sample).to_csv(index=False).splitlines(keepends=True)
+        kept = []
+        used = 0
+        for line in lines:
+            if used + len(line) > remaining:
+                break
+            kept.append(line)
+            used += len(line)
+        if len(kept) > 1:
+            sections.append(
+                f"Transactions relevant to the question ({len(kept) - 1} of {len(rows)} rows):\n" + "".join(kept)
+            )
+
+    return "Here is a summary of the transaction history (the full history is too large to include):\n\n" + \
+        "\n".join(sections)
+
+
+def summary_section(rows):
+    """
+    Returns the overall counts, date range and totals per type.
+    """
+    by_type = rows.groupby(rows['type'].astype(str), observed=True)['amount'].agg(['sum', 'count', 'mean']).round(2)
+    by_type.index.name = 'type'
+    return (
+        f"Transactions: {len(rows)}, from {rows['date'].min():%Y-%m-%d} to {rows['date'].max():%Y-%m-%d}\n"
+        f"Totals per type:\n{by_type.to_csv()}"
+    )
+
+
+def relevant_rows(rows, question, limit):
+    """
+    Picks up to `limit` rows for the question: rows whose note or category mentions
+    one of its keywords (most recent first), otherwise the largest transactions.
+    """
+    if limit <= 0:
+        return rows.iloc[0:0]
+    terms = question_terms(question)
+    if terms:
+        pattern = re.compile("|".join(re.escape(term) for term in terms))
+        # Notes repeat a lot, so match each distinct note once instead of every row
+        notes = rows['note'].dropna().unique()
+        matched_notes = [note for note in notes if pattern.search(str(note).lower())]
+        mask = rows['note'].isin(matched_notes) | rows['category'].astype(str).str.lower().isin(terms)
+        matches = rows[mask]
+        if not matches.empty:
+            return matches.sort_values('date', ascending=False).head(limit)
+    order = rows['amount'].abs().sort_values(ascending=False).index[:limit]
+    return rows.loc[order]
@@ -1,30 +1,238 @@
+import functools
 import os
+import sys
+import threading
+import numpy as np
 import pandas as pd
-
-class Database_Tools:
+from src.aggregates import AggregateStore
+from src.date_index import DateIndex, decode_cursor, encode_cursor
+from src.journal import Journal
+from src.metrics import BYTES_WRITTEN, SAVE_LATENCY
+from src.note_index import NoteIndex
+from src.tracing import fields, logger, span
+from src.process_sync import LedgerLock, VersionFile
+from src.snapshot import BinarySnapshot
+from src.sqlite_tools import SQLite_Tools
+from src.storage import CATEGORICAL_COLUMNS, COLUMNS, DATE_FORMAT, DURABILITY, FLUSH_BATCH, FLUSH_INTERVAL_MS, StorageEngine, serialized
+
+DEFAULT_CSV_PATH = "data\\database.csv"
+# Per-tenant ledgers live here, one storage file per tenant.
+TENANT_DIRECTORY = os.environ.get("BOOKKEEPING_TENANT_DIRECTORY", "data\\tenants")
+
+# Once the journal grows past this many bytes it is folded back into the CSV snapshot.
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+# Keep a memory-mappable binary copy of the CSV next to it for fast cold starts.
+BINARY_SNAPSHOT = os.environ.get("BOOKKEEPING_BINARY_SNAPSHOT", "1") != "0"
+# Coordinate with other processes (e.g. uvicorn workers) that serve the same CSV ledger.
+PROCESS_SYNC = os.environ.get("BOOKKEEPING_PROCESS_SYNC", "1") != "0"
+
+
+
+def refreshed(method):
+    """
+    Brings the in-memory ledger up to date with mutations committed by other
+    processes before running a read method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.refresh()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+
+class Database_Tools(StorageEngine):
+    """
+    The pandas storage engine: the ledger lives in memory as a typed DataFrame,
+    persisted as a CSV snapshot plus an append-only journal.
+
+    Several processes can serve the same ledger. Each keeps its own in-memory
+    copy. Mutations are serialized by a lock file, and every journal event
+    carries a sequence number that is also published in a version file. A
+    process whose version is behind replays just the journal tail it has not
+    seen yet.
+
+    In 'group' durability the journal fsyncs the appends of concurrent writers
+    together. A writer waits for its batch after releasing the write lock, so
+    the next writer can append in the meantime.
+    """
 
     data: pd.DataFrame
-    current_total: float
 
-    def __init__(self):
-        file_path = "data\\database.csv"
-        self.data = self.load_database_to_dataframe(file_path)
-        self.current_total = self.calculate_total_amount()
+    def __init__(self, file_path=DEFAULT_CSV_PATH, compact_threshold=JOURNAL_COMPACT_BYTES, binary_snapshot=None, process_sync=None, durability=None):
+        self.file_path = file_path
+        self.compact_threshold = compact_threshold
+        self.binary_snapshot = BINARY_SNAPSHOT if binary_snapshot is None else binary_snapshot
+        self.journal = Journal(
+            Journal.path_for(file_path),
+            durability=durability or DURABILITY,
+            flush_interval=FLUSH_INTERVAL_MS / 1000,
+            flush_batch=FLUSH_BATCH,
+        )
+        # Number of journal appends the calling thread's last commit must wait for (group durability)
+        self._pending_sync = threading.local()
+        on_release = self.wait_until_durable if self.journal.durability == "group" else None
+        # Serializes mutations; reentrant so callers can group a read-modify-write under it.
+        # With process sync the lock spans every process serving this ledger.
+        if PROCESS_SYNC if process_sync is None else process_sync:
+            self.version_file = VersionFile(VersionFile.path_for(file_path))
+            self.write_lock = LedgerLock(LedgerLock.path_for(file_path), on_acquire=self.catch_up, on_release=on_release)
+            self._compaction_lock = LedgerLock(LedgerLock.path_for(file_path, "compaction.lock"))
+        else:
+            self.version_file = None
+            self.write_lock = LedgerLock(None, on_release=on_release)
+            self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        # Sequence number of the newest journal event applied, and the compaction generation it belongs to
+        self.version = 0
+        self.generation = 0
+        self.journal_position = 0
+        self.next_id = 1
+        self.data = None
+        with self.write_lock:
+            self.reload()
+
+
+
+    @property
+    def current_total(self):
+        return self.calculate_total_amount()
+
+
+
+    def reload(self):
+        """
+        Rebuilds the in-memory ledger, its aggregates and its date index from
+        the files on disk. Callers must hold the write lock.
+        """
+        # Loading also sets up the aggregate store
+        self.data = self.load_database_to_dataframe(self.file_path)
+        # Ids are never reused within a process, even after the newest record is deleted.
+        newest_id = int(self.data['id'].max()) if not self.data.empty else 0
+        self.next_id = max(self.next_id, newest_id + 1)
+        self.date_index = DateIndex.from_dataframe(self.data)
+        # Built on the first search, so ledgers that are never searched do not pay for it
+        self.note_index = None
+        self.publish_version()
+
+
+
+    def refresh(self):
+        """
+        Catches up with mutations other processes have committed. When nothing
+        has changed this costs one read of the small version file.
+        """
+        if self.version_file is None or self.write_lock.held:
+            return
+        if self.version_file.read() != (self.generation, self.version):
+            # Acquiring the lock runs catch_up
+            with self.write_lock:
+                pass
+
+
+
+    def catch_up(self):
+        """
+        Applies the journal events other processes have appended since this
+        copy last read the journal. Runs whenever the write lock is acquired,
+        so every mutation starts from the latest state. If events are missing
+        (another process compacted them into the CSV), it reloads instead.
+        """
+        if self.data is None:
+            return
+        generation, version = self.version_file.read()
+        if generation == self.generation:
+            events, self.journal_position = self.journal.read_file(self.journal.file_path, self.journal_position)
+        else:
+            # Another process compacted; the events it moved aside stay in the rotated journal until it is discarded
+            self.journal.close()
+            events = self.journal.read_file(self.journal.rotated_path)[0]
+            live_events, self.journal_position = self.journal.read_file(self.journal.file_path)
+            events += live_events
+            self.generation = generation
+
+        events = [event for event in events if event.get("seq", 0) > self.version]
+        first = events[0]["seq"] if events else self.version + 1
+        last = events[-1]["seq"] if events else self.version
+        if first != self.version + 1 or last < version:
+            self.reload()
+            return
+        self.apply_events(events)
+        self.publish_version()
+
+
+
+    def publish_version(self):
+        """
+        Makes the version file show this copy's version if it is ahead, e.g.
+        after replaying an event whose process crashed before publishing it.
+        Callers must hold the write lock.
+        """
+        if self.version_file is not None and self.version_file.read() != (self.generation, self.version):
+            self.version_file.write(self.generation, self.version)
+
+
+
+    def apply_events(self, events):
+        """
+        Applies journal events committed by another process to the in-memory
+        ledger, keeping the aggregates and the date index in step. The events
+        are folded into their net effect first, so a burst of mutations costs
+        one bulk delete and one append.
+
+        Args:
+            events (list): Journal events, oldest first.
+        """
+        inserts, updates, deletes = self.coalesce_events(events, self.data.index)
+
+        if deletes:
+            old = self.data.loc[sorted(deletes)]
+            for row in old.itertuples(index=False):
+                self.aggregates.remove(row.type, row.date, row.category, row.amount)
+            self.data = self.data.drop(index=old.index)
+            self.date_index.remove_many(old['date'], old['id'])
+            if self.note_index is not None:
+                self.note_index.remove(old['note'], old['id'])
+
+        for record_id, values in updates.items():
+            changes = {column: value for column, value in values.items() if column != 'id'}
+            if 'amount' in changes:
+                changes['amount'] = round(float(changes['amount']), 2)
+            if 'date' in changes:
+                changes['date'] = pd.Timestamp(changes['date'])
+            self.apply_update(record_id, changes)
+
+        if inserts:
+            rows = pd.DataFrame(list(inserts.values()), columns=self.data.columns)
+            rows['amount'] = rows['amount'].astype('float64').round(2)
+            rows['date'] = pd.to_datetime(rows['date'], format=DATE_FORMAT)
+            new_rows = self.append_rows(rows)
+            self.aggregates.add_frame(new_rows)
+            self.date_index.add(new_rows['date'], new_rows['id'])
+            if self.note_index is not None:
+                self.note_index.add(new_rows['note'], new_rows['id'])
+            self.next_id = max(self.next_id, int(new_rows['id'].max()) + 1)
+
+        self.version = max([self.version] + [event.get("seq", 0) for event in events])
 
 
 
     def __str__(self):
         if self.data.empty:
             return "The database is empty."
-        df_copy = self.data.copy()
-        df_copy['amount'] = df_copy['amount'].astype(float).map("{:.2f}".format)
+        df_copy = self.to_external(self.data)
+        df_copy['amount'] = df_copy['amount'].map("{:.2f}".format)
         return df_copy.to_string(index=False)
 
 
 
     def load_database_to_dataframe(self, file_path):
         """
-        Loads data from a CSV file into a Pandas DataFrame.
+        Loads data from a CSV file (or its binary snapshot, when it is up to date)
+        into a Pandas DataFrame and replays any journaled mutations that have not
+        been compacted into it yet. Records the version and journal offset
+        reached, so later catch-ups only read what is appended after it, and
+        sets up the aggregate store (see restore_aggregates).
 
         Args:
             file_path (str): The path to the CSV file.
@@ -35,30 +243,472 @@ class Database_Tools:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file at {file_path} does not exist.")
 
+        # Prefer the binary snapshot of this exact CSV version; it needs no parsing
+        snapshot = BinarySnapshot(BinarySnapshot.path_for(file_path)) if self.binary_snapshot else None
+        stamp = BinarySnapshot.source_stamp(file_path)
+        df = snapshot.load(stamp) if snapshot is not None else None
+        from_snapshot = df is not None
+
+        if df is None:
+            try:
+                df = pd.read_csv(file_path)
+                if 'id' not in df.columns:
+                    raise KeyError("The CSV file must contain an 'id' column.")
+            except Exception as e:
+                raise ValueError(f"Error loading CSV file: {e}")
+
+        # Read under the write lock, so a compaction cannot discard the rotated journal in between
+        events = self.journal.read_file(self.journal.rotated_path)[0]
+        live_events, self.journal_position = self.journal.read_file(self.journal.file_path)
+        events += live_events
+        self.generation, version = self.version_file.read() if self.version_file is not None else (0, 0)
+        self.version = max([version] + [event.get("seq", 0) for event in events])
+        rollups = snapshot.load_aggregates() if from_snapshot else None
+        touched = self.journal_ids(events)
+        # The snapshot's versions of the rows the journal rewrites; replay modifies df in place
+        replaced = df[df['id'].isin(touched)].copy() if rollups is not None else None
+        if events:
+            df = self.replay_journal(df, events)
+        df = self.to_typed(df)
+        self.aggregates = self.restore_aggregates(df, rollups, replaced, touched)
+
+        if snapshot is not None and not from_snapshot:
+            # Journal replay is idempotent, so the snapshot may already include these events
+            snapshot.save(df, stamp, self.aggregates)
+        return df
+
+
+
+    def journal_ids(self, events):
+        """
+        Returns the ids of the records the journal events insert, update or delete.
+        """
+        ids = set()
+        for event in events:
+            if event.get("op") == "insert":
+                if "columns" in event:
+                    ids.update(event["columns"]["id"])
+                else:
+                    ids.update(record["id"] for record in event["records"])
+            elif "id" in event:
+                ids.add(event["id"])
+        return ids
+
+
+
+    def restore_aggregates(self, df, rollups=None, replaced=None, touched=()):
+        """
+        Sets up the aggregate store for a freshly loaded ledger. Rollups saved
+        with the binary snapshot are brought up to date by swapping the rows
+        the journal rewrote for their new versions, then verified against the
+        loaded rows with a vectorized sum and count per group, which costs a
+        fraction of regrouping every row. Without usable rollups the store is
+        rebuilt from the rows.
+
+        Args:
+            df (pd.DataFrame): The loaded ledger with typed columns.
+            rollups (AggregateStore, optional): The rollups saved with the snapshot the ledger was loaded from.
+            replaced (pd.DataFrame, optional): The snapshot's versions of the rows the journal rewrote.
+            touched (set, optional): Ids of the records the journal inserted, updated or deleted.
+
+        Returns:
+            AggregateStore: The store of df.
+        """
+        if rollups is not None:
+            if replaced is not None and not replaced.empty:
+                for row in self.to_typed(replaced).itertuples(index=False):
+                    rollups.remove(row.type, row.date, row.category, row.amount)
+            if touched:
+                rollups.add_frame(df.loc[df.index.intersection(pd.Index(list(touched), dtype='int64'))])
+            if rollups.totals() == AggregateStore.group_totals(df):
+                return rollups
+            logger.warning("Saved rollups do not match the ledger, rebuilding them", extra=fields(file=self.file_path))
+        return AggregateStore.from_dataframe(df)
+
+
+
+    def to_typed(self, df):
+        """
+        Parses the string columns read from CSV/JSON into the in-memory column types:
+        float64 amounts, datetime64 dates and categorical type/category. The frame
+        is indexed by record id, so point lookups go through the index hash table
+        instead of scanning the 'id' column.
+
+        Args:
+            df (pd.DataFrame): Data in the on-disk representation.
+
+        Returns:
+            pd.DataFrame: The same rows with typed columns.
+        """
+        df['id'] = df['id'].astype('int64')
+        df.index = pd.Index(df['id'].to_numpy())
+        if not df.index.is_unique:
+            raise ValueError("The 'id' column must not contain duplicates.")
+        df['amount'] = pd.to_numeric(df['amount']).astype('float64').round(2)
         try:
-            df = pd.read_csv(file_path)
-            if 'id' not in df.columns:
-                raise KeyError("The CSV file must contain an 'id' column.")
-            return df
-        except Exception as e:
-            raise ValueError(f"Error loading CSV file: {e}")
+            df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+        except (ValueError, TypeError):
+            df['date'] = pd.to_datetime(df['date'], format='mixed')
+        for column in CATEGORICAL_COLUMNS:
+            # Re-casting a categorical column returns a read-only view, which breaks in-place updates
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype('category')
+        return df
 
 
 
-    def save_database(self, file_path="data\\database.csv"):
+    def type_mask(self, df, record_type):
         """
-        Saves the current DataFrame to a CSV file.
+        Builds a case-insensitive mask for a record type by comparing against the
+        handful of categories instead of lower-casing every row.
 
         Args:
-            file_path (str): The path to the CSV file where data will be saved.
+            df (pd.DataFrame): Data with a categorical 'type' column.
+            record_type (str): The type of the record ('expense' or 'pay').
+
+        Returns:
+            pd.Series: A boolean mask aligned with df.
+        """
+        matches = [c for c in df['type'].cat.categories if str(c).lower() == record_type.lower()]
+        return df['type'].isin(matches)
+
+
+
+    def append_rows(self, rows):
+        """
+        Appends new rows, keeping the typed columns (categoricals stay categorical
+        by sharing a common set of categories).
+
+        Args:
+            rows (list or pd.DataFrame): Records with 'id', 'type', 'amount', 'note',
+                'category' and a 'date' already parsed to a Timestamp.
+
+        Returns:
+            pd.DataFrame: The appended rows as stored.
+        """
+        new_rows = pd.DataFrame(rows, columns=self.data.columns)
+        new_rows['id'] = new_rows['id'].astype('int64')
+        new_rows.index = pd.Index(new_rows['id'].to_numpy())
+        new_rows['amount'] = new_rows['amount'].astype('float64')
+        new_rows['date'] = pd.to_datetime(new_rows['date'])
+        for column in CATEGORICAL_COLUMNS:
+            self.add_categories(column, new_rows[column].unique())
+            new_rows[column] = pd.Categorical(new_rows[column], categories=self.data[column].cat.categories)
+        self.data = pd.concat([self.data, new_rows])
+        return new_rows
+
+
+
+    def add_categories(self, column, values):
+        """
+        Registers values that are not yet categories of a categorical column.
+
+        Args:
+            column (str): 'type' or 'category'.
+            values (iterable): Values about to be written to the column.
+        """
+        known = set(self.data[column].cat.categories)
+        missing = [v for v in dict.fromkeys(values) if v not in known and not pd.isna(v)]
+        if missing:
+            self.data[column] = self.data[column].cat.add_categories(missing)
+
+
+
+    @refreshed
+    def has_record(self, record_id):
+        """
+        Checks whether a record exists using the id index.
+
+        Args:
+            record_id (int): The unique identifier for the record.
+
+        Returns:
+            bool: True if the record exists.
+        """
+        return int(record_id) in self.data.index
+
+
+
+    @refreshed
+    def get_record(self, record_id):
+        """
+        Returns a single record by id using the id index.
+
+        Args:
+            record_id (int): The unique identifier for the record.
+
+        Returns:
+            pd.Series: The record's fields.
+
+        Raises:
+            KeyError: If the record_id does not exist in the DataFrame.
+        """
+        if not self.has_record(record_id):
+            raise KeyError(f"Record with id '{record_id}' does not exist.")
+        return self.data.loc[int(record_id)]
+
+
+
+    def verify_aggregates(self):
+        """
+        Rebuilds the aggregate store, the date index and (once built) the note
+        index from the raw rows and compares them with the incrementally
+        maintained ones. Intended for tests and debugging.
+
+        Returns:
+            bool: True if the incremental structures match a full recompute.
+        """
+        return self.aggregates == AggregateStore.from_dataframe(self.data) and \
+            self.date_index == DateIndex.from_dataframe(self.data) and \
+            (self.note_index is None or self.note_index == NoteIndex.from_dataframe(self.data))
+
+
+
+    def coalesce_events(self, events, existing):
+        """
+        Folds journal events into their net effect on a set of existing records.
+
+        Args:
+            events (list): Journal events, oldest first.
+            existing (set or pd.Index): Ids of the records the events are applied to.
+
+        Returns:
+            tuple: (inserts, updates, deletes), the new records by id, the changed
+                fields of existing records by id and the ids of existing records to delete.
+        """
+        inserts = {}
+        updates = {}
+        deletes = set()
+
+        for event in events:
+            op = event.get("op")
+            if op == "insert":
+                if "columns" in event:
+                    # Batch inserts are journaled column-wise to keep the event cheap to encode
+                    columns = event["columns"]
+                    event_records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+                else:
+                    event_records = event["records"]
+                for record in event_records:
+                    record_id = record["id"]
+                    if record_id in existing and record_id not in deletes:
+                        updates.setdefault(record_id, {}).update(record)
+                    else:
+                        deletes.discard(record_id)
+                        inserts[record_id] = dict(record)
+            elif op == "update":
+                record_id = event["id"]
+                if record_id in inserts:
+                    inserts[record_id].update(event["fields"])
+                elif record_id in existing and record_id not in deletes:
+                    updates.setdefault(record_id, {}).update(event["fields"])
+            elif op == "delete":
+                record_id = event["id"]
+                if record_id in inserts:
+                    del inserts[record_id]
+                elif record_id in existing:
+                    deletes.add(record_id)
+                    updates.pop(record_id, None)
+        return inserts, updates, deletes
+
+
+
+    def replay_journal(self, df, events):
+        """
+        Applies journal events to a DataFrame loaded from the CSV snapshot.
+
+        Events carry full field values rather than deltas, so replaying an event
+        that is already part of the snapshot (e.g. after a compaction was
+        interrupted) leaves the row unchanged.
+
+        Args:
+            df (pd.DataFrame): The snapshot data.
+            events (list): Journal events, oldest first.
+
+        Returns:
+            pd.DataFrame: The snapshot with the events applied.
+        """
+        inserts, updates, deletes = self.coalesce_events(events, set(df['id'].tolist()))
+
+        # A binary snapshot is already typed; keep its columns typed while applying the events
+        typed_dates = pd.api.types.is_datetime64_any_dtype(df['date'])
+        categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+        if updates:
+            df.index = pd.Index(df['id'].to_numpy())
+        for record_id, values in updates.items():
+            for column, value in values.items():
+                if column == 'amount':
+                    value = float(value)
+                elif column == 'date' and typed_dates:
+                    value = pd.Timestamp(value)
+                elif column in categorical and value not in df[column].cat.categories:
+                    df[column] = df[column].cat.add_categories([value])
+                if column != 'id':
+                    df.at[record_id, column] = value
+        if deletes:
+            df = df[~df['id'].isin(deletes)]
+        if inserts:
+            new_rows = pd.DataFrame(list(inserts.values()), columns=df.columns)
+            new_rows['amount'] = new_rows['amount'].astype(float)
+            if typed_dates:
+                new_rows['date'] = pd.to_datetime(new_rows['date'], format=DATE_FORMAT)
+            for column in categorical:
+                categories = df[column].cat.categories.union(pd.Index(new_rows[column].dropna().unique()))
+                df[column] = df[column].cat.set_categories(categories)
+                new_rows[column] = pd.Categorical(new_rows[column], categories=categories)
+            df = pd.concat([df, new_rows], ignore_index=True)
+        return df
+
+
+
+    def save_database(self, file_path=None):
+        """
+        Saves the current DataFrame to a CSV file. Saving to the database's own
+        file folds the journal into the snapshot.
+
+        Args:
+            file_path (str, optional): The path to the CSV file where data will be saved.
         """
         if self.data.empty:
             raise ValueError("No data to save.")
 
-        self.data.to_csv(file_path, index=False)
+        with span("persist.save"), SAVE_LATENCY.time(engine="csv"):
+            if file_path is None or file_path == self.file_path:
+                # With an empty journal the CSV already holds every mutation
+                if self.journal.size() or os.path.exists(self.journal.rotated_path):
+                    self.compact()
+            else:
+                self.write_snapshot(self.data, file_path)
+
+
+
+    def write_snapshot(self, df, file_path):
+        """
+        Atomically writes a DataFrame to a CSV file via a temporary file and rename.
+
+        Args:
+            df (pd.DataFrame): The data to write.
+            file_path (str): The destination CSV path.
+        """
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            self.to_external(df).to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        BYTES_WRITTEN.inc(os.path.getsize(tmp_path), engine="csv", target="snapshot")
+        os.replace(tmp_path, file_path)
+
+
+
+    def compact(self):
+        """
+        Folds the journal into a fresh CSV snapshot. New mutations keep
+        journaling while the snapshot is written. Compactions are serialized
+        across processes, and the new generation tells the other processes
+        that the journal has moved.
+        """
+        with self._compaction_lock:
+            with self.write_lock:
+                snapshot = self.data.copy()
+                self.journal.rotate()
+                self.generation += 1
+                self.journal_position = 0
+                self.publish_version()
+            self.write_snapshot(snapshot, self.file_path)
+            # Grouped from the copy rather than copied from the live store, so writers are not held up
+            rollups = AggregateStore.from_dataframe(snapshot) if self.binary_snapshot else None
+            # Other processes load the ledger under the write lock; they must see a complete snapshot and journal
+            with self.write_lock:
+                if self.binary_snapshot:
+                    BinarySnapshot(BinarySnapshot.path_for(self.file_path)).save(
+                        snapshot, BinarySnapshot.source_stamp(self.file_path), rollups
+                    )
+                self.journal.discard_rotated()
+
+
+
+    def close(self):
+        """
+        Flushes and closes the journal, then closes the lock files.
+        """
+        self.journal.close()
+        self.write_lock.close()
+        if self.version_file is not None:
+            self._compaction_lock.close()
+
+
+
+    @refreshed
+    def row_count(self):
+        return len(self.data)
+
+
+
+    def memory_usage(self):
+        """
+        Estimates the memory held by the ledger: the frame's columns and index,
+        the note strings (sampled), the date and note indexes and the buckets
+        of the aggregate store.
+
+        Returns:
+            int: Approximate bytes.
+        """
+        frame = self.data
+        size = int(frame.memory_usage(index=True).sum()) + self.date_index.nbytes
+        note_index = self.note_index
+        if note_index is not None:
+            size += sum(ids.nbytes for ids in list(note_index.postings.values()))
+        if len(frame):
+            sample = frame['note'].iloc[::max(1, len(frame) // 1000)]
+            size += int(np.mean([sys.getsizeof(note) for note in sample]) * len(frame))
+        # A bucket with its key tuple and dict entry takes roughly 300-400 bytes
+        size += len(self.aggregates.buckets) * 400
+        return size
+
+
+
+    def commit(self, event):
+        """
+        Records a mutation in the journal under the next sequence number,
+        publishes the new version and schedules a background compaction once
+        the journal passes the size threshold. In 'sync' durability the event
+        is on disk when this returns; in 'group' durability once the write
+        lock is released.
 
+        Args:
+            event (dict): The mutation event.
+        """
+        with self.write_lock, span("persist.journal", op=event["op"]):
+            self.version += 1
+            event["seq"] = self.version
+            # The write lock caught up with the journal, so this process has read everything before the event
+            self.journal_position = self.journal.append(event)
+            self._pending_sync.ticket = self.journal.appended
+            self.publish_version()
+        if self.journal.size() >= self.compact_threshold:
+            running = self._compaction_thread is not None and self._compaction_thread.is_alive()
+            if not running:
+                self._compaction_thread = threading.Thread(target=self.compact, daemon=True)
+                self._compaction_thread.start()
+
+
+
+    def wait_until_durable(self):
+        """
+        Blocks until the calling thread's last committed mutation is on disk.
+        Runs when the write lock is released in 'group' durability, so
+        concurrent writers share one fsync.
+        """
+        ticket = getattr(self._pending_sync, "ticket", 0)
+        if ticket:
+            self._pending_sync.ticket = 0
+            with span("persist.group_commit"):
+                self.journal.wait_synced(ticket)
 
 
+
+    @serialized
     def insert_data(self, record_type, amount, note:str, category:str, date:str):
         """
         Adds a new record to the DataFrame.
@@ -73,38 +723,41 @@ class Database_Tools:
         Raises:
             ValueError: If the amount is not a valid number.
         """
-        try:
-            amount = float(amount)
-        except ValueError:
-            raise ValueError("The amount must be a valid number.")
-        
         # If type is expense, convert to negative
-        if record_type.lower() == 'expense':
-            amount = -abs(amount)
+        amount = self.parse_amount(amount, record_type)
+        timestamp = self.parse_date(date)
 
-        new_id = self.data['id'].max() + 1 if not self.data.empty else 1
+        new_id = self.next_id
+        self.next_id += 1
 
-        # Convert date to datetime format
-        try:
-            date = pd.to_datetime(date).strftime('%Y-%m-%d')
-        except Exception:
-            raise ValueError("The date must be in a valid format (e.g., YYYY-MM-DD).")
+        date = timestamp.strftime(DATE_FORMAT)
+        amount = round(amount, 2)
 
-        new_record = pd.DataFrame([{
-            'id': new_id,
+        self.append_rows([{
+            'id': int(new_id),
+            'type': record_type,
+            'amount': amount,
+            'note': note,
+            'category': category,
+            'date': timestamp
+        }])
+        self.aggregates.add(record_type, timestamp, category, amount)
+        self.date_index.add([timestamp], [new_id])
+        if self.note_index is not None:
+            self.note_index.add([note], [new_id])
+        self.commit({"op": "insert", "records": [{
+            'id': int(new_id),
             'type': record_type,
             'amount': f"{amount:.2f}",
             'note': note,
             'category': category,
             'date': date
-        }])
-        self.data = pd.concat([self.data, new_record], ignore_index=True)
-        self.current_total = self.calculate_total_amount()
-        self.save_database()
+        }]})
         return f"Record added successfully. ID: {new_id}, Type: {record_type}, Amount: {amount:.2f}, Note: {note}, Category: {category}, Date: {date}"
 
 
 
+    @serialized
     def update_data(self, record_id:int=None, record_type:str=None, amount:float=None, note:str=None, category:str=None, date:str=None):
         """
         Updates an existing record in the DataFrame.
@@ -126,35 +779,45 @@ class Database_Tools:
                 raise ValueError("No data to update.")
             record_id = self.data['id'].max()
 
-        if record_id not in self.data['id'].values:
+        record_id = int(record_id)
+        if not self.has_record(record_id):
             raise KeyError(f"Record with id '{record_id}' does not exist.")
 
+        # Validate everything before touching the row so a bad value leaves it unchanged
+        if amount is not None:
+            amount = self.parse_amount(amount, record_type)
+
+        timestamp = None
+        if date is not None:
+            timestamp = self.parse_date(date)
+
+        changes = {}
+        journal_fields = {}
+
         if record_type is not None:
-            self.data.loc[self.data['id'] == record_id, 'type'] = record_type
+            changes['type'] = journal_fields['type'] = record_type
 
         if amount is not None:
-            try:
-                if record_type and record_type.lower() == 'expense':
-                    amount = -abs(float(amount))
-                self.data.loc[self.data['id'] == record_id, 'amount'] = f"{float(amount):.2f}"
-            except ValueError:
-                raise ValueError("The amount must be a valid number.")
+            changes['amount'] = round(amount, 2)
+            journal_fields['amount'] = f"{amount:.2f}"
             
         if note is not None:
-            self.data.loc[self.data['id'] == record_id, 'note'] = note
+            changes['note'] = journal_fields['note'] = note
             
         if category is not None:
-            self.data.loc[self.data['id'] == record_id, 'category'] = category
+            changes['category'] = journal_fields['category'] = category
 
-        if date is not None:
-            self.data.loc[self.data['id'] == record_id, 'date'] = date
+        if timestamp is not None:
+            changes['date'] = timestamp
+            journal_fields['date'] = timestamp.strftime(DATE_FORMAT)
 
-        self.current_total = self.calculate_total_amount()
-        self.save_database()
+        self.apply_update(record_id, changes)
+        self.commit({"op": "update", "id": int(record_id), "fields": journal_fields})
         return f"Record with ID {str(record_id)} updated successfully with Type: {str(record_type)}, Amount: {str(amount)}, Note: {str(note)}, Category: {str(category)}, Date: {str(date)}"
 
 
 
+    @serialized
     def delete_data(self, record_id:int = None):
         """
         Deletes a record from the DataFrame. If no record_id is provided, it deletes the last record.
@@ -170,18 +833,68 @@ class Database_Tools:
                 raise ValueError("No data to delete.")
             record_id = self.data['id'].max()
 
-        if record_id not in self.data['id'].values:
+        record_id = int(record_id)
+        if not self.has_record(record_id):
             raise KeyError(f"Record with id '{record_id}' does not exist.")
 
-        self.data = self.data[self.data['id'] != record_id]
-        self.current_total = self.calculate_total_amount()
-        self.save_database()
+        self.apply_delete(record_id)
+        self.commit({"op": "delete", "id": int(record_id)})
 
 
 
+    def apply_update(self, record_id, changes):
+        """
+        Writes new field values to a record, keeping the aggregates and the
+        date index in step.
+
+        Args:
+            record_id (int): The record to update.
+            changes (dict): Parsed values by column: str type/note/category,
+                float amount and Timestamp date.
+        """
+        old = self.data.loc[record_id]
+        self.aggregates.remove(old['type'], old['date'], old['category'], old['amount'])
+        old_date = old['date']
+        old_note = old['note']
+
+        for column, value in changes.items():
+            if column in CATEGORICAL_COLUMNS:
+                self.add_categories(column, [value])
+            self.data.at[record_id, column] = value
+
+        if 'date' in changes:
+            self.date_index.remove(old_date, record_id)
+            self.date_index.add([changes['date']], [record_id])
+
+        if 'note' in changes and self.note_index is not None:
+            self.note_index.remove([old_note], [record_id])
+            self.note_index.add([changes['note']], [record_id])
+
+        new = self.data.loc[record_id]
+        self.aggregates.add(new['type'], new['date'], new['category'], new['amount'])
+
+
+
+    def apply_delete(self, record_id):
+        """
+        Removes a record, keeping the aggregates and the date index in step.
+
+        Args:
+            record_id (int): The record to delete.
+        """
+        old = self.data.loc[record_id]
+        self.aggregates.remove(old['type'], old['date'], old['category'], old['amount'])
+        self.data = self.data.drop(index=record_id)
+        self.date_index.remove(old['date'], record_id)
+        if self.note_index is not None:
+            self.note_index.remove([old['note']], [record_id])
+
+
+
+    @refreshed
     def calculate_total_amount(self, record_type=None):
         """
-        Calculates the total amount from the DataFrame. If a record type is specified,
+        Calculates the total amount from the aggregate store. If a record type is specified,
         calculates the total for that type only.
 
         Args:
@@ -190,225 +903,480 @@ class Database_Tools:
         Returns:
             float: The total amount calculated from the data.
         """
-        if record_type is None:
-            return self.data['amount'].astype(float).sum()
-        return self.data[self.data['type'].str.lower() == record_type.lower()]['amount'].astype(float).sum()
+        return self.aggregates.total(record_type=record_type)
 
 
 
-    def calculate_monthly_total(self, record_type:str=None, month:int=None, year:int=None):
+    @refreshed
+    def calculate_monthly_total(self, record_type:str=None, month:int=None, year:int=None, start_date=None, end_date=None):
         """
         Calculates the total amount of a specific record type for a given month and year.
         If an argument is missing, it considers all options under that category.
+        Whole months come from the aggregate store; a date range sums the rows the
+        date index finds for it.
 
         Args:
             record_type (str, optional): The type of the record ('expense' or 'payment').
             month (int, optional): The month for which to calculate the total (1-12).
             year (int, optional): The year for which to calculate the total.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
 
         Returns:
             float: The total amount for the specified filters.
         """
-        filtered_data = self.data
+        if start_date is None and end_date is None:
+            return self.aggregates.total(record_type=record_type, year=year, month=month)
+        return int(self.range_cents(record_type, month, year, start_date, end_date).sum()) / 100
 
-        if record_type is not None:
-            filtered_data = filtered_data[filtered_data['type'].str.lower() == record_type.lower()]
-        if month is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.month == month]
-        if year is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.year == year]
 
-        return filtered_data['amount'].astype(float).sum()
 
+    @refreshed
+    def summarize(self, group_by=(), record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Calculates the total, count and average amount of every group of records,
+        e.g. spending per category and month. The aggregate store already keeps
+        these per (type, year, month, category), so this is a single pass over
+        its buckets instead of one query per group. A date range groups the rows
+        the date index finds for it with one vectorized pass.
 
+        Args:
+            group_by (list or str): Any of 'type', 'year', 'month' and 'category'; none gives one overall group.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
 
-    def list_notes(self, record_type=None, month=None, year=None):
+        Returns:
+            list: One dict per group, ordered by the grouped values, holding those
+                values and the group's 'total', 'count' and 'average'.
+
+        Raises:
+            ValueError: If group_by names an unknown dimension or a date is invalid.
         """
-        Lists all notes based on the specified month, year, and record type. 
-        If no filters are provided, lists all notes.
+        dimensions = self.summary_dimensions(group_by)
+        if start_date is not None or end_date is not None:
+            frame = self.data
+            positions = self.matching_positions(frame, record_type, month, year, start_date, end_date)
+            return AggregateStore.group(AggregateStore.group_totals(frame.iloc[positions]).items(), dimensions)
+        return self.aggregates.summarize(
+            dimensions,
+            record_type=record_type,
+            year=int(year) if year is not None else None,
+            month=int(month) if month is not None else None,
+        )
+
+
+
+    def filter_mask(self, df, record_type=None, month=None, year=None):
+        """
+        Builds the boolean mask behind filter_data without copying any rows.
 
         Args:
-            month (int, optional): The month for which to list notes (1-12).
-            year (int, optional): The year for which to list notes.
-            record_type (str, optional): The type of the record ('expense' or 'payment').
+            df (pd.DataFrame): Data with typed columns.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
 
         Returns:
-            list: A list of unique notes.
+            np.ndarray: A boolean array aligned with df.
         """
-        filtered_data = self.data
-
+        mask = np.ones(len(df), dtype=bool)
+        if record_type is not None:
+            mask &= self.type_mask(df, record_type).to_numpy()
         if month is not None:
-            filtered_data = filtered_data[(pd.to_datetime(filtered_data['date']).dt.month == month)]
+            mask &= (df['date'].dt.month == month).to_numpy()
         if year is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.year == year]
-        if record_type is not None:
-            filtered_data = filtered_data[filtered_data['type'].str.lower() == record_type.lower()]
+            mask &= (df['date'].dt.year == year).to_numpy()
+        return mask
 
-        return filtered_data['note'].unique().tolist()
-        
-        
-        
-    def list_categories(self, record_type=None, month=None, year=None):
+
+
+    def matching_positions(self, frame, record_type=None, month=None, year=None, start_date=None, end_date=None):
         """
-        Lists all categories based on the specified month, year, and record type. 
-        If no filters are provided, lists all categories.
+        Finds the row positions matching the filters, in ledger order. A year or
+        a date range is looked up in the date index by binary search, so only
+        the rows inside it are checked against the remaining filters and the
+        cost is O(log n + k) for k rows in range rather than a full scan.
 
         Args:
-            month (int, optional): The month for which to list categories (1-12).
-            year (int, optional): The year for which to list categories.
-            record_type (str, optional): The type of the record ('expense' or 'payment').
+            frame (pd.DataFrame): The ledger (self.data) the positions refer to.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
 
         Returns:
-            list: A list of unique categories.
+            np.ndarray: Integer row positions into frame, ascending.
+
+        Raises:
+            ValueError: If a date is invalid.
         """
-        filtered_data = self.data
+        start, end, month = self.period_bounds(month, year, start_date, end_date)
+        if start is None and end is None:
+            return np.flatnonzero(self.filter_mask(frame, record_type=record_type, month=month))
+        positions = frame.index.get_indexer(self.date_index.ids_of(self.date_index.between(start, end)))
+        # Ids the frame does not hold yet (a mutation in flight) are dropped
+        positions = np.sort(positions[positions >= 0])
+        if record_type is not None or month is not None:
+            positions = positions[self.filter_mask(frame.iloc[positions], record_type=record_type, month=month)]
+        return positions
 
-        if month is not None:
-            filtered_data = filtered_data[(pd.to_datetime(filtered_data['date']).dt.month == month)]
-        if year is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.year == year]
-        if record_type is not None:
-            filtered_data = filtered_data[filtered_data['type'].str.lower() == record_type.lower()]
 
-        return filtered_data['category'].unique().tolist()
 
+    def range_cents(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Returns the amounts of the matching rows in integer cents, so sums are exact.
+        """
+        frame = self.data
+        positions = self.matching_positions(frame, record_type, month, year, start_date, end_date)
+        return (frame['amount'].to_numpy()[positions] * 100).round().astype('int64')
 
 
-    def calculate_average_amount(self, record_type=None, month=None, year=None):
+
+    @refreshed
+    def filter_data(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
         """
-        Calculates the average amount based on the specified month, year, and record type.
+        Returns the rows matching the given record type, month, year and date range.
         If a parameter is missing, it considers all options under that category.
 
         Args:
-            record_type (str, optional): The type of the record ('expense' or 'payment').
-            month (int, optional): The month for which to calculate the average (1-12).
-            year (int, optional): The year for which to calculate the average.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
 
         Returns:
-            float: The average amount for the specified filters.
+            pd.DataFrame: The matching rows with typed columns.
         """
-        filtered_data = self.data
+        if record_type is None and month is None and year is None and start_date is None and end_date is None:
+            return self.data
+        frame = self.data
+        return frame.iloc[self.matching_positions(frame, record_type, month, year, start_date, end_date)]
 
-        if record_type is not None:
-            filtered_data = filtered_data[filtered_data['type'].str.lower() == record_type.lower()]
-        if month is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.month == month]
-        if year is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.year == year]
 
-        if filtered_data.empty:
-            return 0.0
 
-        return round(filtered_data['amount'].astype(float).mean(), 2)
+    @refreshed
+    def select_rows(self, record_type=None, month=None, year=None, offset=None, limit=None, start_date=None, end_date=None):
+        """
+        Selects a page of matching rows by position, without copying them. The
+        page is applied to the positions before any row is materialised, so the
+        cost of formatting it depends on the page size, not the ledger size.
+        Rows are paged in id order, like the SQLite engine, even where the CSV
+        file is not sorted by id.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            offset (int, optional): Number of matching rows to skip.
+            limit (int, optional): Maximum number of rows to return.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            tuple: (frame, positions), the ledger the positions refer to and the
+                integer row positions of the page. Read chunks with frame.iloc.
+        """
+        # Mutations replace self.data rather than resizing it, so the positions stay valid for this frame
+        frame = self.data
+        positions = self.matching_positions(frame, record_type, month, year, start_date, end_date)
+        ids = frame['id'].to_numpy()[positions]
+        # Inserts append ascending ids, so only ledgers that started unsorted need the sort
+        if len(ids) > 1 and (ids[1:] < ids[:-1]).any():
+            positions = positions[np.argsort(ids, kind='stable')]
+        if offset is not None:
+            positions = positions[offset:]
+        if limit is not None:
+            positions = positions[:limit]
+        return frame, positions
+
+
+
+    @refreshed
+    def query_page(self, limit, cursor=None, record_type=None, month=None, year=None, descending=False, start_date=None, end_date=None):
+        """
+        Returns one page of records ordered by (date, id), continuing after the
+        given cursor. The start of the page and any year/month range are found by
+        binary search in the date index, so a page costs O(page size + log n)
+        however deep into the ledger it is. The same goes for a date range.
+
+        Args:
+            limit (int): Maximum number of records in the page.
+            cursor (str, optional): The next_cursor of the previous page; None or '' for the first page.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            descending (bool, optional): Newest first instead of oldest first.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            tuple: (frame, positions, next_cursor), the ledger the positions refer to,
+                the integer row positions of the page in order, and the cursor of the
+                next page (None when there are no more records).
 
+        Raises:
+            ValueError: If the cursor or the filters are invalid.
+        """
+        if limit <= 0:
+            raise ValueError("The limit must be a positive number.")
+        frame = self.data
+        index = self.date_index
+        state = index.state
+
+        start, end, residual_month = self.period_bounds(month, year, start_date, end_date)
+        # Keys from low (inclusive) to high (exclusive) are still to be paged through
+        low, high = index.date_keys(start, end)
+        if cursor:
+            cursor_key = decode_cursor(cursor)
+            if descending:
+                high = cursor_key if high is None else min(high, cursor_key)
+            else:
+                low = cursor_key + 1 if low is None else max(low, cursor_key + 1)
+
+        # Filters the key range cannot express are checked on each block of candidates
+        has_residual = record_type is not None or residual_month is not None
+
+        pages = []
+        collected = 0
+        last_key = None
+        while collected < limit:
+            block = index.select(low, high, max(limit - collected, 256), descending, state)
+            if not len(block):
+                break
+            positions = frame.index.get_indexer(index.ids_of(block))
+            keep = positions >= 0
+            if has_residual and keep.any():
+                keep[keep] = self.filter_mask(frame.iloc[positions[keep]], record_type=record_type, month=residual_month)
+            taken = np.flatnonzero(keep)[:limit - collected]
+            # Stop right after the last row taken when the page is full, so the cursor resumes from there
+            end_key = int(block[taken[-1]] if len(taken) == limit - collected else block[-1])
+            if descending:
+                high = end_key
+            else:
+                low = end_key + 1
+            if len(taken):
+                pages.append(positions[taken])
+                collected += len(taken)
+                last_key = block[taken[-1]]
+
+        page_positions = np.concatenate(pages) if pages else np.empty(0, dtype='int64')
+        more = collected == limit and len(index.select(low, high, 1, descending, state))
+        next_cursor = encode_cursor(last_key) if more else None
+        return frame, page_positions, next_cursor
+
+
+
+    def current_note_index(self):
+        """
+        Returns the note index, building it from the ledger on first use. The
+        build runs under the write lock, so no mutation can slip in between
+        reading the rows and keeping the index up to date.
+        """
+        index = self.note_index
+        if index is None:
+            with self.write_lock:
+                if self.note_index is None:
+                    with span("db.build_note_index", rows=len(self.data)):
+                        self.note_index = NoteIndex.from_dataframe(self.data)
+                index = self.note_index
+        return index
 
 
-    def export_data(self, file_format="json", record_type:str=None, month=None, year=None):
+
+    @refreshed
+    def search_notes(self, query, record_type=None, month=None, year=None, start_date=None, end_date=None, limit=None):
         """
-        Exports the DataFrame as a JSON or CSV string, with optional filtering by month and year.
+        Finds the records whose notes contain every word of the query, most
+        recently added first. Words are looked up in the note index and only
+        the matches are checked against the filters. With a limit, ids are
+        searched in growing windows from the newest down, so a page of results
+        only touches the matches near the top rather than all of them.
 
         Args:
-            file_format (str): The format to export the data ('json' or 'csv').
-            month (int, optional): The month for which to filter the data (1-12).
-            year (int, optional): The year for which to filter the data.
+            query (str): Words to look for. They match by stem ("coffees" finds "Coffee"),
+                and the last one also as a prefix unless the query ends in a space.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+            limit (int, optional): Maximum number of records to return.
 
         Returns:
-            str: The exported data as a string.
+            tuple: (frame, positions), the ledger the positions refer to and the
+                integer row positions of the matches. Read them with frame.iloc.
 
         Raises:
-            ValueError: If the file_format is not 'json' or 'csv'.
+            ValueError: If the limit or the filters are invalid.
         """
-        filtered_data = self.data
+        if limit is not None and limit <= 0:
+            raise ValueError("The limit must be a positive number.")
+        start, end, residual_month = self.period_bounds(month, year, start_date, end_date)
+        index = self.current_note_index()
+        frame = self.data
+        terms = index.terms(query)
+        if not terms:
+            return frame, np.empty(0, dtype='int64')
+        if limit is None:
+            positions = self.match_positions(frame, index.match(terms)[::-1], record_type, residual_month, start, end)
+            return frame, positions
+
+        pages = []
+        collected = 0
+        high = self.next_id
+        window = max(4 * limit, 1024)
+        while collected < limit and high > 0:
+            low = max(0, high - window)
+            positions = self.match_positions(frame, index.match(terms, low, high)[::-1], record_type, residual_month, start, end)
+            pages.append(positions[:limit - collected])
+            collected += len(pages[-1])
+            high = low
+            window *= 2
+        return frame, np.concatenate(pages) if pages else np.empty(0, dtype='int64')
+
+
+
+    def match_positions(self, frame, ids, record_type=None, month=None, start=None, end=None):
+        """
+        Looks up the rows of the given ids and keeps those matching the filters.
 
-        if record_type is not None:
-            filtered_data = filtered_data[filtered_data['type'].str.lower() == record_type.lower()]
-        if month is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.month == month]
-        if year is not None:
-            filtered_data = filtered_data[pd.to_datetime(filtered_data['date']).dt.year == year]
-
-        # Create a copy to avoid modifying the original data
-        export_data = filtered_data.copy()
-        
-        # Ensure 'amount' is float type for consistent data type
-        export_data['amount'] = export_data['amount'].astype(float)
-        
-        if file_format.lower() == "json":
-            return export_data.to_json(orient="records", date_format="iso")
-        elif file_format.lower() == "csv":
-            return export_data.to_csv(index=False)
-        elif file_format.lower() == "list":
-            # Convert all data to appropriate Python types before returning as list
-            result = []
-            for _, row in export_data.iterrows():
-                row_list = []
-                for val in row:
-                    # Convert pandas/numpy types to Python native types
-                    if hasattr(val, 'item'):  # Check if it's a numpy scalar
-                        val = val.item()  # Convert numpy type to native Python type
-                    row_list.append(val)
-                result.append(row_list)
-            return result
-        else:
-            raise ValueError("Invalid file format. Please choose 'json' or 'csv'.")
+        Args:
+            frame (pd.DataFrame): The ledger (self.data) to look in.
+            ids (np.ndarray): Record ids, in the order to return them.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            start (pd.Timestamp, optional): First date to keep.
+            end (pd.Timestamp, optional): Last date to keep.
+
+        Returns:
+            np.ndarray: Integer row positions into frame, in the order of ids.
+        """
+        positions = frame.index.get_indexer(ids)
+        # Ids the frame does not hold yet (a mutation in flight) are dropped
+        positions = positions[positions >= 0]
+        if not len(positions) or (record_type is None and month is None and start is None and end is None):
+            return positions
+        keep = self.filter_mask(frame.iloc[positions], record_type=record_type, month=month)
+        dates = frame['date'].to_numpy()[positions]
+        if start is not None:
+            keep &= dates >= start.to_datetime64()
+        if end is not None:
+            keep &= dates <= end.to_datetime64()
+        return positions[keep]
+
+
+
+    @refreshed
+    def calculate_average_amount(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Calculates the average amount based on the specified month, year, and record type.
+        If a parameter is missing, it considers all options under that category.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'payment').
+            month (int, optional): The month for which to calculate the average (1-12).
+            year (int, optional): The year for which to calculate the average.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            float: The average amount for the specified filters.
+        """
+        if start_date is None and end_date is None:
+            return self.aggregates.average(record_type=record_type, year=year, month=month)
+        cents = self.range_cents(record_type, month, year, start_date, end_date)
+        if len(cents) == 0:
+            return 0.0
+        return round(int(cents.sum()) / len(cents) / 100, 2)
 
 
 
+    @serialized
     def batch_insert_data(self, records):
         """
         Batch add multiple records to the database.
 
+        The whole batch is validated and normalized in one vectorized pass and
+        appended with a single concat. If any record is invalid, nothing is added.
+
         Args:
             records (list): A list of dictionaries containing multiple record data. Each record should be a dictionary with the following keys:
                             'type', 'amount', 'note', 'category', 'date'
 
         Returns:
             list: A list of successfully added record IDs.
+
+        Raises:
+            BatchValidationError: If any record is invalid; `errors` maps record index to the reason.
         """
-        if not records or not isinstance(records, list):
-            raise ValueError("Records must be a non-empty list")
-            
-        added_ids = []
-        
-        for record in records:
-            if not all(k in record for k in ['type', 'amount', 'note', 'category', 'date']):
-                raise ValueError("Each record must contain type, amount, note, category, and date")
-                
+        batch = self.validate_batch(records)
+
+        new_ids = np.arange(self.next_id, self.next_id + len(batch), dtype='int64')
+        batch.insert(0, 'id', new_ids)
+        new_rows = self.append_rows(batch)
+        self.next_id += len(batch)
+        self.aggregates.add_frame(new_rows)
+        self.date_index.add(new_rows['date'], new_rows['id'])
+        if self.note_index is not None:
+            self.note_index.add(new_rows['note'], new_rows['id'])
+
+        # journal the whole batch as one columnar event
+        journal_rows = self.to_external(new_rows)
+        self.commit({"op": "insert", "columns": {c: journal_rows[c].tolist() for c in journal_rows.columns}})
+
+        return new_ids.tolist()
+
+
+
+def open_database(engine=None, file_path=None, tenant=None):
+    """
+    Opens the ledger with the configured storage engine.
+
+    Args:
+        engine (str, optional): 'csv' (pandas + CSV snapshot and journal) or 'sqlite'.
+            Defaults to the BOOKKEEPING_STORAGE_ENGINE environment variable, then 'csv'.
+        file_path (str, optional): The storage file. Defaults to BOOKKEEPING_DATABASE_PATH,
+            then data\\database.csv. SQLite keeps the ledger in the .sqlite3 file next to
+            a CSV path, and imports the CSV with the same name when that file is first created.
+        tenant (str, optional): Opens this tenant's own ledger in TENANT_DIRECTORY instead,
+            creating an empty one on first use. Ignores file_path.
+
+    Returns:
+        StorageEngine: The opened ledger.
+
+    Raises:
+        ValueError: If the engine is unknown.
+    """
+    engine = (engine or os.environ.get("BOOKKEEPING_STORAGE_ENGINE", "csv")).lower()
+    if engine not in ("csv", "sqlite"):
+        raise ValueError(f"Unknown storage engine '{engine}'. Please choose 'csv' or 'sqlite'.")
+
+    if tenant is not None:
+        file_path = os.path.join(TENANT_DIRECTORY, tenant + (".csv" if engine == "csv" else ".sqlite3"))
+        os.makedirs(TENANT_DIRECTORY, exist_ok=True)
+        if engine == "csv" and not os.path.exists(file_path):
             try:
-                amount = float(record['amount'])
-                
-                # if the record is an expense, convert to negative
-                if record['type'].lower() == 'expense':
-                    amount = -abs(amount)
-                    
-                new_id = int(self.data['id'].max() + 1) if not self.data.empty else 1
-                
-                # convert date to standard format
-                try:
-                    date = pd.to_datetime(record['date']).strftime('%Y-%m-%d')
-                except Exception:
-                    raise ValueError(f"Date {record['date']} must be in a valid format (e.g., YYYY-MM-DD).")
-                
-                new_record = pd.DataFrame([{
-                    'id': new_id,
-                    'type': record['type'],
-                    'amount': f"{amount:.2f}",
-                    'note': record['note'],
-                    'category': record['category'],
-                    'date': date
-                }])
-                
-                self.data = pd.concat([self.data, new_record], ignore_index=True)
-                added_ids.append(int(new_id))  # convert to normal Python int type
-                
-            except ValueError as e:
-                raise ValueError(f"Error processing record: {e}")
-        
-        # save data and update total
-        self.current_total = self.calculate_total_amount()
-        self.save_database()
-        
-        return added_ids
+                with open(file_path, "x", encoding="utf-8", newline="") as f:
+                    f.write(",".join(COLUMNS) + "\n")
+            except FileExistsError:
+                # Another worker created it first
+                pass
+        import_csv = None
+    else:
+        file_path = file_path or os.environ.get("BOOKKEEPING_DATABASE_PATH") or DEFAULT_CSV_PATH
+        # SQLite starts from the same CSV ledger the CSV engine would open
+        import_csv = os.path.splitext(file_path)[0] + ".csv"
+
+    if engine == "csv":
+        return Database_Tools(file_path)
+    if file_path.lower().endswith(".csv"):
+        file_path = os.path.splitext(file_path)[0] + ".sqlite3"
+    return SQLite_Tools(file_path, import_csv=import_csv)
 
 
 
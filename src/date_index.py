@@ -0,0 +1,249 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+# A (date, id) pair is packed into one int64 so a single sorted array can be binary searched:
+# the day number in the high bits, the id in the low ID_BITS bits.
+ID_BITS = 40
+ID_MASK = (1 << ID_BITS) - 1
+NS_PER_DAY = 86_400 * 10**9
+# Buffered writes that trigger a merge into the main sorted array
+MERGE_THRESHOLD = 1024
+
+
+class DateIndex:
+    """
+    Record ids sorted by (date, id), kept alongside the ledger so pages and date
+    ranges are found by binary search instead of filtering and sorting every row.
+
+    Each key is days_since_epoch << ID_BITS | id. Writes do not copy the main
+    sorted array: new keys and the keys deleted from it are buffered in two
+    small sorted arrays, which are merged into it once MERGE_THRESHOLD writes
+    are pending. Readers combine the three, so a write costs O(pending + log n)
+    and a range of k keys O(k + pending + log n).
+
+    The three arrays are held in one tuple, `state`, that is replaced rather
+    than modified, so a reader holding it sees a consistent snapshot.
+    """
+
+    def __init__(self, keys=None):
+        empty = np.empty(0, dtype='int64')
+        # (main keys, buffered new keys, main keys buffered for deletion), all sorted
+        self.state = (keys if keys is not None else empty, empty, empty)
+
+    @staticmethod
+    def make_keys(dates, ids):
+        """
+        Packs dates and ids into sort keys.
+
+        Args:
+            dates (array-like): datetime64 values.
+            ids (array-like): Record ids, 0 <= id < 2**ID_BITS.
+
+        Returns:
+            np.ndarray: The int64 keys.
+        """
+        days = np.asarray(pd.to_datetime(dates).to_numpy(dtype='datetime64[ns]').astype('int64')) // NS_PER_DAY
+        ids = np.asarray(ids, dtype='int64')
+        if ids.size and (ids.min() < 0 or ids.max() > ID_MASK):
+            raise ValueError(f"Record ids must be between 0 and {ID_MASK} to be indexed.")
+        return (days << ID_BITS) | ids
+
+    @staticmethod
+    def day_key(timestamp):
+        """
+        Returns the smallest key on the given date.
+        """
+        return (pd.Timestamp(timestamp).normalize().value // NS_PER_DAY) << ID_BITS
+
+    @staticmethod
+    def split_key(key):
+        """
+        Returns the (date, id) pair packed into a key.
+        """
+        key = int(key)
+        return pd.Timestamp((key >> ID_BITS) * NS_PER_DAY), key & ID_MASK
+
+    @staticmethod
+    def ids_of(keys):
+        return keys & ID_MASK
+
+    @staticmethod
+    def contains(sorted_keys, keys):
+        """
+        Returns a boolean mask of which keys are in the sorted array.
+        """
+        if not len(sorted_keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return sorted_keys[positions] == keys
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Builds the index from scratch with one sort over a typed ledger.
+        """
+        return cls(np.sort(cls.make_keys(df['date'], df['id'])))
+
+    @property
+    def keys(self):
+        """
+        Every key, sorted. With writes pending this merges them, which costs
+        O(n); ranges and pages should use select() instead.
+        """
+        return self.merged(self.state)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.state)
+
+    @staticmethod
+    def merged(state):
+        keys, added, removed = state
+        if len(removed):
+            keys = np.delete(keys, np.searchsorted(keys, removed))
+        if len(added):
+            keys = np.insert(keys, np.searchsorted(keys, added), added)
+        return keys
+
+    def publish(self, keys, added, removed):
+        if len(added) + len(removed) >= MERGE_THRESHOLD:
+            keys, added, removed = self.merged((keys, added, removed)), added[:0], removed[:0]
+        self.state = (keys, added, removed)
+
+    def merge(self):
+        """
+        Folds the buffered writes into the main array.
+        """
+        keys = self.merged(self.state)
+        self.state = (keys, keys[:0], keys[:0])
+
+    def add(self, dates, ids):
+        """
+        Adds records to the index.
+
+        Args:
+            dates (array-like): Their dates.
+            ids (array-like): Their ids.
+        """
+        keys, added, removed = self.state
+        new_keys = np.sort(self.make_keys(dates, ids))
+        # A key deleted from the main array and added back only needs its deletion undone
+        restored = self.contains(removed, new_keys)
+        if restored.any():
+            removed = np.delete(removed, np.searchsorted(removed, new_keys[restored]))
+            new_keys = new_keys[~restored]
+        added = np.insert(added, np.searchsorted(added, new_keys), new_keys)
+        self.publish(keys, added, removed)
+
+    def remove(self, date, record_id):
+        """
+        Removes one record from the index.
+
+        Args:
+            date (pd.Timestamp): The date the record is indexed under.
+            record_id (int): Its id.
+        """
+        self.remove_many([date], [record_id])
+
+    def remove_many(self, dates, ids):
+        """
+        Removes several records from the index; keys it does not hold are ignored.
+
+        Args:
+            dates (array-like): The dates the records are indexed under.
+            ids (array-like): Their ids.
+        """
+        keys, added, removed = self.state
+        old_keys = np.unique(self.make_keys(dates, ids))
+        buffered = self.contains(added, old_keys)
+        if buffered.any():
+            added = np.delete(added, np.searchsorted(added, old_keys[buffered]))
+        old_keys = old_keys[~buffered]
+        old_keys = old_keys[self.contains(keys, old_keys) & ~self.contains(removed, old_keys)]
+        removed = np.insert(removed, np.searchsorted(removed, old_keys), old_keys)
+        self.publish(keys, added, removed)
+
+    def date_keys(self, start=None, end=None):
+        """
+        Returns the half-open range of keys for records dated from start to end,
+        both inclusive; None leaves that side open.
+
+        Args:
+            start (pd.Timestamp, optional): First date to include.
+            end (pd.Timestamp, optional): Last date to include.
+
+        Returns:
+            tuple: (low, high) keys; low is included, high is not.
+        """
+        low = None if start is None else self.day_key(start)
+        high = None if end is None else self.day_key(pd.Timestamp(end) + pd.Timedelta(days=1))
+        return low, high
+
+    def select(self, low=None, high=None, limit=None, descending=False, state=None):
+        """
+        Returns the keys from low (inclusive) to high (exclusive), or only the
+        first `limit` of them, without merging the buffered writes.
+
+        Args:
+            low (int, optional): Smallest key to return.
+            high (int, optional): Keys from here on are not returned.
+            limit (int, optional): Maximum number of keys to return.
+            descending (bool, optional): Take the keys from the high end, largest first.
+            state (tuple, optional): Snapshot of the index to read. Defaults to the current state.
+
+        Returns:
+            np.ndarray: The keys, sorted in the requested direction.
+        """
+        keys, added, removed = self.state if state is None else state
+        begin = 0 if low is None else int(np.searchsorted(keys, low))
+        finish = len(keys) if high is None else int(np.searchsorted(keys, high))
+        if limit is not None:
+            # Buffered deletions hide at most len(removed) of the main keys
+            if descending:
+                begin = max(begin, finish - limit - len(removed))
+            else:
+                finish = min(finish, begin + limit + len(removed))
+        block = keys[begin:max(begin, finish)]
+        if len(removed) and len(block):
+            block = block[~self.contains(removed, block)]
+        if len(added):
+            extra = added[0 if low is None else np.searchsorted(added, low):
+                          len(added) if high is None else np.searchsorted(added, high)]
+            if len(extra):
+                block = np.sort(np.concatenate([block, extra]))
+        if descending:
+            block = block[::-1]
+        return block if limit is None else block[:limit]
+
+    def between(self, start=None, end=None):
+        """
+        Returns the sorted keys of the records dated from start to end, both
+        inclusive; None leaves that side open.
+        """
+        return self.select(*self.date_keys(start, end))
+
+    def __eq__(self, other):
+        return np.array_equal(self.keys, other.keys)
+
+
+def encode_cursor(key):
+    """
+    Turns a sort key into an opaque cursor string.
+    """
+    return base64.urlsafe_b64encode(str(int(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Turns a cursor produced by encode_cursor back into a sort key.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for blocking pandas/file work so it never runs on the event loop.
+DB_THREADS = int(os.environ.get("BOOKKEEPING_DB_THREADS", "4"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking function on the database thread pool and awaits its result.
+
+    The caller's context variables are copied into the worker thread.
+
+    Args:
+        func (callable): The blocking function.
+        *args: Positional arguments for func.
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        Any: Whatever func returns.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def call_tool(func, args):
+    """
+    Invokes a Gemini tool function: coroutine functions are awaited on the loop,
+    plain functions are sent to the database thread pool.
+
+    Args:
+        func (callable): The tool function.
+        args (dict): Its keyword arguments.
+
+    Returns:
+        Any: The tool's result.
+    """
+    if asyncio.iscoroutinefunction(func):
+        return await func(**args)
+    return await run_blocking(func, **args)
@@ -0,0 +1,297 @@
+import calendar
+import re
+from datetime import date, timedelta
+
+from nltk.stem import PorterStemmer
+from nltk.tokenize import wordpunct_tokenize
+
+# Keywords for the categories listed in gemini_instructions.
+EXPENSE_CATEGORY_KEYWORDS = {
+    "Food": ["lunch", "dinner", "breakfast", "brunch", "restaurant", "coffee", "cafe", "pizza", "burger",
+             "sandwich", "snack", "takeout", "starbucks", "mcdonalds", "meal", "food", "drinks"],
+    "Groceries": ["grocery", "groceries", "supermarket", "walmart", "costco", "produce"],
+    "Transportation": ["uber", "lyft", "taxi", "cab", "bus", "train", "subway", "metro", "gas", "fuel",
+                       "parking", "toll", "transit"],
+    "Housing": ["rent", "mortgage", "landlord", "apartment"],
+    "Entertainment": ["movie", "movies", "cinema", "netflix", "spotify", "concert", "game", "games", "tickets"],
+    "Shopping": ["clothes", "shoes", "amazon", "shopping", "jacket", "shirt", "mall"],
+    "Utilities": ["electricity", "electric", "water", "internet", "wifi", "utility", "utilities", "phone"],
+    "Health": ["doctor", "pharmacy", "medicine", "dentist", "hospital", "gym", "prescription"],
+    "Education": ["tuition", "textbook", "textbooks", "course", "class", "school", "books"],
+    "Travel": ["flight", "hotel", "airbnb", "trip", "vacation", "airfare"],
+}
+PAY_CATEGORY_KEYWORDS = {
+    "Salary": ["salary", "paycheck", "payroll", "wage", "wages"],
+    "Bonus": ["bonus"],
+    "Gift": ["gift", "birthday"],
+    "Investment": ["dividend", "dividends", "interest", "stock", "stocks", "investment"],
+    "Refund": ["refund", "reimbursement", "cashback"],
+}
+
+EXPENSE_VERBS = {"spent", "spend", "paid", "pay", "bought", "buy", "purchas", "cost"}
+PAY_VERBS = {"earn", "earned", "receiv", "got", "made", "income", "deposit"}
+QUERY_WORDS = {"how", "total", "sum", "much", "what", "averag"}
+EXPENSE_NOUNS = {"expens", "spend", "spent", "cost"}
+PAY_NOUNS = {"incom", "earn", "earned", "pay", "paid", "salari"}
+# Anything that edits existing rows or asks for more than a number goes to Gemini.
+FALLBACK_WORDS = {"updat", "chang", "delet", "remov", "edit", "why", "compar", "breakdown", "categori",
+                  "note", "list", "which", "histori", "analyz", "analys", "trend", "each", "per"}
+
+AMOUNT_PATTERN = re.compile(r"(?<![\w.])\$?\s?(\d{1,3}(?:,\d{3})+|\d+)(\.\d{1,2})?(?!\d)\s*(?:dollars|bucks|usd)?")
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+YEAR_PATTERN = re.compile(r"\b(19\d{2}|20\d{2})\b")
+DAYS_AGO_PATTERN = re.compile(r"\b(\d+)\s+days?\s+ago\b")
+NOTE_PATTERN = re.compile(r"\b(?:on|for|at)\s+(?:a\s+|an\s+|the\s+|some\s+)?([a-z][a-z '&-]*)")
+NOTE_CONNECTORS = {"on", "for", "at"}
+
+MONTHS = {name.lower(): index for index, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): index for index, name in enumerate(calendar.month_abbr) if name})
+# Month names that are also common words or abbreviations ("may I", "mar"); they only count as a
+# month after "in"/"of"/..., before a year, or capitalized mid-sentence.
+AMBIGUOUS_MONTHS = {name.lower() for name in calendar.month_abbr if name}
+WEEKDAYS = {name.lower(): index for index, name in enumerate(calendar.day_name)}
+DATE_WORDS = {"today", "yesterday", "tonight", "this", "last", "ago", "morning", "evening", "night"} | \
+    set(MONTHS) | set(WEEKDAYS)
+# Periods _period cannot express as a month or year; queries that mention one go to Gemini.
+PERIOD_WORDS = {"week", "weeks", "weekly", "weekend", "weekends", "fortnight", "yesterday", "today", "tonight",
+                "morning", "evening", "night", "day", "days", "daily", "quarter", "quarters", "quarterly",
+                "q1", "q2", "q3", "q4", "since", "between", "until", "till", "ago", "recently", "lately", "ytd"} | \
+    set(WEEKDAYS)
+RELATIVE_PERIOD_PATTERN = re.compile(r"\b(?:last|this|past|previous|next|coming)\s+(?!month\b|year\b)\w+")
+MONTH_DAY_PATTERN = re.compile(r"\b(?:" + "|".join(MONTHS) + r")\.?\s+\d{1,2}(?:st|nd|rd|th)?\b")
+YEAR_CONTEXT_PATTERN = re.compile(r"\b(?:in|of|during)\s+(?:19|20)\d{2}\b")
+
+
+
+class Intent:
+    """
+    A function call resolved locally, with a confidence between 0 and 1.
+    """
+
+    def __init__(self, name, args, confidence):
+        self.name = name
+        self.args = args
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Intent(name={self.name!r}, args={self.args!r}, confidence={self.confidence:.2f})"
+
+
+
+class Intent_Parser:
+    """
+    Rule-based parser for the most common /genai prompts, e.g. "spent $12.50 on
+    lunch yesterday" or "how much did I spend in March". Prompts it cannot map
+    with high confidence return None or a low-confidence Intent and should be
+    sent to Gemini instead.
+    """
+
+    def __init__(self):
+        self.stemmer = PorterStemmer()
+        self.expense_keywords = self._keyword_index(EXPENSE_CATEGORY_KEYWORDS)
+        self.pay_keywords = self._keyword_index(PAY_CATEGORY_KEYWORDS)
+
+    def _keyword_index(self, categories):
+        return {self.stemmer.stem(word): category for category, words in categories.items() for word in words}
+
+    def parse(self, prompt, today=None):
+        """
+        Maps a prompt to a database function call.
+
+        Args:
+            prompt (str): The user's natural language prompt.
+            today (date, optional): Reference date for relative dates. Defaults to today.
+
+        Returns:
+            Intent or None: The resolved call, or None if the prompt is not recognised.
+        """
+        today = today or date.today()
+        text = prompt.lower().strip()
+        words = [w for w in wordpunct_tokenize(text) if w.isalnum()]
+        stems = [self.stemmer.stem(w) for w in words]
+        stem_set = set(stems)
+
+        if not words or stem_set & FALLBACK_WORDS:
+            return None
+
+        amounts = self._amounts(text)
+        is_question = bool(stem_set & QUERY_WORDS) or text.endswith("?")
+
+        if amounts and not is_question:
+            return self._parse_add(prompt, text, words, stems, amounts, today)
+        if is_question and not amounts:
+            return self._parse_query(prompt, text, words, stem_set, today)
+        return None
+
+    def _amounts(self, text):
+        # Dates and years must not be mistaken for amounts
+        cleaned = ISO_DATE_PATTERN.sub(" ", text)
+        cleaned = DAYS_AGO_PATTERN.sub(" ", cleaned)
+        amounts = []
+        for match in AMOUNT_PATTERN.finditer(cleaned):
+            whole, cents = match.group(1), match.group(2) or ""
+            has_currency = "$" in match.group(0) or cents or match.group(0).rstrip().endswith(("dollars", "bucks", "usd"))
+            if YEAR_PATTERN.fullmatch(whole) and not has_currency:
+                continue
+            amounts.append(float(whole.replace(",", "") + cents))
+        return amounts
+
+    def _parse_add(self, prompt, text, words, stems, amounts, today):
+        stem_set = set(stems)
+        is_expense = bool(stem_set & EXPENSE_VERBS)
+        is_pay = bool(stem_set & PAY_VERBS) or any(s in self.pay_keywords for s in stems)
+        if len(amounts) != 1 or is_expense == is_pay:
+            # Several transactions (batch) or an ambiguous direction
+            return None
+
+        confidence = 0.5
+        keywords = self.expense_keywords if is_expense else self.pay_keywords
+        category = next((keywords[s] for s in stems if s in keywords), None)
+        if category is not None:
+            confidence += 0.2
+        else:
+            category = "Other"
+
+        note = self._note(text)
+        if note is None and category != "Other":
+            note = next(w for w, s in zip(words, stems) if keywords.get(s) == category)
+        if note is not None:
+            confidence += 0.25
+            if NOTE_CONNECTORS.intersection(note.split()):
+                # "dinner at joe's" is fine, but it may also be a date or place we failed to cut off
+                confidence -= 0.2
+
+        record_date = self._date(text, today)
+        if record_date is None:
+            if self._mentions_date(prompt, text, words):
+                # A date we cannot read (e.g. 2024-13-01 or "last week") must not become today
+                return None
+            record_date = today
+            confidence -= 0.05
+
+        return Intent(
+            "add_expense" if is_expense else "add_pay",
+            {"amount": amounts[0], "note": note.title() if note else "", "category": category,
+             "date": record_date.isoformat()},
+            confidence,
+        )
+
+    def _note(self, text):
+        """
+        Finds the note after "on"/"for"/"at". It ends at a date word, or at a
+        connector followed by a date ("lunch on monday", "lunch on 2024-03-01"),
+        since the capture stops at the digits of a date.
+        """
+        for match in NOTE_PATTERN.finditer(text):
+            words = match.group(1).split()
+            note_words = []
+            for position, word in enumerate(words):
+                if word in DATE_WORDS:
+                    break
+                if word in NOTE_CONNECTORS:
+                    following = next((w for w in words[position + 1:] if w != "the"), None)
+                    # None: the capture ran into digits ("on the 3rd") or the end of the prompt
+                    if following is None or following in DATE_WORDS:
+                        break
+                note_words.append(word)
+            if note_words:
+                return " ".join(note_words)
+        return None
+
+    def _date(self, text, today):
+        match = ISO_DATE_PATTERN.search(text)
+        if match:
+            try:
+                return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            except ValueError:
+                return None
+        if "yesterday" in text:
+            return today - timedelta(days=1)
+        if "today" in text or "tonight" in text:
+            return today
+        match = DAYS_AGO_PATTERN.search(text)
+        if match:
+            return today - timedelta(days=int(match.group(1)))
+        for name, weekday in WEEKDAYS.items():
+            if re.search(rf"\b(?:last|on)\s+{name}\b", text):
+                delta = (today.weekday() - weekday) % 7 or 7
+                return today - timedelta(days=delta)
+        return None
+
+    def _month(self, prompt, text):
+        """
+        Returns the month named in the prompt (1-12), or None. Ambiguous names
+        such as "may" or "mar" need context: "in may", "may 2024" or "May"
+        capitalized after the first word.
+        """
+        for name, month in MONTHS.items():
+            if name in AMBIGUOUS_MONTHS:
+                found = re.search(rf"\b(?:in|of|during|for|since|until)\s+{name}\b|\b{name}\.?\s+(?:19|20)\d{{2}}\b", text) or \
+                    re.search(rf"(?<=\s){name.capitalize()}\b", prompt.strip())
+            else:
+                found = re.search(rf"\b{name}\b", text)
+            if found:
+                return month
+        return None
+
+    def _unresolved_period(self, text, words):
+        """
+        Whether the prompt names a period _period cannot express, such as "last
+        week", "yesterday", "Q3", "since March" or a specific day.
+        """
+        return bool(set(words) & PERIOD_WORDS) or bool(
+            RELATIVE_PERIOD_PATTERN.search(text) or ISO_DATE_PATTERN.search(text) or
+            DAYS_AGO_PATTERN.search(text) or MONTH_DAY_PATTERN.search(text)
+        )
+
+    def _mentions_date(self, prompt, text, words):
+        """
+        Whether the prompt contains any date text, resolvable or not.
+        """
+        return self._unresolved_period(text, words) or bool(set(words) & {"month", "year", "last", "this"}) or \
+            bool(YEAR_CONTEXT_PATTERN.search(text)) or self._month(prompt, text) is not None
+
+    def _period(self, prompt, text, today):
+        """
+        Returns (month, year, found) for phrases like "this month", "in March" or "2024".
+        """
+        if "this month" in text:
+            return today.month, today.year, True
+        if "last month" in text:
+            previous = today.replace(day=1) - timedelta(days=1)
+            return previous.month, previous.year, True
+        year_match = YEAR_PATTERN.search(text)
+        year = int(year_match.group(1)) if year_match else None
+        month = self._month(prompt, text)
+        if month is not None:
+            if year is None:
+                # The most recent such month
+                year = today.year if month <= today.month else today.year - 1
+            return month, year, True
+        if "this year" in text:
+            return None, today.year, True
+        if "last year" in text:
+            return None, today.year - 1, True
+        if year is not None:
+            return None, year, True
+        return None, None, False
+
+    def _parse_query(self, prompt, text, words, stem_set, today):
+        if any(s in self.expense_keywords or s in self.pay_keywords for s in stem_set):
+            # Totals for a single category are not covered by the scalar tools
+            return None
+        wants_expense = bool(stem_set & EXPENSE_NOUNS)
+        wants_pay = bool(stem_set & PAY_NOUNS) and not wants_expense
+        if not wants_expense and not wants_pay:
+            return None
+        record_type = "expense" if wants_expense else "pay"
+        if self._unresolved_period(text, words):
+            # Answering "last week" with an all-time or monthly figure would be wrong
+            return None
+        month, year, has_period = self._period(prompt, text, today)
+
+        if "averag" in stem_set or "mean" in stem_set:
+            return Intent("get_average_amount", {"record_type": record_type, "month": month, "year": year}, 0.85)
+        if has_period:
+            return Intent("get_monthly_total", {"record_type": record_type, "month": month, "year": year}, 0.9)
+        return Intent("get_total_amount_by_type", {"record_type": record_type}, 0.85)
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+
+from src.metrics import BYTES_WRITTEN, WRITE_LATENCY
+from src.storage import DURABILITY_MODES
+
+
+class Journal:
+    """
+    Append-only write-ahead journal of ledger mutations.
+
+    Each line is one JSON event ({"op": "insert" | "update" | "delete", ...}).
+    A mutation costs one small write instead of re-serializing the whole
+    ledger. The journal is folded back into the CSV snapshot by
+    Database_Tools.compact().
+
+    Every append is written through to the OS at once, so other processes
+    see it. When it is fsynced depends on the durability mode:
+
+    - sync: every append is fsynced before it returns.
+    - group: a background flusher fsyncs all pending appends with one call
+      as soon as it is idle, so appends made during an fsync share the next
+      one. Writers wait for their batch with wait_synced().
+    - async: the flusher lets appends build up for flush_interval seconds or
+      until flush_batch are pending, and nobody waits (write-behind). A crash
+      can lose the last flush_interval seconds of mutations.
+    """
+
+    def __init__(self, file_path, durability="sync", flush_interval=0.005, flush_batch=64):
+        """
+        Args:
+            file_path (str): The path of the live journal.
+            durability (str, optional): 'sync', 'group' or 'async'.
+            flush_interval (float, optional): Longest time an append waits to be fsynced (async).
+            flush_batch (int, optional): Number of pending appends that triggers an fsync at once (async).
+
+        Raises:
+            ValueError: If the durability mode is unknown.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{durability}'. Please choose 'sync', 'group' or 'async'.")
+        self.file_path = file_path
+        self.rotated_path = file_path + ".compacting"
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        # Appends written so far and how many of them are known to be on disk
+        self.appended = 0
+        self.synced = 0
+        self.fsyncs = 0
+        self._lock = threading.Lock()
+        self._synced_changed = threading.Condition(self._lock)
+        self._handle = None
+        self._flusher = None
+
+    @staticmethod
+    def path_for(database_path):
+        """
+        Returns the journal path that belongs to a CSV snapshot.
+
+        Args:
+            database_path (str): The path to the CSV file.
+
+        Returns:
+            str: The path of the journal stored next to it.
+        """
+        return os.path.splitext(database_path)[0] + ".journal"
+
+    def append(self, event):
+        """
+        Durably appends an event to the journal.
+
+        Args:
+            event (dict): The JSON-serializable mutation event.
+
+        Returns:
+            int: The byte offset of the end of the live journal after the event.
+        """
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        with self._lock:
+            start = time.perf_counter()
+            if self._handle is None:
+                self._handle = open(self.file_path, "a", encoding="utf-8")
+            self._handle.write(line)
+            self._handle.flush()
+            self.appended += 1
+            if self.durability == "sync":
+                os.fsync(self._handle.fileno())
+                self.fsyncs += 1
+                self.synced = self.appended
+            else:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+                    self._flusher.start()
+                self._synced_changed.notify_all()
+            offset = self._handle.tell()
+            elapsed = time.perf_counter() - start
+        # The journal belongs to the CSV engine; SQLite's WAL is counted when it is checkpointed
+        WRITE_LATENCY.observe(elapsed, engine="csv", target="journal")
+        BYTES_WRITTEN.inc(len(line.encode("utf-8")), engine="csv", target="journal")
+        return offset
+
+    def wait_synced(self, ticket):
+        """
+        Blocks until the first `ticket` appends are on disk.
+
+        Args:
+            ticket (int): The value of `appended` right after the caller's append.
+        """
+        with self._lock:
+            while self.synced < ticket:
+                self._synced_changed.wait()
+
+    def _flush_loop(self):
+        """
+        Background flusher for group and async durability: waits for pending
+        appends (in async mode lets a batch build up), then fsyncs them with
+        one call. Exits once the journal is closed and nothing is pending.
+        """
+        while True:
+            with self._lock:
+                while self.synced == self.appended:
+                    if self._handle is None:
+                        return
+                    self._synced_changed.wait()
+                deadline = time.monotonic() + self.flush_interval
+                while self.durability == "async" and self.appended - self.synced < self.flush_batch and self._handle is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._synced_changed.wait(remaining)
+                if self._handle is None:
+                    # Closed or rotated meanwhile; that already synced everything
+                    continue
+                target = self.appended
+                # fsync a duplicate descriptor so appends are not blocked while it runs
+                fd = os.dup(self._handle.fileno())
+            start = time.perf_counter()
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            WRITE_LATENCY.observe(time.perf_counter() - start, engine="csv", target="journal_fsync")
+            with self._lock:
+                self.fsyncs += 1
+                self.synced = max(self.synced, target)
+                self._synced_changed.notify_all()
+
+    def _sync_and_close(self):
+        """
+        Fsyncs pending appends and closes the handle. Callers hold _lock.
+        """
+        if self._handle is None:
+            return
+        if self.synced < self.appended:
+            os.fsync(self._handle.fileno())
+            self.fsyncs += 1
+            self.synced = self.appended
+        self._handle.close()
+        self._handle = None
+        self._synced_changed.notify_all()
+
+    def size(self):
+        """
+        Returns the size of the live journal in bytes.
+        """
+        try:
+            return os.path.getsize(self.file_path)
+        except FileNotFoundError:
+            return 0
+
+    def read_file(self, path, position=0):
+        """
+        Reads the complete events of one journal file from a byte offset on.
+
+        Args:
+            path (str): The live or the rotated journal path.
+            position (int, optional): Byte offset to start from.
+
+        Returns:
+            tuple: (events, position), the decoded events and the offset just
+                past the last one, where the next read should resume.
+        """
+        events = []
+        try:
+            with open(path, "rb") as f:
+                f.seek(position)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Not fully written yet (or torn by a crash)
+                        break
+                    try:
+                        event = json.loads(line) if line.strip() else None
+                    except ValueError:
+                        # A torn final write from a crash; everything before it is intact.
+                        break
+                    position += len(line)
+                    if event is not None:
+                        events.append(event)
+        except FileNotFoundError:
+            pass
+        return events, position
+
+    def read_events(self):
+        """
+        Reads all pending events, oldest first, including a rotated journal
+        left behind by an interrupted compaction.
+
+        Returns:
+            list: The decoded events.
+        """
+        return self.read_file(self.rotated_path)[0] + self.read_file(self.file_path)[0]
+
+    def rotate(self):
+        """
+        Moves the live journal aside so a snapshot can be written while new
+        events keep going to a fresh file.
+        """
+        with self._lock:
+            self._sync_and_close()
+            if not os.path.exists(self.file_path):
+                return
+            if os.path.exists(self.rotated_path):
+                # Leftover from an interrupted compaction: keep both, in order.
+                with open(self.file_path, "r", encoding="utf-8") as src, \
+                        open(self.rotated_path, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.file_path)
+            else:
+                os.replace(self.file_path, self.rotated_path)
+
+    def discard_rotated(self):
+        """
+        Deletes the rotated journal once its events are in the snapshot.
+        """
+        with self._lock:
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def close(self):
+        """
+        Fsyncs any pending appends and closes the journal file.
+        """
+        with self._lock:
+            self._sync_and_close()
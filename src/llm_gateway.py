@@ -0,0 +1,344 @@
+from google import genai
+from google.genai import types
+
+from src.metrics import GEMINI_ERRORS, GEMINI_LATENCY
+from src.tracing import span
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+
+
+def build_tool():
+    """
+    Builds the Gemini tool holding the function declarations for every database operation.
+
+    Returns:
+        types.Tool: The tool passed to generate_content.
+    """
+    # 添加批量添加函数声明
+    # Create a function declaration for the tool
+    function_batch_add = types.FunctionDeclaration(
+        name="batch_add_records",
+        description="批量添加多条交易记录。",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "records": types.Schema(
+                    type="ARRAY",
+                    description="包含多条记录数据的列表，每条记录需包含type, amount, note, category, date",
+                    items=types.Schema(
+                        type="OBJECT",
+                        properties={
+                            "type": types.Schema(type="STRING", description="记录类型 ('expense' 或 'pay')"),
+                            "amount": types.Schema(type="NUMBER", description="交易金额"),
+                            "note": types.Schema(type="STRING", description="交易说明"),
+                            "category": types.Schema(type="STRING", description="交易分类"),
+                            "date": types.Schema(type="STRING", description="交易日期")
+                        },
+                        required=["type", "amount", "note", "category", "date"]
+                    )
+                )
+            },
+            required=["records"]
+        )
+    )
+    function_add_expense = types.FunctionDeclaration(
+        name="add_expense",
+        description="Add an expense to the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "amount": types.Schema(type="NUMBER", description="The amount of the expense."),
+                "note": types.Schema(type="STRING", description="The note describing the expense."),
+                "category": types.Schema(type="STRING", description="The category of the expense."),
+                "date": types.Schema(type="STRING", description="The date of the expense."),
+            },
+            required=["amount", "note", "category", "date"],
+        ),
+    )
+    function_add_pay = types.FunctionDeclaration(
+        name="add_pay",
+        description="Add a payment to the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "amount": types.Schema(type="NUMBER", description="The amount of the payment."),
+                "note": types.Schema(type="STRING", description="The note describing the payment."),
+                "category": types.Schema(type="STRING", description="The category of the payment."),
+                "date": types.Schema(type="STRING", description="The date of the expense."),
+            },
+            required=["amount", "note", "category", "date"],
+        ),
+    )
+    function_update_expense = types.FunctionDeclaration(
+        name="update_expense",
+        description="Update an existing expense in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_id": types.Schema(type="NUMBER", description="The ID of the record to update."),
+                "amount": types.Schema(type="NUMBER", description="The new amount of the expense."),
+                "note": types.Schema(type="STRING", description="The new note for the expense."),
+                "category": types.Schema(type="STRING", description="The new category of the expense."),
+                "date": types.Schema(type="STRING", description="The new date of the expense."),
+            },
+            required=["record_id"],
+        ),
+    )
+    function_update_pay = types.FunctionDeclaration(
+        name="update_pay",
+        description="Update an existing payment in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_id": types.Schema(type="NUMBER", description="The ID of the record to update."),
+                "amount": types.Schema(type="NUMBER", description="The new amount of the payment."),
+                "note": types.Schema(type="STRING", description="The new note for the payment."),
+                "category": types.Schema(type="STRING", description="The new category of the payment."),
+                "date": types.Schema(type="STRING", description="The new date of the payment."),
+            },
+            required=["record_id"],
+        ),
+    )
+    function_delete_record = types.FunctionDeclaration(
+        name="delete_record",
+        description="Delete a record from the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_id": types.Schema(type="NUMBER", description="The ID of the record to delete."),
+            },
+            required=[],
+        ),
+    )
+    function_get_total_amount = types.FunctionDeclaration(
+        name="get_total_amount_by_type",
+        description="Get the total amount of a record type in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+            },
+            required=[],
+        ),
+    )
+    function_get_monthly_total = types.FunctionDeclaration(
+        name="get_monthly_total",
+        description="Get the total amount of expenses for a specific month in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to get the total."),
+                "year": types.Schema(type="NUMBER", description="The year for which to get the total."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=[],
+        ),
+    )
+    function_get_notes_list = types.FunctionDeclaration(
+        name="get_notes_list",
+        description="Get the list of notes from the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to get the notes."),
+                "year": types.Schema(type="NUMBER", description="The year for which to get the notes."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=[],
+        ),
+    )
+    function_get_category_list = types.FunctionDeclaration(
+        name="get_category_list",
+        description="Get the list of categories from the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to get the categories."),
+                "year": types.Schema(type="NUMBER", description="The year for which to get the categories."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=[],
+        ),
+    )
+    function_get_average_amount = types.FunctionDeclaration(
+        name="get_average_amount",
+        description="Get the average amount of expenses for a specific month in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to get the average."),
+                "year": types.Schema(type="NUMBER", description="The year for which to get the average."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=[],
+        ),
+    )
+    function_get_transaction_history = types.FunctionDeclaration(
+        name="get_transaction_history",
+        description="Get the transaction history for a specific month in the database.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "file_format": types.Schema(type="STRING", description="The format in which to export the data (default is 'json')."),
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to get the transaction history."),
+                "year": types.Schema(type="NUMBER", description="The year for which to get the transaction history."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=[],
+        ),
+    )
+    function_get_summary = types.FunctionDeclaration(
+        name="get_summary",
+        description="Break records down into groups (e.g. spending by category or by month) and get the total, count and average amount of each group in one call.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "group_by": types.Schema(
+                    type="ARRAY",
+                    description="The dimensions to group by, any of 'type', 'year', 'month' and 'category'.",
+                    items=types.Schema(type="STRING", enum=["type", "year", "month", "category"]),
+                ),
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month to summarize (1-12)."),
+                "year": types.Schema(type="NUMBER", description="The year to summarize."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=["group_by"],
+        ),
+    )
+    function_search_transactions = types.FunctionDeclaration(
+        name="search_transactions",
+        description="Find transactions by the words of their notes (e.g. all Starbucks purchases), newest first.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "query": types.Schema(type="STRING", description="The words to look for in the notes."),
+                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
+                "month": types.Schema(type="NUMBER", description="The month to search (1-12)."),
+                "year": types.Schema(type="NUMBER", description="The year to search."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+                "limit": types.Schema(type="NUMBER", description="The maximum number of transactions to return (default 50)."),
+            },
+            required=["query"],
+        ),
+    )
+    function_ai_analyze = types.FunctionDeclaration(
+        name="ai_analyze",
+        description="Analyze transaction history using AI.",
+        parameters=types.Schema(
+            type="OBJECT",
+            properties={
+                "question": types.Schema(type="STRING", description="The question to analyze the transaction data."),
+                "record_type": types.Schema(type="STRING", description="The type of transaction records to retrieve (e.g., 'income', 'expense')."),
+                "month": types.Schema(type="NUMBER", description="The month for which to retrieve transaction history (1-12)."),
+                "year": types.Schema(type="NUMBER", description="The year for which to retrieve transaction history."),
+                "start_date": types.Schema(type="STRING", description="First date to include (YYYY-MM-DD), for periods that are not a whole month or year."),
+                "end_date": types.Schema(type="STRING", description="Last date to include (YYYY-MM-DD)."),
+            },
+            required=["question"],
+        ),
+    )
+    tool = types.Tool(function_declarations=[
+        function_batch_add,
+        function_add_expense, 
+        function_add_pay,
+        function_update_expense,
+        function_update_pay,
+        function_delete_record,
+        function_get_total_amount,
+        function_get_monthly_total,
+        function_get_notes_list,
+        function_get_category_list,
+        function_get_average_amount,
+        function_get_transaction_history,
+        function_get_summary,
+        function_search_transactions,
+        function_ai_analyze
+    ])
+
+    return tool
+
+
+
+class LLM_Gateway:
+    """
+    Long-lived access point to Gemini, created once at application startup.
+
+    Owns a single client (so HTTP connections are pooled and reused across
+    requests), the prebuilt tool set and the function dispatch table.
+    """
+
+    def __init__(self, api_key, instructions, function_mapping, model=GEMINI_MODEL, client=None):
+        """
+        Args:
+            api_key (str): The Gemini API key.
+            instructions (str): The system prompt prepended to every user prompt.
+            function_mapping (dict): Maps declared function names to their handlers.
+            model (str, optional): The Gemini model name.
+            client (genai.Client, optional): A prebuilt client, e.g. a local stand-in.
+        """
+        self.client = client if client is not None else genai.Client(api_key=api_key)
+        self.instructions = instructions
+        self.function_mapping = function_mapping
+        self.model = model
+        self.tool = build_tool()
+        self.tool_config = types.GenerateContentConfig(tools=[self.tool])
+        self.plain_config = types.GenerateContentConfig()
+
+    async def choose_function(self, prompt):
+        """
+        Asks Gemini which database function answers the prompt.
+
+        Args:
+            prompt (str): The user's natural language prompt.
+
+        Returns:
+            types.FunctionCall: The chosen function and its arguments.
+        """
+        response = await self.call_model("generate_content", [self.instructions + prompt], self.tool_config)
+        return response.candidates[0].content.parts[0].function_call
+
+    async def generate_text(self, prompt):
+        """
+        Generates a plain text answer (used by ai_analyze).
+
+        Args:
+            prompt (str): The full prompt.
+
+        Returns:
+            str: The model's answer.
+        """
+        response = await self.call_model("ai_analyze", [prompt], self.plain_config)
+        return response.candidates[0].content.parts[0].text.strip()
+
+    async def call_model(self, call, contents, config):
+        """
+        Calls generate_content, recording its latency and errors under `call`.
+        """
+        with span("gemini", call=call, prompt_chars=sum(len(content) for content in contents)), GEMINI_LATENCY.time(call=call):
+            try:
+                return await self.client.aio.models.generate_content(model=self.model, contents=contents, config=config)
+            except Exception:
+                GEMINI_ERRORS.inc(call=call)
+                raise
+
+    async def aclose(self):
+        """
+        Closes the pooled HTTP connections.
+        """
+        aio = getattr(self.client, "aio", None)
+        if aio is not None and hasattr(aio, "aclose"):
+            await aio.aclose()
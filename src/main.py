@@ -1,16 +1,52 @@
 from src.config import gemini_api_key
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query, Path, Body, status
 from fastapi.middleware.cors import CORSMiddleware
-from google import genai
-from google.genai import types
+from fastapi.responses import Response, StreamingResponse
 from src import database_tools
+from src.executor import run_blocking, call_tool
+from src.llm_gateway import LLM_Gateway
+from src.intent_parser import Intent_Parser
+from src.prompt_cache import Prompt_Cache
+from src.analysis_context import build_analysis_context, DEFAULT_TOKEN_BUDGET
+from src.transaction_stream import iter_json, iter_ndjson
+from src.tenants import Ledger_Pool, Ledger_Proxy, TenantMiddleware
+from src.metrics import CONTENT_TYPE, TOOL_CALLS, Gauge, MetricsMiddleware, registry
+from src.tracing import TracingMiddleware, annotate, configure_logging, span
 from datetime import datetime
+import os
+import time
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await llm_gateway.aclose()
+    # Flush and close every resident tenant ledger
+    await run_blocking(ledger_pool.close)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Ledgers are opened per tenant (storage engine chosen by BOOKKEEPING_STORAGE_ENGINE) on first
+# access and kept in a bounded LRU; None is the default ledger used when no tenant is given
+ledger_pool = Ledger_Pool(
+    open_ledger=lambda tenant: database_tools.open_database(tenant=tenant),
+    max_ledgers=int(os.environ.get("BOOKKEEPING_MAX_TENANTS", "64")),
+    max_bytes=int(float(os.environ.get("BOOKKEEPING_TENANT_MEMORY_MB", "512")) * 2**20),
+    idle_seconds=float(os.environ.get("BOOKKEEPING_TENANT_IDLE_SECONDS", "600")),
+)
+
+# Record request latency per route. Added first so it runs innermost and sees the
+# route that matched after TenantMiddleware stripped a /tenants/{tenant_id} prefix.
+app.add_middleware(MetricsMiddleware)
+
+# Select the tenant from the X-Tenant-ID header or a /tenants/{tenant_id}/... path prefix.
+# Added before CORS so it runs inside it and its errors carry CORS headers.
+app.add_middleware(TenantMiddleware, pool=ledger_pool, path_prefixes=("/transactions", "/genai", "/analytics"))
 
 # add CORS middleware
 app.add_middleware(
@@ -19,9 +55,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # allow all HTTP methods
     allow_headers=["*"],  # allow all request headers
+    expose_headers=["X-Request-ID"],
 )
 
-database = database_tools.Database_Tools()
+# Outermost: gives every request an id and logs a sample of request traces as JSON lines
+configure_logging()
+app.add_middleware(TracingMiddleware)
+
+# The current request's ledger; tool functions and routes use it like a single database
+database = Ledger_Proxy(ledger_pool)
+
+# Read when /metrics is scraped
+Gauge(
+    "bookkeeping_ledger_rows", "Records in each resident ledger.", ("tenant",),
+    callback=lambda: {(tenant or "default",): rows for tenant, rows in ledger_pool.row_counts().items()},
+)
+Gauge(
+    "bookkeeping_resident_ledgers", "Ledgers kept in memory by the tenant pool.",
+    callback=lambda: ledger_pool.stats()["resident"],
+)
+
+# Approximate token budget for the data section of ai_analyze prompts
+ANALYSIS_TOKEN_BUDGET = int(os.environ.get("BOOKKEEPING_ANALYSIS_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
 
 gemini_instructions = \
 "You are being used in a bookkeeping personal finance app to perform CRUD operations to a database." \
@@ -33,18 +88,23 @@ gemini_instructions = \
 "update_pay(record_id:int, amount:float=None, note:str=None, category:str=None, date:str=None) -> bool, " \
 "delete_record(record_id:int = None) -> bool, " \
 "get_total_amount_by_type(record_type:str=None) -> float, " \
-"get_monthly_total(record_type:str=None, month:int=None, year:int=None) -> float, " \
-"get_notes_list(record_type:str, month:int, year:int) -> list, " \
-"get_category_list(record_type:str, month:int, year:int) -> list, " \
-"get_average_amount(record_type:str, month:int, year:int) -> float, " \
-"get_transaction_history(record_type:str=None, month:int=None, year:int=None, file_format:str='json') -> Any. " \
-"ai_analyze(record_type:str, month:int, year:int, question:str) -> Any. " \
+"get_monthly_total(record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None) -> float, " \
+"get_notes_list(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None) -> list, " \
+"get_category_list(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None) -> list, " \
+"get_average_amount(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None) -> float, " \
+"get_transaction_history(record_type:str=None, month:int=None, year:int=None, file_format:str='json', start_date:str=None, end_date:str=None) -> Any. " \
+"get_summary(group_by:list, record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None) -> list, " \
+"search_transactions(query:str, record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None, limit:int=50) -> list, " \
+"ai_analyze(record_type:str, month:int, year:int, question:str, start_date:str=None, end_date:str=None) -> Any. " \
 "batch_add_records(records:list) -> dict, " \
+"For breakdowns (e.g. spending by category, totals per month), call get_summary once with group_by from: type, year, month, category. " \
+"To find transactions by what their note says (e.g. all Starbucks purchases), call search_transactions with the words to look for as query. " \
 "For any prompt that doesn't fall into any of the functions above, call the ai_analyze function. " \
 "Make sure to only use the parameters that are needed for the function. " \
 "For delete_record, if the latest record is to be deleted, then record_id should be None or the ID of the record. " \
 "If no user input is provided, use the parameter value None. " \
 "Try to convert relative dates into absolute dates. Example, today equals yyyy-mm-dd. " \
+"For periods that are not a whole month or year (e.g. last 30 days, Q3, since March 15), use start_date and end_date (YYYY-MM-DD, both inclusive) instead of month and year. " \
 "For expenses, use appropriate categories from: Food, Groceries, Transportation, Housing, Entertainment, Shopping, Utilities, Health, Education, Travel, Other. " \
 "For income, use appropriate categories from: Salary, Bonus, Gift, Investment, Refund, Other. " \
 "If the user input contains multiple transactions, use batch_add_records function with array of records. Each record must contain all required fields. " \
@@ -66,7 +126,6 @@ def add_expense(amount:float, note:str, category:str, date:str):
         bool: True if the expense was successfully added to the database, False otherwise.
     """
     # Logic to add expense to the database
-    print(f"add_expense has been called with the following parameters: {str(amount)}, {str(note)}, {str(category)}, {str(date)}")
     return database.insert_data("expense", amount=amount, note=note, category=category, date=date)
 
 
@@ -82,7 +141,6 @@ def add_pay(amount: float, note: str, category: str, date: str):
         bool: True if the payment was successfully added to the database, False otherwise.
     """
     # Logic to add payment to the database
-    print(f"add_pay has been called with the following parameters: {str(amount)}, {str(note)}, {str(category)}, {str(date)}")
     return database.insert_data("pay", amount=amount, note=note, category=category, date=date)
 
 
@@ -99,7 +157,6 @@ def update_expense(record_id:int, amount:float=None, note:str=None, category:str
         bool: True if the update was successful, False otherwise.
     """
     # Logic to update expense in the database
-    print(f"update_expense has been called with the following parameters: {str(record_id)}, {str(amount)}, {str(note)}, {str(category)}, {str(date)}")
     return database.update_data(record_type="expense", record_id=record_id, amount=amount, note=note, category=category, date=date)
 
 
@@ -118,7 +175,6 @@ def update_pay(record_id:int, amount:float=None, note:str=None, category:str=Non
         bool: True if the update was successful, False otherwise.
     """
     # Logic to update payment in the database
-    print(f"update_pay has been called with the following parameters: {str(record_id)}, {str(amount)}, {str(note)}, {str(category)}, {str(date)}")
     return database.update_data(record_type="pay", record_id=record_id, amount=amount, note=note, category=category, date=date)
 
 
@@ -133,7 +189,6 @@ def delete_record(record_id:int = None):
         bool: True if the record was successfully deleted, False otherwise.
     """
     # Logic to delete expense from the database
-    print(f"delete_record has been called with the following parameters: {str(record_id)}")
     return database.delete_data(record_id=record_id)
 
 
@@ -154,26 +209,26 @@ def get_total_amount_by_type(record_type:str=None):
             if no type is specified.
     """
     # Logic to get total amount by type from the database
-    print(f"get_total_amount_by_type has been called with the following parameters: {str(record_type)}")
     return database.calculate_total_amount(record_type=record_type)
 
 
-def get_monthly_total(record_type:str=None, month:int=None, year:int=None):
+def get_monthly_total(record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None):
     """
     Args:
         record_type (str, optional): The type of record to filter by (e.g., "expense", "income"). Defaults to None.
         month (int, optional): The month for which the total is calculated (1 for January, 12 for December). Defaults to None.
         year (int, optional): The year for which the total is calculated. Defaults to None.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
 
     Returns:
         float: The total amount of expenses for the specified month and year.
     """
     # Logic to get monthly total from the database
-    print(f"get_monthly_total has been called with the following parameters: {str(record_type)}, {str(month)}, {str(year)}")
-    return database.calculate_monthly_total(record_type=record_type, month=month, year=year)
+    return database.calculate_monthly_total(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
 
 
-def get_notes_list(record_type:str, month:int, year:int):
+def get_notes_list(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None):
     """
     Retrieves a list of notes from the database based on the specified record type, month, and year.
 
@@ -181,16 +236,17 @@ def get_notes_list(record_type:str, month:int, year:int):
         record_type (str): The type of record to filter the notes (e.g., 'expense', 'pay').
         month (int): The month for which to retrieve the notes (1-12).
         year (int): The year for which to retrieve the notes.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
 
     Returns:
         list: A list of notes retrieved from the database matching the specified criteria.
     """
     # Logic to get note list from the database
-    print(f"get_source_list has been called with the following parameters: {str(record_type)}, {str(month)}, {str(year)}")
-    return database.list_notes(record_type=record_type, month=month, year=year)
+    return database.list_notes(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
 
 
-def get_category_list(record_type:str, month:int, year:int):
+def get_category_list(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None):
     """
     Retrieves a list of categories from the database based on the specified record type, month, and year.
 
@@ -198,16 +254,17 @@ def get_category_list(record_type:str, month:int, year:int):
         record_type (str): The type of record to filter the categories (e.g., 'expense', 'pay').
         month (int): The month for which to retrieve the categories (1-12).
         year (int): The year for which to retrieve the categories.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
 
     Returns:
         list: A list of categories retrieved from the database matching the specified criteria.
     """
     # Logic to get category list from the database
-    print(f"get_category_list has been called with the following parameters: {str(record_type)}, {str(month)}, {str(year)}")
-    return database.list_categories(record_type=record_type, month=month, year=year)
+    return database.list_categories(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
 
 
-def get_average_amount(record_type:str, month:int, year:int):
+def get_average_amount(record_type:str, month:int, year:int, start_date:str=None, end_date:str=None):
     """
     Calculate the average amount of expenses for a specific record type, month, and year.
 
@@ -215,6 +272,8 @@ def get_average_amount(record_type:str, month:int, year:int):
         record_type (str): The type of record to filter by (e.g., "expense", "income").
         month (int): The month for which to calculate the average (1 for January, 12 for December).
         year (int): The year for which to calculate the average.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
 
     Returns:
         float: The average amount of the specified record type for the given month and year.
@@ -224,11 +283,10 @@ def get_average_amount(record_type:str, month:int, year:int):
         DatabaseError: If there is an issue querying the database.
     """
     # Logic to get average amount from the database
-    print(f"get_average_amount has been called with the following parameters: {str(record_type)}, {str(month)}, {str(year)}")
-    return database.calculate_average_amount(record_type=record_type, month=month, year=year)
+    return database.calculate_average_amount(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
 
 
-def get_transaction_history(record_type:str=None, month:int=None, year:int=None, file_format:str="list"):
+def get_transaction_history(record_type:str=None, month:int=None, year:int=None, file_format:str="list", start_date:str=None, end_date:str=None):
     """
     Retrieves the transaction history from the database based on the specified parameters.
 
@@ -236,6 +294,8 @@ def get_transaction_history(record_type:str=None, month:int=None, year:int=None,
         record_type (str, optional): The type of transaction records to retrieve (e.g., "income", "expense").
         month (int, optional): The month for which to retrieve transaction history (1-12).
         year (int, optional): The year for which to retrieve transaction history.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
         file_format (str, optional): The format in which to export the data (default is "json").
 
     Returns:
@@ -246,11 +306,55 @@ def get_transaction_history(record_type:str=None, month:int=None, year:int=None,
         DatabaseError: If there is an issue accessing the database.
     """
     # Logic to get transaction history from the database
-    print(f"get_transaction_history has been called with the following parameters: {str(record_type)}{str(month)}, {str(year)}, {str(file_format)}")
-    return database.export_data(file_format=file_format, record_type=record_type, month=month, year=year)
+    return database.export_data(file_format=file_format, record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+
+def get_summary(group_by:list=None, record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None):
+    """
+    Breaks the records down into groups and returns the total, count and average amount of each.
+
+    Args:
+        group_by (list, optional): Any of "type", "year", "month" and "category". Defaults to category.
+        record_type (str, optional): The type of record to filter by (e.g., "expense", "pay").
+        month (int, optional): The month to summarize (1-12).
+        year (int, optional): The year to summarize.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+    Returns:
+        list: One entry per group with its values, total, count and average.
+    """
+    # Logic to get grouped totals from the database
+    return database.summarize(
+        group_by=group_by or ["category"], record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date
+    )
 
 
-def ai_analyze(question: str, record_type:str=None, month:int=None, year:int=None):
+def search_transactions(query:str, record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None, limit:int=50):
+    """
+    Finds the transactions whose notes contain every word of the query, newest first.
+
+    Args:
+        query (str): Words to look for in the notes (e.g., "starbucks").
+        record_type (str, optional): The type of record to filter by (e.g., "expense", "pay").
+        month (int, optional): The month to search (1-12).
+        year (int, optional): The year to search.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
+        limit (int, optional): Maximum number of transactions to return.
+
+    Returns:
+        list: The matching transactions.
+    """
+    # Logic to search the notes through the ledger's note index
+    frame, positions = database.search_notes(
+        query, record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date,
+        limit=int(limit) if limit else None,
+    )
+    return database.to_external(frame.iloc[positions]).to_dict(orient="records")
+
+
+async def ai_analyze(question: str, record_type:str=None, month:int=None, year:int=None, start_date:str=None, end_date:str=None):
     """
     Retrieves transaction history and analyzes it using Gemini AI.
 
@@ -258,40 +362,36 @@ def ai_analyze(question: str, record_type:str=None, month:int=None, year:int=Non
         record_type (str): The type of transaction records to retrieve (e.g., "income", "expense").
         month (int): The month for which to retrieve transaction history (1-12).
         year (int): The year for which to retrieve transaction history.
+        start_date (str, optional): First date to include (YYYY-MM-DD).
+        end_date (str, optional): Last date to include (YYYY-MM-DD).
         question (str): The question to analyze the transaction data.
 
     Returns:
         dict: The analysis result from Gemini AI.
     """
-    print(f"ai_analyze has been called with the following parameters: {str(record_type)}, {str(month)}, {str(year)}, {str(question)}")
 
-    # Retrieve transaction history
-    transaction_history = database.export_data(
-        file_format="csv", record_type=record_type, month=month, year=year
+    # Send the rows themselves only when they fit the budget, otherwise aggregates plus relevant rows
+    context = await run_blocking(
+        build_analysis_context, database, question,
+        record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date,
+        token_budget=ANALYSIS_TOKEN_BUDGET,
     )
 
-    if not transaction_history:
+    if context is None:
         raise HTTPException(status_code=404, detail="No transaction history found.")
-
-    # Set up the client
-    client = genai.Client(api_key=gemini_api_key)
+    annotate(context_chars=len(context))
 
     # Prepare the prompt for analysis
     analysis_prompt = (
-        f"Here is the transaction history in CSV format: {transaction_history}\n"
+        f"{context}\n"
         f"Question: {question}\n"
         f"Provide a detailed analysis based on the data that answers the prompted question."
     )
 
-    # Generate content using the model
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[analysis_prompt],
-        config=types.GenerateContentConfig(),
-    )
+    # Generate content using the shared gateway without blocking the event loop
+    analysis_result = await llm_gateway.generate_text(analysis_prompt)
 
     # Return the analysis result
-    analysis_result = response.candidates[0].content.parts[0].text.strip()
     return {"status": "success", "analysis": analysis_result}
 
 
@@ -306,7 +406,7 @@ def batch_add_records(records):
     Returns:
         dict: 包含操作结果和添加的记录ID列表
     """
-    print(f"batch_add_records has been called with {len(records)} records")
+    annotate(records=len(records))
     try:
         # 确保所有数值都是Python原生类型
         for record in records:
@@ -323,245 +423,24 @@ def batch_add_records(records):
         return {"status": "error", "message": str(e)}
 
 
-@app.get("/")
-async def root():
-    return {"message": "Hello World..."}
+# Load tests set BOOKKEEPING_FAKE_GEMINI_MS to answer with scripted calls after a simulated latency
+FAKE_GEMINI_MS = os.environ.get("BOOKKEEPING_FAKE_GEMINI_MS")
+fake_gemini_client = None
+if FAKE_GEMINI_MS:
+    # The stand-in lives with the benchmarks, so it is only imported when asked for
+    from benchmarks.fake_genai import FakeGeminiClient
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
-
-
-@app.get("/genai/{prompt}")
-async def genai_api(prompt:str, max_output_tokens:int=512):
-    """
-    Generate text using Google GenAI API.
-    """
-    # Set up the client
-    client = genai.Client(
-        api_key=gemini_api_key,
-    )
-
-    # 添加批量添加函数声明
-    # Create a function declaration for the tool
-    function_batch_add = types.FunctionDeclaration(
-        name="batch_add_records",
-        description="批量添加多条交易记录。",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "records": types.Schema(
-                    type="ARRAY",
-                    description="包含多条记录数据的列表，每条记录需包含type, amount, note, category, date",
-                    items=types.Schema(
-                        type="OBJECT",
-                        properties={
-                            "type": types.Schema(type="STRING", description="记录类型 ('expense' 或 'pay')"),
-                            "amount": types.Schema(type="NUMBER", description="交易金额"),
-                            "note": types.Schema(type="STRING", description="交易说明"),
-                            "category": types.Schema(type="STRING", description="交易分类"),
-                            "date": types.Schema(type="STRING", description="交易日期")
-                        },
-                        required=["type", "amount", "note", "category", "date"]
-                    )
-                )
-            },
-            required=["records"]
-        )
-    )
-    function_add_expense = types.FunctionDeclaration(
-        name="add_expense",
-        description="Add an expense to the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "amount": types.Schema(type="NUMBER", description="The amount of the expense."),
-                "note": types.Schema(type="STRING", description="The note describing the expense."),
-                "category": types.Schema(type="STRING", description="The category of the expense."),
-                "date": types.Schema(type="STRING", description="The date of the expense."),
-            },
-            required=["amount", "note", "category", "date"],
-        ),
-    )
-    function_add_pay = types.FunctionDeclaration(
-        name="add_pay",
-        description="Add a payment to the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "amount": types.Schema(type="NUMBER", description="The amount of the payment."),
-                "note": types.Schema(type="STRING", description="The note describing the payment."),
-                "category": types.Schema(type="STRING", description="The category of the payment."),
-                "date": types.Schema(type="STRING", description="The date of the expense."),
-            },
-            required=["amount", "note", "category", "date"],
-        ),
-    )
-    function_update_expense = types.FunctionDeclaration(
-        name="update_expense",
-        description="Update an existing expense in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_id": types.Schema(type="NUMBER", description="The ID of the record to update."),
-                "amount": types.Schema(type="NUMBER", description="The new amount of the expense."),
-                "note": types.Schema(type="STRING", description="The new note for the expense."),
-                "category": types.Schema(type="STRING", description="The new category of the expense."),
-                "date": types.Schema(type="STRING", description="The new date of the expense."),
-            },
-            required=["record_id"],
-        ),
-    )
-    function_update_pay = types.FunctionDeclaration(
-        name="update_pay",
-        description="Update an existing payment in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_id": types.Schema(type="NUMBER", description="The ID of the record to update."),
-                "amount": types.Schema(type="NUMBER", description="The new amount of the payment."),
-                "note": types.Schema(type="STRING", description="The new note for the payment."),
-                "category": types.Schema(type="STRING", description="The new category of the payment."),
-                "date": types.Schema(type="STRING", description="The new date of the payment."),
-            },
-            required=["record_id"],
-        ),
-    )
-    function_delete_record = types.FunctionDeclaration(
-        name="delete_record",
-        description="Delete a record from the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_id": types.Schema(type="NUMBER", description="The ID of the record to delete."),
-            },
-            required=[],
-        ),
-    )
-    function_get_total_amount = types.FunctionDeclaration(
-        name="get_total_amount_by_type",
-        description="Get the total amount of a record type in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-            },
-            required=[],
-        ),
-    )
-    function_get_monthly_total = types.FunctionDeclaration(
-        name="get_monthly_total",
-        description="Get the total amount of expenses for a specific month in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to get the total."),
-                "year": types.Schema(type="NUMBER", description="The year for which to get the total."),
-            },
-            required=[],
-        ),
-    )
-    function_get_source_list = types.FunctionDeclaration(
-        name="get_source_list",
-        description="Get the list of notes from the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to get the notes."),
-                "year": types.Schema(type="NUMBER", description="The year for which to get the notes."),
-            },
-            required=[],
-        ),
-    )
-    function_get_category_list = types.FunctionDeclaration(
-        name="get_category_list",
-        description="Get the list of categories from the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to get the categories."),
-                "year": types.Schema(type="NUMBER", description="The year for which to get the categories."),
-            },
-            required=[],
-        ),
-    )
-    function_get_average_amount = types.FunctionDeclaration(
-        name="get_average_amount",
-        description="Get the average amount of expenses for a specific month in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to get the average."),
-                "year": types.Schema(type="NUMBER", description="The year for which to get the average."),
-            },
-            required=[],
-        ),
-    )
-    function_get_transaction_history = types.FunctionDeclaration(
-        name="get_transaction_history",
-        description="Get the transaction history for a specific month in the database.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "file_format": types.Schema(type="STRING", description="The format in which to export the data (default is 'json')."),
-                "record_type": types.Schema(type="STRING", description="The type of the record ('expense' or 'pay')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to get the transaction history."),
-                "year": types.Schema(type="NUMBER", description="The year for which to get the transaction history."),
-            },
-            required=[],
-        ),
+    fake_gemini_client = FakeGeminiClient(
+        latency_ms=float(FAKE_GEMINI_MS),
+        jitter=float(os.environ.get("BOOKKEEPING_FAKE_GEMINI_JITTER", "0.5")),
     )
-    function_ai_analyze = types.FunctionDeclaration(
-        name="ai_analyze",
-        description="Analyze transaction history using AI.",
-        parameters=types.Schema(
-            type="OBJECT",
-            properties={
-                "question": types.Schema(type="STRING", description="The question to analyze the transaction data."),
-                "record_type": types.Schema(type="STRING", description="The type of transaction records to retrieve (e.g., 'income', 'expense')."),
-                "month": types.Schema(type="NUMBER", description="The month for which to retrieve transaction history (1-12)."),
-                "year": types.Schema(type="NUMBER", description="The year for which to retrieve transaction history."),
-            },
-            required=["question"],
-        ),
-    )
-    tool = types.Tool(function_declarations=[
-        function_batch_add,
-        function_add_expense, 
-        function_add_pay,
-        function_update_expense,
-        function_update_pay,
-        function_delete_record,
-        function_get_total_amount,
-        function_get_monthly_total,
-        function_get_source_list,
-        function_get_category_list,
-        function_get_average_amount,
-        function_get_transaction_history,
-        function_ai_analyze
-    ])
-
-
-    # Generate content using the model
-    response = client.models.generate_content(
-        model="gemini-2.0-flash", 
-        contents = [gemini_instructions + prompt],
-        config=types.GenerateContentConfig(
-            tools =[
-                tool,
-            ]
-        ),
-    )
-    
-    # check if response.function_calls exists
-    print(f"response.function_call[0]: {response.function_calls[0]}")
 
-    # Define a mapping of function names to their corresponding handlers
-    function_mapping = {
+# Built once at startup: one pooled Gemini client, the prebuilt tool set and the dispatch table
+llm_gateway = LLM_Gateway(
+    api_key=gemini_api_key,
+    client=fake_gemini_client,
+    instructions=gemini_instructions,
+    function_mapping={
         "batch_add_records": batch_add_records,
         "add_expense": add_expense,
         "add_pay": add_pay,
@@ -574,24 +453,122 @@ async def genai_api(prompt:str, max_output_tokens:int=512):
         "get_category_list": get_category_list,
         "get_average_amount": get_average_amount,
         "get_transaction_history": get_transaction_history,
+        "get_summary": get_summary,
+        "search_transactions": search_transactions,
         "ai_analyze": ai_analyze,
-    }
-    
-    # Call the function based on the response
-    function_call = response.candidates[0].content.parts[0].function_call
-    function_name = function_call.name
-    function_args = function_call.args
+    },
+)
+
+
+# Prompts the local parser maps with at least this confidence skip the Gemini round-trip
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("BOOKKEEPING_INTENT_THRESHOLD", "0.8"))
+intent_parser = Intent_Parser()
+
+# Read-only prompts repeat from dashboards and retries; reuse Gemini's answer for them
+prompt_cache = Prompt_Cache(
+    max_entries=int(os.environ.get("BOOKKEEPING_PROMPT_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("BOOKKEEPING_PROMPT_CACHE_TTL", "300")),
+)
+
+# Requests and cumulative latency per resolution path, to measure the local hit rate
+genai_path_stats = {
+    "local": {"requests": 0, "total_ms": 0.0},
+    "cache": {"requests": 0, "total_ms": 0.0},
+    "gemini": {"requests": 0, "total_ms": 0.0},
+}
+
+
+@app.get("/")
+async def root():
+    return {"message": "Hello World..."}
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok"}
+
+
+@app.get("/genai/{prompt}")
+async def genai_api(prompt:str, max_output_tokens:int=512):
+    """
+    Generate text using Google GenAI API.
+    """
+    start = time.perf_counter()
+    function_mapping = llm_gateway.function_mapping
+
+    # Try the local rule-based parser first; only uncertain prompts go to Gemini
+    intent = intent_parser.parse(prompt)
+    if intent is not None and intent.confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        path = "local"
+        function_name = intent.name
+        function_args = intent.args
+        annotate(intent_confidence=intent.confidence)
+    elif (cached := prompt_cache.get(prompt)) is not None:
+        path = "cache"
+        function_name, function_args = cached
+    else:
+        path = "gemini"
+        # Ask Gemini which database function to call, using the shared gateway
+        function_call = await llm_gateway.choose_function(prompt)
+
+        # Call the function based on the response (Gemini may answer with text instead)
+        function_name = function_call.name if function_call else None
+        function_args = function_call.args if function_call else {}
+        if function_name in function_mapping:
+            prompt_cache.put(prompt, function_name, function_args)
     
+    annotate(resolution=path, function=function_name)
     if function_name in function_mapping:
-        print(f"Function call: {function_name}")
-        print(f"Function content: {function_args}")
-        result = function_mapping[function_name](**function_args)
-        print(result)
-        return {"status": "success", "result": result}
+        TOOL_CALLS.inc(function=function_name, path=path)
+        with span("dispatch", function=function_name, args=function_args):
+            result = await call_tool(function_mapping[function_name], function_args)
+            annotate(result=result)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        genai_path_stats[path]["requests"] += 1
+        genai_path_stats[path]["total_ms"] += elapsed_ms
+        return {"status": "success", "result": result, "path": path, "elapsed_ms": round(elapsed_ms, 2)}
     else:
         raise HTTPException(status_code=400, detail="Invalid function call")
 
 
+@app.get("/stats/genai")
+async def genai_stats():
+    """
+    Reports how many /genai prompts were resolved locally, from the prompt cache
+    or by Gemini, their average latency, and the prompt cache counters.
+    """
+    total = sum(stats["requests"] for stats in genai_path_stats.values())
+    paths = {
+        path: {
+            "requests": stats["requests"],
+            "avg_ms": round(stats["total_ms"] / stats["requests"], 2) if stats["requests"] else None,
+        }
+        for path, stats in genai_path_stats.items()
+    }
+    return {
+        "local_hit_rate": round(genai_path_stats["local"]["requests"] / total, 4) if total else None,
+        "paths": paths,
+        "cache": prompt_cache.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Exposes request, Gemini, tool dispatch and storage metrics in the Prometheus text format.
+    """
+    # Counting SQLite ledgers' rows queries the database; keep it off the event loop
+    return Response(await run_blocking(registry.render), media_type=CONTENT_TYPE)
+
+
+@app.get("/stats/ledgers")
+async def ledger_stats():
+    """
+    Reports the resident tenant ledgers, their estimated memory and the
+    load/eviction counters of the ledger pool.
+    """
+    return ledger_pool.stats()
+
+
 # Define Pydantic models for API requests and responses
 class TransactionBase(BaseModel):
     """Base model for transaction data"""
@@ -623,71 +600,126 @@ class ResponseModel(BaseModel):
     data: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = Field(None, description="Response data")
     message: Optional[str] = Field(None, description="Response message")
     timestamp: Optional[str] = Field(None, description="Response timestamp in ISO format")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page (keyset pagination only)")
+
+# Page size for keyset pagination when no limit is given
+DEFAULT_PAGE_SIZE = 100
 
 # API endpoints for direct database operations
 @app.get("/transactions", response_model=ResponseModel, status_code=status.HTTP_200_OK)
 async def get_transactions(
     year: Optional[int] = Query(None, description="Filter by year"),
     month: Optional[int] = Query(None, description="Filter by month (1-12)"),
+    start_date: Optional[str] = Query(None, description="First date to include (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last date to include (YYYY-MM-DD)"),
     limit: Optional[int] = Query(None, description="Maximum number of transactions to return"),
-    offset: Optional[int] = Query(None, description="Number of transactions to skip")
+    offset: Optional[int] = Query(None, description="Number of transactions to skip"),
+    output_format: str = Query("json", alias="format", description="'json' for the standard envelope, 'ndjson' for one transaction per line"),
+    cursor: Optional[str] = Query(None, description="Keyset pagination: next_cursor of the previous page, or empty for the first page"),
+    descending: bool = Query(False, description="Keyset pagination: newest transactions first")
 ):
     """
     Retrieve all transactions with optional filtering.
+
+    Year/month filters and start_date/end_date ranges are looked up by binary
+    search in the ledger's date index, so they cost O(log n + k) for k matches.
+
+    The page is selected before any row is formatted and the response is streamed
+    in chunks, so memory use depends on the chunk size rather than the ledger size.
+
+    Passing `cursor` switches from offset pagination (id order) to keyset
+    pagination ordered by (date, id): the response carries a `next_cursor` to pass
+    back for the following page, and `offset` is ignored.
     
     Args:
         year: Optional filter by year
         month: Optional filter by month (1-12)
+        start_date: Optional first date to include (inclusive)
+        end_date: Optional last date to include (inclusive)
         limit: Maximum number of transactions to return
         offset: Number of transactions to skip (for pagination)
+        output_format: 'json' (default) or 'ndjson'
+        cursor: Cursor of the previous page ('' for the first page)
+        descending: Order keyset pages newest first
         
     Returns:
         List of transactions matching the filter criteria
     """
+    if output_format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Please choose 'json' or 'ndjson'.")
+    if (offset is not None and offset < 0) or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="limit and offset must not be negative.")
+    next_cursor = None
     try:
-        # Get data from database
-        data = database.export_data(file_format="json", year=year, month=month)
-        
-        # Convert to Python objects
-        import json
-        transactions = json.loads(data)
-        
-        # Apply pagination if requested
-        if offset is not None:
-            transactions = transactions[offset:]
-        if limit is not None:
-            transactions = transactions[:limit]
-            
-        # Format the response
-        for transaction in transactions:
-            # Convert date from YYYY-MM-DD to MM.DD.YYYY
-            date_obj = datetime.strptime(transaction['date'], '%Y-%m-%d')
-            transaction['date'] = date_obj.strftime('%m.%d.%Y')
-            
-            # Add day of week
-            transaction['day'] = date_obj.strftime('%a')
-            
-            # Ensure amount is a float (already handled in database export but double-check)
-            transaction['amount'] = float(transaction['amount'])
-            
-            # Ensure ID is an integer
-            transaction['id'] = int(transaction['id'])
-            
-            # Rename fields to match the expected format
-            if 'note' not in transaction and 'source' in transaction:
-                transaction['note'] = transaction.pop('source')
-                
-        return {
-            "success": True,
-            "data": transactions,
-            "timestamp": datetime.now().isoformat()
-        }
+        # Select the page by position; rows are only materialised chunk by chunk while streaming
+        if cursor is not None:
+            frame, positions, next_cursor = await run_blocking(
+                database.query_page, limit or DEFAULT_PAGE_SIZE, cursor=cursor, year=year, month=month,
+                descending=descending, start_date=start_date, end_date=end_date,
+            )
+        else:
+            frame, positions = await run_blocking(
+                database.select_rows, year=year, month=month, offset=offset, limit=limit, start_date=start_date, end_date=end_date
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve transactions: {str(e)}"
         )
 
+    if output_format == "ndjson":
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return StreamingResponse(iter_ndjson(frame, positions), media_type="application/x-ndjson", headers=headers)
+    return StreamingResponse(
+        iter_json(frame, positions, datetime.now().isoformat(), next_cursor=next_cursor), media_type="application/json"
+    )
+
+@app.get("/transactions/search", response_model=ResponseModel, status_code=status.HTTP_200_OK)
+async def search_transactions_route(
+    q: str = Query(..., description="Words to find in the notes; the last one also matches as a prefix unless q ends in a space"),
+    record_type: Optional[str] = Query(None, alias="type", description="Filter by record type ('expense' or 'pay')"),
+    year: Optional[int] = Query(None, description="Filter by year"),
+    month: Optional[int] = Query(None, description="Filter by month (1-12)"),
+    start_date: Optional[str] = Query(None, description="First date to include (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last date to include (YYYY-MM-DD)"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, description="Maximum number of transactions to return")
+):
+    """
+    Search transactions by the words of their notes, newest first.
+
+    Words are matched by stem ("coffees" finds "Coffee") through an inverted
+    index over the notes, and the last word also as a prefix, so the endpoint
+    can serve search-as-you-type. Only the matching transactions are read.
+
+    Args:
+        q: The search text, e.g. "starbucks"
+        record_type: Optional filter by record type
+        year: Optional filter by year
+        month: Optional filter by month (1-12)
+        start_date: Optional first date to include (inclusive)
+        end_date: Optional last date to include (inclusive)
+        limit: Maximum number of transactions to return
+
+    Returns:
+        The matching transactions, newest first
+    """
+    try:
+        frame, positions = await run_blocking(
+            database.search_notes, q, record_type=record_type, month=month, year=year,
+            start_date=start_date, end_date=end_date, limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search transactions: {str(e)}"
+        )
+
+    return StreamingResponse(iter_json(frame, positions, datetime.now().isoformat()), media_type="application/json")
+
 @app.post("/transactions", response_model=ResponseModel, status_code=status.HTTP_201_CREATED)
 async def add_transaction(transaction: TransactionCreate):
     """
@@ -708,7 +740,8 @@ async def add_transaction(transaction: TransactionCreate):
         date_str = date_obj.strftime('%Y-%m-%d')
         
         # Insert data into database
-        result = database.insert_data(
+        result = await run_blocking(
+            database.insert_data,
             record_type=record_type,
             amount=abs(transaction.amount),  # Database will handle the sign
             note=transaction.note,
@@ -722,7 +755,7 @@ async def add_transaction(transaction: TransactionCreate):
         if id_match:
             transaction_id = int(id_match.group(1))
         else:
-            transaction_id = database.data['id'].max()
+            transaction_id = database.next_id - 1
         
         # Create response with the new transaction including ID
         new_transaction = {
@@ -760,47 +793,52 @@ async def update_transaction(
     Returns:
         Updated transaction
     """
-    try:
-        # Get the existing transaction to determine if it's pay or expense
-        if id not in database.data['id'].values:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Transaction with ID {id} not found"
+    def apply_update():
+        # Runs on the database thread pool; the writer lock makes the read-modify-write atomic
+        with database.write_lock:
+            # Get the existing transaction to determine if it's pay or expense
+            if not database.has_record(id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Transaction with ID {id} not found"
+                )
+            
+            existing_record = database.get_record(id)
+            record_type = existing_record['type']
+            
+            # Process date if provided
+            date_str = None
+            if transaction.date:
+                date_obj = datetime.strptime(transaction.date, '%m.%d.%Y')
+                date_str = date_obj.strftime('%Y-%m-%d')
+            
+            # Process amount if provided
+            amount = None
+            if transaction.amount is not None:
+                amount = abs(transaction.amount)
+                # If amount sign changed, update record type
+                if (transaction.amount > 0 and record_type == 'expense') or \
+                   (transaction.amount < 0 and record_type == 'pay'):
+                    record_type = "pay" if transaction.amount > 0 else "expense"
+            
+            # Update the record
+            database.update_data(
+                record_id=id,
+                record_type=record_type,
+                amount=amount,
+                note=transaction.note,
+                category=transaction.category,
+                date=date_str
             )
+            
+            # Get the updated record
+            return database.get_record(id).copy()
+
+    try:
+        updated_record = await run_blocking(apply_update)
         
-        existing_record = database.data[database.data['id'] == id].iloc[0]
-        record_type = existing_record['type']
-        
-        # Process date if provided
-        date_str = None
-        if transaction.date:
-            date_obj = datetime.strptime(transaction.date, '%m.%d.%Y')
-            date_str = date_obj.strftime('%Y-%m-%d')
-        
-        # Process amount if provided
-        amount = None
-        if transaction.amount is not None:
-            amount = abs(transaction.amount)
-            # If amount sign changed, update record type
-            if (transaction.amount > 0 and record_type == 'expense') or \
-               (transaction.amount < 0 and record_type == 'pay'):
-                record_type = "pay" if transaction.amount > 0 else "expense"
-        
-        # Update the record
-        database.update_data(
-            record_id=id,
-            record_type=record_type,
-            amount=amount,
-            note=transaction.note,
-            category=transaction.category,
-            date=date_str
-        )
-        
-        # Get the updated record
-        updated_record = database.data[database.data['id'] == id].iloc[0]
-        
-        # Format the response
-        date_obj = datetime.strptime(updated_record['date'], '%Y-%m-%d')
+        # Format the response (dates are held as Timestamps in memory)
+        date_obj = updated_record['date']
         
         updated_transaction = {
             "id": int(updated_record['id']),
@@ -835,16 +873,20 @@ async def delete_transaction(id: int = Path(..., description="Transaction ID")):
     Returns:
         Success message
     """
+    def apply_delete():
+        with database.write_lock:
+            # Check if transaction exists
+            if not database.has_record(id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Transaction with ID {id} not found"
+                )
+            
+            # Delete the transaction
+            database.delete_data(record_id=id)
+
     try:
-        # Check if transaction exists
-        if id not in database.data['id'].values:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Transaction with ID {id} not found"
-            )
-        
-        # Delete the transaction
-        database.delete_data(record_id=id)
+        await run_blocking(apply_delete)
         
         return {
             "success": True,
@@ -856,4 +898,48 @@ async def delete_transaction(id: int = Path(..., description="Transaction ID")):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete transaction: {str(e)}"
-        )
\ No newline at end of file
+        )
+@app.get("/analytics/summary", response_model=ResponseModel, status_code=status.HTTP_200_OK)
+async def get_summary_route(
+    group_by: List[str] = Query(["category"], description="Dimensions to group by: type, year, month, category (repeat or comma-separate)"),
+    record_type: Optional[str] = Query(None, alias="type", description="Filter by record type ('expense' or 'pay')"),
+    year: Optional[int] = Query(None, description="Filter by year"),
+    month: Optional[int] = Query(None, description="Filter by month (1-12)"),
+    start_date: Optional[str] = Query(None, description="First date to include (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Last date to include (YYYY-MM-DD)")
+):
+    """
+    Summarize transactions by any combination of type, year, month and category.
+
+    Every group's total, count and average come from one grouped pass over the
+    ledger, so a breakdown costs the same as a single total.
+
+    Args:
+        group_by: Dimensions to group by, e.g. group_by=category&group_by=month or group_by=category,month
+        record_type: Optional filter by record type
+        year: Optional filter by year
+        month: Optional filter by month (1-12)
+        start_date: Optional first date to include (inclusive)
+        end_date: Optional last date to include (inclusive)
+
+    Returns:
+        One entry per group with its dimension values, total, count and average
+    """
+    try:
+        summary = await run_blocking(
+            database.summarize, group_by=",".join(group_by), record_type=record_type, month=month, year=year,
+            start_date=start_date, end_date=end_date,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to summarize transactions: {str(e)}"
+        )
+
+    return {
+        "success": True,
+        "data": summary,
+        "timestamp": datetime.now().isoformat()
+    }
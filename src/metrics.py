@@ -0,0 +1,267 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; up to 30s because Gemini calls can take that long.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+
+class Registry:
+    """
+    The metrics exposed at /metrics, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered.")
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+
+class Metric:
+    """
+    Base of the metric types: a name, help text and label names, with one
+    value per combination of label values.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, help, labels=(), registry=registry):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def key(self, labels):
+        """
+        Returns the label values in declaration order.
+
+        Raises:
+            ValueError: If the label names differ from the declared ones.
+        """
+        if len(labels) != len(self.labels) or any(name not in labels for name in self.labels):
+            raise ValueError(f"Metric '{self.name}' takes the labels {self.labels}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. requests or bytes written.
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self.key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in values]
+
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With a callback it is read at scrape time:
+    the callback returns a number, or for labeled gauges a dict that maps
+    tuples of label values to numbers.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), registry=registry, callback=None):
+        super().__init__(name, help, labels, registry)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.callback is not None:
+            values = self.callback()
+            items = values.items() if self.labels else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in items]
+
+
+
+class Histogram(Metric):
+    """
+    Counts observations (e.g. latencies in seconds) in cumulative buckets and
+    keeps their sum, so quantiles can be estimated by Prometheus.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), registry=registry, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the +Inf bucket last, then the sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the seconds spent in the with-block, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self.key(labels))
+        return sum(state[0]) if state else 0
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+
+# Shared by the engines and routes; defined here so every module records into the same series.
+REQUEST_LATENCY = Histogram(
+    "bookkeeping_http_request_duration_seconds", "Latency of HTTP requests by route.", ("method", "route", "status")
+)
+GEMINI_LATENCY = Histogram(
+    "bookkeeping_gemini_request_duration_seconds",
+    "Latency of Gemini calls: generate_content picks a function, ai_analyze writes an analysis.", ("call",)
+)
+GEMINI_ERRORS = Counter("bookkeeping_gemini_errors_total", "Gemini calls that raised.", ("call",))
+TOOL_CALLS = Counter(
+    "bookkeeping_tool_calls_total", "Functions dispatched from /genai, by how the prompt was resolved.", ("function", "path")
+)
+SAVE_LATENCY = Histogram("bookkeeping_save_database_seconds", "Duration of save_database.", ("engine",))
+BYTES_WRITTEN = Counter(
+    "bookkeeping_storage_bytes_written_total",
+    "Bytes written by journal appends (target=journal), snapshots, compactions and exports (target=snapshot) "
+    "and WAL checkpoints (target=checkpoint).", ("engine", "target")
+)
+# Journal appends take microseconds unless they fsync, so the buckets start lower than the default.
+WRITE_LATENCY = Histogram(
+    "bookkeeping_storage_write_seconds",
+    "Duration of journal appends, including the fsync in sync mode (target=journal), "
+    "and of the background fsyncs of group and async mode (target=journal_fsync).", ("engine", "target"),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records every HTTP request's latency (including a
+    streamed body) under its route template, e.g. /transactions/{id}, so the
+    label set stays small. Requests that match no route are labeled
+    "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
@@ -0,0 +1,233 @@
+import bisect
+import functools
+
+import numpy as np
+import pandas as pd
+from nltk.stem import PorterStemmer
+from nltk.tokenize import wordpunct_tokenize
+
+_stemmer = PorterStemmer()
+
+
+@functools.lru_cache(maxsize=65536)
+def note_words(note):
+    """
+    Splits a note into its distinct lowercase words, dropping punctuation.
+    Ledgers repeat the same notes, so results are cached.
+
+    Returns:
+        tuple: The words in order of first appearance.
+    """
+    if not isinstance(note, str):
+        return ()
+    return tuple(dict.fromkeys(w for w in wordpunct_tokenize(note.lower()) if w.isalnum()))
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    return _stemmer.stem(word)
+
+
+def query_terms(query):
+    """
+    Splits a search query into words. Unless the query ends in a space or
+    punctuation, its last word may still be being typed and is matched as a
+    prefix.
+
+    Returns:
+        tuple: (words, prefix), the complete words and the unfinished last word (None if there is none).
+    """
+    words = [w for w in wordpunct_tokenize(str(query).lower()) if w.isalnum()]
+    if words and str(query)[-1:].isalnum():
+        return words[:-1], words[-1]
+    return words, None
+
+
+def prefix_end(prefix):
+    """
+    Returns the smallest string greater than every string starting with prefix.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class NoteIndex:
+    """
+    Inverted index over the words of the ledger's notes, so notes are searched
+    without scanning every row. Words are matched by their Porter stem
+    ("coffees" finds "Coffee"), and the last word of a query by prefix as well,
+    so results can be served as the user types.
+
+    `postings` maps each word to the sorted int64 ids of the records whose note
+    contains it, and `words` keeps the vocabulary sorted for prefix lookups.
+    Arrays, sets and the vocabulary are replaced rather than modified in place,
+    so a reader sees a consistent snapshot of each.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.stem_words = {}
+        self.words = []
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Builds the index from a typed ledger, tokenizing each distinct note once.
+        """
+        index = cls()
+        index.add(df['note'], df['id'])
+        return index
+
+    @staticmethod
+    def group_ids(notes, ids):
+        """
+        Groups ids by the words of their notes.
+
+        Args:
+            notes (array-like): Notes, NaN for none.
+            ids (array-like): The ids of their records.
+
+        Returns:
+            dict: Maps each word to the sorted int64 ids of the notes containing it.
+        """
+        notes = np.asarray(notes, dtype=object)
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 1:
+            # A single insert or update skips the grouping
+            return {word: ids for word in note_words(notes[0])}
+        codes, uniques = pd.factorize(notes)
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        grouped = {}
+        for code, note in enumerate(uniques):
+            group = ids[order[boundaries[code]:boundaries[code + 1]]]
+            for word in note_words(note):
+                grouped.setdefault(word, []).append(group)
+        return {word: np.sort(np.concatenate(groups)) for word, groups in grouped.items()}
+
+    def add(self, notes, ids):
+        """
+        Adds records to the index.
+
+        Args:
+            notes (array-like): Their notes.
+            ids (array-like): Their ids.
+        """
+        new_words = []
+        for word, new_ids in self.group_ids(notes, ids).items():
+            current = self.postings.get(word)
+            if current is None:
+                self.postings[word] = new_ids
+                new_words.append(word)
+            else:
+                self.postings[word] = np.insert(current, np.searchsorted(current, new_ids), new_ids)
+        if new_words:
+            for word in new_words:
+                word_stem = stem(word)
+                self.stem_words[word_stem] = self.stem_words.get(word_stem, frozenset()) | {word}
+            # Already sorted runs, so this merges in about linear time
+            self.words = sorted(self.words + new_words)
+
+    def remove(self, notes, ids):
+        """
+        Removes records from the index; words left without records are dropped.
+
+        Args:
+            notes (array-like): The notes the records are indexed under.
+            ids (array-like): Their ids.
+        """
+        gone = []
+        for word, old_ids in self.group_ids(notes, ids).items():
+            current = self.postings.get(word)
+            if current is None:
+                continue
+            positions = np.minimum(np.searchsorted(current, old_ids), len(current) - 1)
+            remaining = np.delete(current, positions[current[positions] == old_ids])
+            if len(remaining):
+                self.postings[word] = remaining
+            else:
+                del self.postings[word]
+                gone.append(word)
+        if gone:
+            for word in gone:
+                word_stem = stem(word)
+                remaining_words = self.stem_words.get(word_stem, frozenset()) - {word}
+                if remaining_words:
+                    self.stem_words[word_stem] = remaining_words
+                else:
+                    self.stem_words.pop(word_stem, None)
+            gone = set(gone)
+            self.words = [word for word in self.words if word not in gone]
+
+    def word_postings(self, word, prefix=False):
+        """
+        Returns the postings of the words that have the same stem as `word`, or
+        with prefix=True also start with it.
+        """
+        matches = set(self.stem_words.get(stem(word), ()))
+        if prefix:
+            words = self.words
+            matches.update(words[bisect.bisect_left(words, word):bisect.bisect_left(words, prefix_end(word))])
+        postings = self.postings
+        return [postings[match] for match in matches if match in postings]
+
+    def terms(self, query):
+        """
+        Looks up the words of a query (see query_terms); the last one is also
+        matched as a prefix.
+
+        Returns:
+            list: One list of postings per word; a record matches the word if it is in any of them.
+                Empty if the query has no words.
+        """
+        words, prefix = query_terms(query)
+        terms = [self.word_postings(word) for word in dict.fromkeys(words)]
+        if prefix is not None:
+            terms.append(self.word_postings(prefix, prefix=True))
+        return terms
+
+    def match(self, terms, low=None, high=None):
+        """
+        Finds the records that match every term, optionally only among ids from
+        low (inclusive) to high (exclusive). Each postings array is cut to the id
+        range by binary search, so a narrow range only touches the ids inside it.
+
+        Args:
+            terms (list): The result of terms().
+            low (int, optional): Smallest id to return.
+            high (int, optional): Ids from here on are not returned.
+
+        Returns:
+            np.ndarray: The sorted int64 ids of the matching records.
+        """
+        ids = None
+        # Intersect the rarest terms first so the intermediate results stay small
+        for postings in sorted(terms, key=lambda postings: sum(len(ids) for ids in postings)):
+            if low is not None:
+                postings = [array[np.searchsorted(array, low):] for array in postings]
+            if high is not None:
+                postings = [array[:np.searchsorted(array, high)] for array in postings]
+            postings = [array for array in postings if len(array)]
+            if not postings:
+                return np.empty(0, dtype='int64')
+            term_ids = postings[0] if len(postings) == 1 else np.unique(np.concatenate(postings))
+            ids = term_ids if ids is None else np.intersect1d(ids, term_ids, assume_unique=True)
+            if not len(ids):
+                break
+        return ids if ids is not None else np.empty(0, dtype='int64')
+
+    def search(self, query):
+        """
+        Finds the records whose notes contain every word of the query.
+
+        Args:
+            query (str): Words to look for; the last one is also matched as a prefix (see query_terms).
+
+        Returns:
+            np.ndarray: The sorted int64 ids of the matching records; empty if the query has no words.
+        """
+        return self.match(self.terms(query))
+
+    def __eq__(self, other):
+        return self.postings.keys() == other.postings.keys() and \
+            all(np.array_equal(ids, other.postings[word]) for word, ids in self.postings.items()) and \
+            self.stem_words == other.stem_words and self.words == other.words
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LedgerLock:
+    """
+    Reentrant writer lock shared by every thread and every process that opens
+    the same ledger, so uvicorn workers apply mutations one at a time.
+
+    Threads are serialized by an RLock; processes by an advisory lock on a
+    file next to the ledger. The file lock is taken when the outermost holder
+    enters, and `on_acquire` then runs so the holder first catches up with
+    mutations committed by other processes. `on_release` runs after the
+    outermost holder has let go, e.g. to wait for its writes to reach disk
+    without keeping other writers out. Without a file path the lock only
+    serializes threads.
+    """
+
+    def __init__(self, file_path, on_acquire=None, on_release=None):
+        self.file_path = file_path
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self._thread_lock = threading.RLock()
+        self._owner = None
+        self._depth = 0
+        self._handle = None
+
+    @staticmethod
+    def path_for(database_path, name="lock"):
+        """
+        Returns the path of a lock file that belongs to a ledger.
+
+        Args:
+            database_path (str): The path to the ledger file.
+            name (str, optional): Distinguishes locks that guard different things.
+        """
+        return os.path.splitext(database_path)[0] + f".{name}"
+
+    @property
+    def held(self):
+        """
+        True if the calling thread holds the lock.
+        """
+        return self._owner == threading.get_ident()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+                self._owner = threading.get_ident()
+                self._depth = 1
+                if self.on_acquire is not None:
+                    self.on_acquire()
+            except BaseException:
+                self._release()
+                raise
+        else:
+            self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        outermost = self._depth == 1
+        self._release()
+        if outermost and self.on_release is not None:
+            self.on_release()
+
+    def _release(self):
+        self._depth = max(self._depth - 1, 0)
+        if self._depth == 0:
+            self._owner = None
+            self._unlock_file()
+        self._thread_lock.release()
+
+    def _lock_file(self):
+        if self.file_path is None:
+            return
+        if self._handle is None:
+            self._handle = open(self.file_path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+            return
+        # msvcrt.locking gives up after ~10 seconds; keep waiting like flock does
+        self._handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _unlock_file(self):
+        if self._handle is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self._handle.seek(0)
+            msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def close(self):
+        with self._thread_lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+
+class VersionFile:
+    """
+    The ledger's data version, stored next to it so processes can tell
+    cheaply whether their in-memory copy is stale.
+
+    It holds two counters: `version`, the sequence number of the newest
+    journaled mutation, and `generation`, which a compaction increments when it
+    moves the journal aside. The record has a fixed width and is overwritten
+    in place under the LedgerLock. A torn read by a reader that does not hold
+    the lock only looks like a change and causes a redundant catch-up.
+    """
+
+    RECORD = "{:020d} {:020d}\n"
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    @staticmethod
+    def path_for(database_path):
+        """
+        Returns the version file path that belongs to a ledger.
+        """
+        return os.path.splitext(database_path)[0] + ".version"
+
+    def read(self):
+        """
+        Returns:
+            tuple: (generation, version), or (0, 0) if the file is missing or unreadable.
+        """
+        try:
+            with open(self.file_path, "rb") as f:
+                generation, version = f.read(64).split()
+            return int(generation), int(version)
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+
+    def write(self, generation, version):
+        """
+        Publishes a new (generation, version). Callers must hold the LedgerLock.
+        """
+        record = self.RECORD.format(generation, version).encode()
+        mode = "r+b" if os.path.exists(self.file_path) else "wb"
+        with open(self.file_path, mode) as f:
+            f.write(record)
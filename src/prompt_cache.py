@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+# Only calls that never modify the ledger may be replayed from the cache.
+READ_ONLY_FUNCTIONS = {
+    "get_total_amount_by_type",
+    "get_monthly_total",
+    "get_notes_list",
+    "get_category_list",
+    "get_average_amount",
+    "get_transaction_history",
+    "get_summary",
+    "search_transactions",
+    "ai_analyze",
+}
+
+
+
+class Prompt_Cache:
+    """
+    LRU cache with a TTL mapping a /genai prompt to the function call Gemini chose
+    for it. Keys include the current date because prompts such as "total expenses
+    this month" resolve to different arguments on different days. Only read-only
+    functions are cached; the function itself still runs against live data.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(prompt):
+        """
+        Normalizes case, whitespace and trailing punctuation so trivially different
+        prompts share an entry.
+        """
+        return re.sub(r"\s+", " ", prompt.lower()).strip(" .!?")
+
+    def key(self, prompt, today=None):
+        return (self.normalize(prompt), (today or date.today()).isoformat())
+
+    def get(self, prompt, today=None):
+        """
+        Looks up a cached function call.
+
+        Args:
+            prompt (str): The user's prompt.
+            today (date, optional): The reference date. Defaults to today.
+
+        Returns:
+            tuple or None: (function_name, args) on a hit, None on a miss.
+        """
+        key = self.key(prompt, today)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], dict(entry[2])
+
+    def put(self, prompt, function_name, args, today=None):
+        """
+        Caches a resolved function call if the function is read-only.
+
+        Args:
+            prompt (str): The user's prompt.
+            function_name (str): The function Gemini chose.
+            args (dict): Its arguments.
+            today (date, optional): The reference date. Defaults to today.
+
+        Returns:
+            bool: True if the call was cached.
+        """
+        if function_name not in READ_ONLY_FUNCTIONS or self.max_entries <= 0:
+            return False
+        key = self.key(prompt, today)
+        with self._lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, function_name, dict(args or {}))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
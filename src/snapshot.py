@@ -0,0 +1,203 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import AggregateStore
+
+SNAPSHOT_FORMAT = 4
+# Columns stored as dictionary codes plus their distinct values, saved as <column>_offsets.npy and
+# <column>_values.npy: the UTF-8 bytes of every value concatenated, and where each one starts and ends.
+CODED_COLUMNS = ('type', 'category', 'note')
+# Arrays of AggregateStore.to_arrays(), saved as rollup_<name>.npy.
+ROLLUP_ARRAYS = ('types', 'years', 'months', 'categories', 'sum_cents', 'counts', 'min_cents', 'max_cents', 'stale')
+
+
+class BinarySnapshot:
+    """
+    Columnar binary copy of the CSV ledger for fast cold starts.
+
+    The snapshot is a directory of .npy files (ids, amounts, dates, and the
+    dictionary codes and dictionaries of type/category/note) plus meta.json,
+    which holds the row count and the size and modification time of the CSV
+    it was taken from. Arrays are memory-mapped on load, so nothing is parsed.
+    meta.json
+    is written last and removed first, so a half-written snapshot is never
+    used; a snapshot whose CSV has changed since is ignored.
+
+    The snapshot can also hold the ledger's monthly rollups (the aggregate
+    store of exactly the saved rows), so a cold start does not have to
+    regroup every row.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.meta = None
+
+    @staticmethod
+    def path_for(database_path):
+        """
+        Returns the snapshot directory that belongs to a CSV ledger.
+
+        Args:
+            database_path (str): The path to the CSV file.
+
+        Returns:
+            str: The path of the snapshot directory stored next to it.
+        """
+        return os.path.splitext(database_path)[0] + ".snapshot"
+
+    @staticmethod
+    def source_stamp(database_path):
+        """
+        Identifies the current version of a CSV file by its size and modification time.
+
+        Returns:
+            dict or None: The stamp, or None if the file does not exist.
+        """
+        try:
+            stat = os.stat(database_path)
+        except FileNotFoundError:
+            return None
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def array_path(self, name):
+        return os.path.join(self.directory, f"{name}.npy")
+
+    @staticmethod
+    def encode_values(values):
+        """
+        Packs strings into (offsets, bytes) arrays; value i is bytes[offsets[i]:offsets[i + 1]].
+        """
+        encoded = [str(value).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype='uint8')
+
+    @staticmethod
+    def decode_values(offsets, data):
+        """
+        Unpacks strings packed by encode_values().
+
+        Raises:
+            ValueError: If the arrays do not fit together.
+        """
+        data = data.tobytes()
+        offsets = offsets.tolist()
+        if not offsets or offsets[-1] != len(data):
+            raise ValueError("The saved dictionary is inconsistent.")
+        return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def invalidate(self):
+        """
+        Marks the snapshot as unusable.
+        """
+        try:
+            os.remove(self.meta_path)
+        except FileNotFoundError:
+            pass
+
+    def save(self, df, stamp, aggregates=None):
+        """
+        Writes a typed ledger as the snapshot of the CSV version identified by stamp.
+
+        Args:
+            df (pd.DataFrame): Data with typed columns.
+            stamp (dict): source_stamp() of the CSV file the data corresponds to.
+            aggregates (AggregateStore, optional): The rollups of exactly these rows.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.invalidate()
+
+        arrays = {
+            'id': df['id'].to_numpy(dtype='int64'),
+            'amount': df['amount'].to_numpy(dtype='float64'),
+            'date': df['date'].to_numpy(),
+        }
+        for column in CODED_COLUMNS:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                codes, uniques = df[column].cat.codes.to_numpy(), df[column].cat.categories
+            else:
+                codes, uniques = pd.factorize(df[column], sort=True, use_na_sentinel=True)
+            arrays[f"{column}_codes"] = codes.astype('int32')
+            arrays[f"{column}_offsets"], arrays[f"{column}_values"] = self.encode_values(uniques)
+        if aggregates is not None:
+            arrays.update({f"rollup_{name}": values for name, values in aggregates.to_arrays().items()})
+
+        for name, values in arrays.items():
+            with open(self.array_path(name), "wb") as f:
+                np.save(f, values, allow_pickle=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta = {
+            "format": SNAPSHOT_FORMAT, "rows": len(df), "source": stamp, "rollups": aggregates is not None,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def load(self, stamp):
+        """
+        Loads the snapshot if it was taken from the CSV version identified by stamp.
+
+        Args:
+            stamp (dict): source_stamp() of the CSV file.
+
+        Returns:
+            pd.DataFrame or None: The ledger with typed columns (not yet indexed),
+                or None if there is no valid snapshot for that version.
+        """
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if stamp is None or meta.get("format") != SNAPSHOT_FORMAT or meta.get("source") != stamp:
+            return None
+
+        try:
+            arrays = {name: np.load(self.array_path(name), mmap_mode='r', allow_pickle=False)
+                      for name in ('id', 'amount', 'date') + tuple(f"{c}_codes" for c in CODED_COLUMNS)}
+            dictionaries = {
+                column: self.decode_values(np.load(self.array_path(f"{column}_offsets"), allow_pickle=False),
+                                           np.load(self.array_path(f"{column}_values"), allow_pickle=False))
+                for column in CODED_COLUMNS
+            }
+        except (FileNotFoundError, ValueError):
+            return None
+        if any(len(values) != meta["rows"] for values in arrays.values()):
+            return None
+
+        self.meta = meta
+        note_values = np.asarray(dictionaries['note'] + [np.nan], dtype=object)
+        return pd.DataFrame({
+            'id': arrays['id'],
+            'type': pd.Categorical.from_codes(arrays['type_codes'], categories=dictionaries['type']),
+            'amount': arrays['amount'],
+            # Code -1 (missing note) picks the trailing NaN
+            'note': note_values[arrays['note_codes']],
+            'category': pd.Categorical.from_codes(arrays['category_codes'], categories=dictionaries['category']),
+            'date': arrays['date'],
+        })
+
+    def load_aggregates(self):
+        """
+        Loads the rollups saved with the snapshot returned by the last load().
+
+        Returns:
+            AggregateStore or None: The rollups, or None if the snapshot has none.
+        """
+        if self.meta is None or not self.meta.get("rollups"):
+            return None
+        try:
+            return AggregateStore.from_arrays({
+                name: np.load(self.array_path(f"rollup_{name}"), allow_pickle=False) for name in ROLLUP_ARRAYS
+            })
+        except (FileNotFoundError, ValueError):
+            return None
@@ -0,0 +1,741 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from src.date_index import DateIndex, decode_cursor, encode_cursor
+from src.metrics import BYTES_WRITTEN, SAVE_LATENCY
+from src.note_index import note_words, prefix_end, query_terms, stem
+from src.tracing import span
+from src.storage import COLUMNS, DATE_FORMAT, DURABILITY, DURABILITY_MODES, StorageEngine, serialized
+
+# Amounts are stored as integer cents so SUM() is exact.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    note TEXT,
+    category TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type COLLATE NOCASE, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category, date);
+CREATE TABLE IF NOT EXISTS note_words (
+    word TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (word, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_note_words_stem ON note_words (stem, id);
+CREATE INDEX IF NOT EXISTS idx_note_words_id ON note_words (id);
+"""
+# PRAGMA user_version of a database whose note_words table is filled; older files are indexed when opened.
+NOTE_WORDS_VERSION = 1
+SELECT_ROWS = "SELECT id, type, amount_cents, note, category, date FROM transactions"
+# The SQL behind each summary dimension
+SUMMARY_EXPRESSIONS = {
+    'type': "LOWER(type)",
+    'year': "CAST(substr(date, 1, 4) AS INTEGER)",
+    'month': "CAST(substr(date, 6, 2) AS INTEGER)",
+    'category': "category",
+}
+
+
+
+class SQLite_Tools(StorageEngine):
+    """
+    Storage engine backed by an embedded SQLite database in WAL mode. Filters
+    and aggregates run as SQL over indexes on id, (date, id), (type, date) and
+    (category, date) instead of scanning an in-memory ledger, and every
+    mutation is a single SQL transaction. The words of every note are kept in
+    the note_words table, tokenized and stemmed like the CSV engine's note
+    index, so both engines find the same records.
+
+    SQLite has no group commit, so 'group' durability is handled like 'sync'
+    (synchronous=FULL). 'async' uses synchronous=NORMAL: in WAL mode commits
+    then skip the fsync and are synced at checkpoints, so a power loss can
+    drop the newest transactions but never corrupts the database.
+    """
+
+    def __init__(self, file_path="data\\database.sqlite3", import_csv=None, durability=None):
+        """
+        Opens (and if needed creates) the database.
+
+        Args:
+            file_path (str, optional): Path of the SQLite file.
+            import_csv (str, optional): CSV ledger to import when the SQLite file is created.
+            durability (str, optional): 'sync', 'group' or 'async'. Defaults to BOOKKEEPING_DURABILITY.
+
+        Raises:
+            ValueError: If the durability mode is unknown.
+        """
+        self.file_path = file_path
+        self.durability = durability or DURABILITY
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{self.durability}'. Please choose 'sync', 'group' or 'async'.")
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        is_new = not os.path.exists(file_path)
+        with self.write_lock:
+            connection = self.connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            if is_new and import_csv is not None and os.path.exists(import_csv):
+                self.import_csv(import_csv)
+            if connection.execute("PRAGMA user_version").fetchone()[0] < NOTE_WORDS_VERSION:
+                self.rebuild_note_words()
+
+
+
+    @property
+    def current_total(self):
+        return self.calculate_total_amount()
+
+
+
+    def connection(self):
+        """
+        Returns this thread's connection; WAL lets the readers run concurrently
+        with the single writer.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path, isolation_level=None, check_same_thread=False, timeout=30)
+            # Every commit is durable, like the CSV engine's fsynced journal, unless writes may lag behind
+            connection.execute("PRAGMA synchronous=NORMAL" if self.durability == "async" else "PRAGMA synchronous=FULL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed statements as one write transaction under the writer lock.
+        """
+        with self.write_lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            with span("persist.commit"):
+                connection.execute("COMMIT")
+
+
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+
+    def import_csv(self, csv_path):
+        """
+        Imports a CSV ledger (including its journal) into the database, keeping ids.
+
+        Args:
+            csv_path (str): Path of the CSV ledger.
+        """
+        from src.database_tools import Database_Tools
+
+        # Read-only: without the snapshot and process sync nothing is written next to the source CSV
+        source = Database_Tools(csv_path, binary_snapshot=False, process_sync=False)
+        try:
+            with self.transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO transactions (id, type, amount_cents, note, category, date) VALUES (?, ?, ?, ?, ?, ?)",
+                    self.to_rows(source.data),
+                )
+        finally:
+            source.close()
+
+
+
+    def rebuild_note_words(self):
+        """
+        Fills the note_words table from every record's note, e.g. for a database
+        created before notes were indexed.
+        """
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM note_words")
+            rows = connection.execute("SELECT id, note FROM transactions").fetchall()
+            connection.executemany(
+                "INSERT INTO note_words (word, stem, id) VALUES (?, ?, ?)", self.note_word_rows(*zip(*rows)) if rows else []
+            )
+            connection.execute(f"PRAGMA user_version = {NOTE_WORDS_VERSION}")
+
+
+
+    def note_word_rows(self, ids, notes):
+        """
+        Returns the (word, stem, id) rows of the note_words table for the given records.
+        """
+        return [
+            (word, stem(word), int(record_id))
+            for record_id, note in zip(ids, notes)
+            for word in note_words(note)
+        ]
+
+
+
+    def to_rows(self, df):
+        """
+        Converts typed rows to the tuples stored in the transactions table.
+        """
+        cents = (df['amount'] * 100).round().astype('int64')
+        return list(zip(
+            df['id'].astype('int64').tolist(),
+            df['type'].astype(str).tolist(),
+            cents.tolist(),
+            df['note'].astype(object).where(df['note'].notna(), None).tolist(),
+            df['category'].astype(str).tolist(),
+            df['date'].dt.strftime(DATE_FORMAT).tolist(),
+        ))
+
+
+
+    def read_frame(self, sql, params=()):
+        """
+        Runs a query over SELECT_ROWS and returns the rows with typed columns, indexed by id.
+        """
+        rows = self.connection().execute(sql, params).fetchall()
+        raw = pd.DataFrame.from_records(rows, columns=['id', 'type', 'amount_cents', 'note', 'category', 'date'])
+        frame = pd.DataFrame({
+            'id': raw['id'].astype('int64'),
+            'type': raw['type'].astype('category'),
+            'amount': (raw['amount_cents'].astype('int64') / 100).round(2),
+            'note': raw['note'],
+            'category': raw['category'].astype('category'),
+            'date': pd.to_datetime(raw['date'], format=DATE_FORMAT),
+        }, columns=COLUMNS)
+        frame.index = pd.Index(frame['id'].to_numpy())
+        return frame
+
+
+
+    def where_clause(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Builds a WHERE clause for the usual filters. Year (and month) filters
+        and date ranges become one date range so the (date, id) index is used.
+
+        Returns:
+            tuple: (conditions, params), a list of SQL conditions and their parameters.
+
+        Raises:
+            ValueError: If a date is invalid.
+        """
+        conditions = []
+        params = []
+        if record_type is not None:
+            conditions.append("type = ? COLLATE NOCASE")
+            params.append(record_type)
+        start, end, month = self.period_bounds(month, year, start_date, end_date)
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(start.strftime(DATE_FORMAT))
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(end.strftime(DATE_FORMAT))
+        if month is not None:
+            conditions.append("substr(date, 6, 2) = ?")
+            params.append(f"{int(month):02d}")
+        return conditions, params
+
+
+
+    def where_sql(self, conditions):
+        return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+
+    def has_record(self, record_id):
+        """
+        Checks whether a record exists using the primary key.
+
+        Args:
+            record_id (int): The unique identifier for the record.
+
+        Returns:
+            bool: True if the record exists.
+        """
+        row = self.connection().execute("SELECT 1 FROM transactions WHERE id = ?", (int(record_id),)).fetchone()
+        return row is not None
+
+
+
+    def get_record(self, record_id):
+        """
+        Returns a single record by id.
+
+        Args:
+            record_id (int): The unique identifier for the record.
+
+        Returns:
+            pd.Series: The record's fields.
+
+        Raises:
+            KeyError: If the record_id does not exist.
+        """
+        frame = self.read_frame(SELECT_ROWS + " WHERE id = ?", (int(record_id),))
+        if frame.empty:
+            raise KeyError(f"Record with id '{record_id}' does not exist.")
+        return frame.iloc[0]
+
+
+
+    def newest_id(self):
+        row = self.connection().execute("SELECT MAX(id) FROM transactions").fetchone()
+        if row[0] is None:
+            return None
+        return int(row[0])
+
+
+
+    @property
+    def next_id(self):
+        # AUTOINCREMENT never hands out an id twice, even after the newest record is deleted
+        connection = self.connection()
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'").fetchone()
+        return max(row[0] if row else 0, self.newest_id() or 0) + 1
+
+
+
+    @serialized
+    def insert_data(self, record_type, amount, note:str, category:str, date:str):
+        """
+        Adds a new record.
+
+        Args:
+            record_type (str): The type of the record.
+            amount (float): The amount associated with the record.
+            note (str): The note for the record.
+            category (str): The category of the record.
+            date (str): The date of the record.
+
+        Raises:
+            ValueError: If the amount is not a valid number.
+        """
+        amount = round(self.parse_amount(amount, record_type), 2)
+        date = self.parse_date(date).strftime(DATE_FORMAT)
+
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO transactions (type, amount_cents, note, category, date) VALUES (?, ?, ?, ?, ?)",
+                (record_type, int(round(amount * 100)), note, category, date),
+            )
+            new_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO note_words (word, stem, id) VALUES (?, ?, ?)", self.note_word_rows([new_id], [note])
+            )
+        return f"Record added successfully. ID: {new_id}, Type: {record_type}, Amount: {amount:.2f}, Note: {note}, Category: {category}, Date: {date}"
+
+
+
+    @serialized
+    def update_data(self, record_id:int=None, record_type:str=None, amount:float=None, note:str=None, category:str=None, date:str=None):
+        """
+        Updates an existing record.
+
+        Args:
+            record_id (int): The unique identifier for the record to update.
+            record_type (str, optional): The new type of the record.
+            amount (float, optional): The new amount associated with the record.
+            note (str, optional): The new note for the record.
+            category (str, optional): The new category of the record.
+            date (str, optional): The new date of the record.
+
+        Raises:
+            KeyError: If the record_id does not exist.
+            ValueError: If the amount is not a valid number.
+        """
+        if record_id is None:
+            record_id = self.newest_id()
+            if record_id is None:
+                raise ValueError("No data to update.")
+
+        record_id = int(record_id)
+        if not self.has_record(record_id):
+            raise KeyError(f"Record with id '{record_id}' does not exist.")
+
+        fields = {}
+        if record_type is not None:
+            fields['type'] = record_type
+        if amount is not None:
+            amount = self.parse_amount(amount, record_type)
+            fields['amount_cents'] = int(round(amount * 100))
+        if note is not None:
+            fields['note'] = note
+        if category is not None:
+            fields['category'] = category
+        if date is not None:
+            fields['date'] = self.parse_date(date).strftime(DATE_FORMAT)
+
+        if fields:
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            with self.transaction() as connection:
+                connection.execute(f"UPDATE transactions SET {assignments} WHERE id = ?", (*fields.values(), record_id))
+                if 'note' in fields:
+                    connection.execute("DELETE FROM note_words WHERE id = ?", (record_id,))
+                    connection.executemany(
+                        "INSERT INTO note_words (word, stem, id) VALUES (?, ?, ?)", self.note_word_rows([record_id], [note])
+                    )
+        return f"Record with ID {str(record_id)} updated successfully with Type: {str(record_type)}, Amount: {str(amount)}, Note: {str(note)}, Category: {str(category)}, Date: {str(date)}"
+
+
+
+    @serialized
+    def delete_data(self, record_id:int = None):
+        """
+        Deletes a record. If no record_id is provided, it deletes the last record.
+
+        Args:
+            record_id (int): The unique identifier for the record to delete.
+
+        Raises:
+            KeyError: If the record_id does not exist.
+        """
+        if record_id is None:
+            record_id = self.newest_id()
+            if record_id is None:
+                raise ValueError("No data to delete.")
+
+        with self.transaction() as connection:
+            cursor = connection.execute("DELETE FROM transactions WHERE id = ?", (int(record_id),))
+            if cursor.rowcount == 0:
+                raise KeyError(f"Record with id '{record_id}' does not exist.")
+            connection.execute("DELETE FROM note_words WHERE id = ?", (int(record_id),))
+
+
+
+    @serialized
+    def batch_insert_data(self, records):
+        """
+        Batch add multiple records in a single transaction. If any record is
+        invalid, nothing is added.
+
+        Args:
+            records (list): A list of dictionaries containing multiple record data. Each record should be a dictionary with the following keys:
+                            'type', 'amount', 'note', 'category', 'date'
+
+        Returns:
+            list: A list of successfully added record IDs.
+
+        Raises:
+            BatchValidationError: If any record is invalid; `errors` maps record index to the reason.
+        """
+        batch = self.validate_batch(records)
+
+        with self.transaction() as connection:
+            first_id = self.next_id
+            new_ids = np.arange(first_id, first_id + len(batch), dtype='int64')
+            batch.insert(0, 'id', new_ids)
+            connection.executemany(
+                "INSERT INTO transactions (id, type, amount_cents, note, category, date) VALUES (?, ?, ?, ?, ?, ?)",
+                self.to_rows(batch),
+            )
+            connection.executemany(
+                "INSERT INTO note_words (word, stem, id) VALUES (?, ?, ?)", self.note_word_rows(new_ids, batch['note'])
+            )
+        return new_ids.tolist()
+
+
+
+    def row_count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+
+
+    def calculate_total_amount(self, record_type=None):
+        """
+        Calculates the total amount. If a record type is specified, calculates
+        the total for that type only.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+
+        Returns:
+            float: The total amount.
+        """
+        return self.calculate_monthly_total(record_type=record_type)
+
+
+
+    def calculate_monthly_total(self, record_type:str=None, month:int=None, year:int=None, start_date=None, end_date=None):
+        """
+        Calculates the total amount of a specific record type for a given month
+        and year with one indexed SUM.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'payment').
+            month (int, optional): The month for which to calculate the total (1-12).
+            year (int, optional): The year for which to calculate the total.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            float: The total amount for the specified filters.
+        """
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        row = self.connection().execute(
+            "SELECT COALESCE(SUM(amount_cents), 0) FROM transactions" + self.where_sql(conditions), params
+        ).fetchone()
+        return row[0] / 100
+
+
+
+    def calculate_average_amount(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Calculates the average amount based on the specified month, year, and record type.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'payment').
+            month (int, optional): The month for which to calculate the average (1-12).
+            year (int, optional): The year for which to calculate the average.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            float: The average amount, or 0.0 when nothing matches.
+        """
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        total_cents, count = self.connection().execute(
+            "SELECT COALESCE(SUM(amount_cents), 0), COUNT(*) FROM transactions" + self.where_sql(conditions), params
+        ).fetchone()
+        if count == 0:
+            return 0.0
+        return round(total_cents / count / 100, 2)
+
+
+
+    def summarize(self, group_by=(), record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Calculates the total, count and average amount of every group of records
+        with one GROUP BY query.
+
+        Args:
+            group_by (list or str): Any of 'type', 'year', 'month' and 'category'; none gives one overall group.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            list: One dict per group, ordered by the grouped values, holding those
+                values and the group's 'total', 'count' and 'average'.
+
+        Raises:
+            ValueError: If group_by names an unknown dimension.
+        """
+        dimensions = self.summary_dimensions(group_by)
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        expressions = [SUMMARY_EXPRESSIONS[name] for name in dimensions]
+        grouping = " GROUP BY " + ", ".join(expressions) + " ORDER BY " + ", ".join(expressions) if expressions else ""
+        rows = self.connection().execute(
+            "SELECT " + "".join(f"{expression}, " for expression in expressions) + "SUM(amount_cents), COUNT(*) "
+            "FROM transactions" + self.where_sql(conditions) + grouping, params
+        ).fetchall()
+        return [
+            {**dict(zip(dimensions, row[:-2])), 'total': row[-2] / 100, 'count': row[-1],
+             'average': round(row[-2] / row[-1] / 100, 2)}
+            for row in rows
+            if row[-1]
+        ]
+
+
+
+    def filter_data(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Returns the rows matching the given record type, month and year in id order.
+
+        Args:
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            pd.DataFrame: The matching rows with typed columns.
+        """
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        return self.read_frame(SELECT_ROWS + self.where_sql(conditions) + " ORDER BY id", params)
+
+
+
+    def list_distinct(self, column, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        # First-appearance order, like pandas' unique()
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        rows = self.connection().execute(
+            f"SELECT {column} FROM transactions{self.where_sql(conditions)} GROUP BY {column} ORDER BY MIN(id)", params
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+
+    def list_notes(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Lists all notes based on the specified month, year, and record type.
+
+        Returns:
+            list: A list of unique notes.
+        """
+        return self.list_distinct("note", record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+
+
+    def list_categories(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Lists all categories based on the specified month, year, and record type.
+
+        Returns:
+            list: A list of unique categories.
+        """
+        return self.list_distinct("category", record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+
+
+    def select_rows(self, record_type=None, month=None, year=None, offset=None, limit=None, start_date=None, end_date=None):
+        """
+        Selects a page of matching rows in id order with LIMIT/OFFSET.
+
+        Returns:
+            tuple: (frame, positions), the page and the positions of its rows.
+        """
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        frame = self.read_frame(
+            SELECT_ROWS + self.where_sql(conditions) + " ORDER BY id LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset or 0),
+        )
+        return frame, np.arange(len(frame))
+
+
+
+    def query_page(self, limit, cursor=None, record_type=None, month=None, year=None, descending=False, start_date=None, end_date=None):
+        """
+        Returns one page of records ordered by (date, id) after the given cursor,
+        seeking the (date, id) index with a row-value comparison.
+
+        Args:
+            limit (int): Maximum number of records in the page.
+            cursor (str, optional): The next_cursor of the previous page; None or '' for the first page.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+            descending (bool, optional): Newest first instead of oldest first.
+
+        Returns:
+            tuple: (frame, positions, next_cursor); next_cursor is None on the last page.
+
+        Raises:
+            ValueError: If the cursor or the filters are invalid.
+        """
+        if limit <= 0:
+            raise ValueError("The limit must be a positive number.")
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        if cursor:
+            cursor_date, cursor_id = DateIndex.split_key(decode_cursor(cursor))
+            conditions.append(f"(date, id) {'<' if descending else '>'} (?, ?)")
+            params += [cursor_date.strftime(DATE_FORMAT), cursor_id]
+        order = "DESC" if descending else "ASC"
+        frame = self.read_frame(
+            SELECT_ROWS + self.where_sql(conditions) + f" ORDER BY date {order}, id {order} LIMIT ?",
+            (*params, limit + 1),
+        )
+
+        next_cursor = None
+        if len(frame) > limit:
+            frame = frame.iloc[:limit]
+            last = frame.iloc[-1]
+            next_cursor = encode_cursor(DateIndex.make_keys([last['date']], [last['id']])[0])
+        return frame, np.arange(len(frame)), next_cursor
+
+
+
+    def search_notes(self, query, record_type=None, month=None, year=None, start_date=None, end_date=None, limit=None):
+        """
+        Finds the records whose notes contain every word of the query, newest id
+        first. Each word is looked up in the (stem, id) index of note_words and
+        the last one also as a prefix on its (word, id) key, so only the
+        matching records are read.
+
+        Args:
+            query (str): Words to look for; see note_index.query_terms.
+            record_type (str, optional): The type of the record ('expense' or 'pay').
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+            limit (int, optional): Maximum number of records to return.
+
+        Returns:
+            tuple: (frame, positions), the matches and the positions of their rows.
+
+        Raises:
+            ValueError: If the limit or the filters are invalid.
+        """
+        if limit is not None and limit <= 0:
+            raise ValueError("The limit must be a positive number.")
+        conditions, params = self.where_clause(record_type, month, year, start_date, end_date)
+        words, prefix = query_terms(query)
+        terms = ["SELECT id FROM note_words WHERE stem = ?" for _ in dict.fromkeys(words)]
+        term_params = [stem(word) for word in dict.fromkeys(words)]
+        if prefix is not None:
+            terms.append("SELECT id FROM note_words WHERE stem = ? UNION SELECT id FROM note_words WHERE word >= ? AND word < ?")
+            term_params += [stem(prefix), prefix, prefix_end(prefix)]
+        if not terms:
+            return self.read_frame(SELECT_ROWS + " WHERE 0"), np.empty(0, dtype='int64')
+        conditions.insert(0, "id IN (" + " INTERSECT ".join(f"SELECT id FROM ({term})" for term in terms) + ")")
+        frame = self.read_frame(
+            SELECT_ROWS + self.where_sql(conditions) + " ORDER BY id DESC LIMIT ?",
+            (*term_params, *params, -1 if limit is None else limit),
+        )
+        return frame, np.arange(len(frame))
+
+
+
+    def save_database(self, file_path=None):
+        """
+        Checkpoints the WAL into the database file, or exports the ledger as CSV
+        when another path is given.
+
+        Args:
+            file_path (str, optional): The path to a CSV file to export to.
+        """
+        if file_path is None or file_path == self.file_path:
+            with span("persist.save"), SAVE_LATENCY.time(engine="sqlite"), self.write_lock:
+                connection = self.connection()
+                _, _, checkpointed = connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            BYTES_WRITTEN.inc(max(checkpointed, 0) * page_size, engine="sqlite", target="checkpoint")
+            return
+
+        data = self.filter_data()
+        if data.empty:
+            raise ValueError("No data to save.")
+        with span("persist.save"), SAVE_LATENCY.time(engine="sqlite"):
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                self.to_external(data).to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            BYTES_WRITTEN.inc(os.path.getsize(tmp_path), engine="sqlite", target="snapshot")
+            os.replace(tmp_path, file_path)
@@ -0,0 +1,415 @@
+import functools
+import math
+import os
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+# Columns held as pandas categoricals; they repeat a handful of values across the ledger.
+CATEGORICAL_COLUMNS = ('type', 'category')
+DATE_FORMAT = '%Y-%m-%d'
+COLUMNS = ['id', 'type', 'amount', 'note', 'category', 'date']
+# Dimensions summarize() can group by; types are grouped case-insensitively, as they are filtered.
+SUMMARY_DIMENSIONS = ('type', 'year', 'month', 'category')
+# When a committed mutation must be on disk: 'sync' (before the call returns), 'group'
+# (fsyncs of concurrent writers are batched, callers still wait) or 'async' (write-behind).
+DURABILITY_MODES = ("sync", "group", "async")
+DURABILITY = os.environ.get("BOOKKEEPING_DURABILITY", "sync").lower()
+# Async mode fsyncs at least this often, or as soon as this many mutations are pending.
+FLUSH_INTERVAL_MS = float(os.environ.get("BOOKKEEPING_FLUSH_INTERVAL_MS", "5"))
+FLUSH_BATCH = int(os.environ.get("BOOKKEEPING_FLUSH_BATCH", "64"))
+
+
+def serialized(method):
+    """
+    Runs a mutating storage method under the instance's writer lock so
+    concurrent requests (served from a thread pool) apply mutations one at a time.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+
+class BatchValidationError(ValueError):
+    """
+    Raised when one or more records of a batch insert are invalid.
+
+    Attributes:
+        errors (dict): Maps the index of each invalid record to the reason it was rejected.
+    """
+
+    def __init__(self, errors):
+        self.errors = dict(sorted(errors.items()))
+        details = "; ".join(f"record {index}: {reason}" for index, reason in self.errors.items())
+        super().__init__(f"Error processing records, nothing was added. {details}")
+
+
+
+class StorageEngine(ABC):
+    """
+    The operations the API and the Gemini tools need from a ledger.
+
+    Rows cross the interface as pandas objects with typed columns: int64 'id',
+    'type', float64 'amount' (negative for expenses), 'note', 'category' and
+    datetime64 'date', indexed by id. Queries filter on record_type, month
+    and year, and on an inclusive start_date/end_date range (see
+    period_bounds). Implementations must also expose a
+    reentrant `write_lock` that callers may hold to group a read-modify-write,
+    and keep `current_total` up to date.
+    """
+
+    write_lock = None
+    current_total = 0.0
+
+    @abstractmethod
+    def insert_data(self, record_type, amount, note:str, category:str, date:str):
+        """
+        Adds a new record and returns a confirmation message containing "ID: <id>".
+        """
+
+    @abstractmethod
+    def update_data(self, record_id:int=None, record_type:str=None, amount:float=None, note:str=None, category:str=None, date:str=None):
+        """
+        Updates the given fields of an existing record (the newest one if record_id is None).
+        """
+
+    @abstractmethod
+    def delete_data(self, record_id:int=None):
+        """
+        Deletes a record (the newest one if record_id is None).
+        """
+
+    @abstractmethod
+    def batch_insert_data(self, records):
+        """
+        Adds all records or none of them and returns their ids.
+        """
+
+    @abstractmethod
+    def has_record(self, record_id):
+        """
+        Returns True if a record with the id exists.
+        """
+
+    @abstractmethod
+    def get_record(self, record_id):
+        """
+        Returns a record as a pd.Series, raising KeyError if it does not exist.
+        """
+
+    @abstractmethod
+    def calculate_total_amount(self, record_type=None):
+        """
+        Returns the sum of amounts, optionally for one record type.
+        """
+
+    @abstractmethod
+    def calculate_monthly_total(self, record_type:str=None, month:int=None, year:int=None, start_date=None, end_date=None):
+        """
+        Returns the sum of amounts for the filters.
+        """
+
+    @abstractmethod
+    def calculate_average_amount(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Returns the average amount for the filters, or 0.0 when nothing matches.
+        """
+
+    @abstractmethod
+    def summarize(self, group_by=(), record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Returns the total, count and average amount of every group for the filters in one pass.
+        """
+
+    @abstractmethod
+    def filter_data(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Returns the matching rows as a typed pd.DataFrame.
+        """
+
+    @abstractmethod
+    def select_rows(self, record_type=None, month=None, year=None, offset=None, limit=None, start_date=None, end_date=None):
+        """
+        Returns (frame, positions) for one offset/limit page in id order.
+        """
+
+    @abstractmethod
+    def query_page(self, limit, cursor=None, record_type=None, month=None, year=None, descending=False, start_date=None, end_date=None):
+        """
+        Returns (frame, positions, next_cursor) for one keyset page ordered by (date, id).
+        """
+
+    @abstractmethod
+    def search_notes(self, query, record_type=None, month=None, year=None, start_date=None, end_date=None, limit=None):
+        """
+        Returns (frame, positions) for the records whose notes contain every word
+        of the query, newest id first (see note_index.query_terms for matching).
+        """
+
+    @abstractmethod
+    def row_count(self):
+        """
+        Returns the number of records in the ledger.
+        """
+
+    @abstractmethod
+    def save_database(self, file_path=None):
+        """
+        Makes the ledger durable in its own storage, or exports it as CSV to file_path.
+        """
+
+    def close(self):
+        """
+        Releases files and connections held by the engine.
+        """
+
+    def memory_usage(self):
+        """
+        Returns the approximate number of bytes of ledger data held in memory.
+        Engines that answer from disk return 0.
+        """
+        return 0
+
+    def list_notes(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Lists all notes based on the specified month, year, and record type.
+        If no filters are provided, lists all notes.
+
+        Args:
+            month (int, optional): The month for which to list notes (1-12).
+            year (int, optional): The year for which to list notes.
+            record_type (str, optional): The type of the record ('expense' or 'payment').
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            list: A list of unique notes.
+        """
+        filtered_data = self.filter_data(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+        return filtered_data['note'].unique().tolist()
+
+    def list_categories(self, record_type=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Lists all categories based on the specified month, year, and record type.
+        If no filters are provided, lists all categories.
+
+        Args:
+            month (int, optional): The month for which to list categories (1-12).
+            year (int, optional): The year for which to list categories.
+            record_type (str, optional): The type of the record ('expense' or 'payment').
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            list: A list of unique categories.
+        """
+        filtered_data = self.filter_data(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+        return filtered_data['category'].unique().tolist()
+
+    def export_data(self, file_format="json", record_type:str=None, month=None, year=None, start_date=None, end_date=None):
+        """
+        Exports the DataFrame as a JSON or CSV string, with optional filtering by month and year.
+
+        Args:
+            file_format (str): The format to export the data ('json' or 'csv').
+            month (int, optional): The month for which to filter the data (1-12).
+            year (int, optional): The year for which to filter the data.
+            start_date (str, optional): First date to include (YYYY-MM-DD).
+            end_date (str, optional): Last date to include (YYYY-MM-DD).
+
+        Returns:
+            str: The exported data as a string.
+
+        Raises:
+            ValueError: If the file_format is not 'json' or 'csv'.
+        """
+        filtered_data = self.filter_data(record_type=record_type, month=month, year=year, start_date=start_date, end_date=end_date)
+
+        # Convert typed columns back to strings only at the export boundary
+        export_data = self.to_external(filtered_data)
+
+        if file_format.lower() == "json":
+            return export_data.to_json(orient="records")
+        elif file_format.lower() == "csv":
+            return export_data.to_csv(index=False)
+        elif file_format.lower() == "list":
+            # Convert all data to appropriate Python types before returning as list
+            result = []
+            for _, row in export_data.iterrows():
+                row_list = []
+                for val in row:
+                    # Convert pandas/numpy types to Python native types
+                    if hasattr(val, 'item'):  # Check if it's a numpy scalar
+                        val = val.item()  # Convert numpy type to native Python type
+                    row_list.append(val)
+                result.append(row_list)
+            return result
+        else:
+            raise ValueError("Invalid file format. Please choose 'json' or 'csv'.")
+
+    def summary_dimensions(self, group_by):
+        """
+        Validates the dimensions of a summary.
+
+        Args:
+            group_by (str or list): Dimension names, as a list or a comma-separated string.
+
+        Returns:
+            tuple: The dimensions in the given order, without duplicates.
+
+        Raises:
+            ValueError: If a dimension is not one of SUMMARY_DIMENSIONS.
+        """
+        if group_by is None:
+            return ()
+        if isinstance(group_by, str):
+            group_by = group_by.split(',')
+        dimensions = tuple(dict.fromkeys(str(name).strip().lower() for name in group_by if str(name).strip()))
+        unknown = [name for name in dimensions if name not in SUMMARY_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}. Choose from: {', '.join(SUMMARY_DIMENSIONS)}.")
+        return dimensions
+
+    def to_external(self, df):
+        """
+        Converts typed columns back into the string representation used at the
+        CSV/JSON boundary.
+
+        Args:
+            df (pd.DataFrame): Data with typed columns.
+
+        Returns:
+            pd.DataFrame: A copy with dates as 'YYYY-MM-DD', plain string type/category
+                and amounts rounded to cents.
+        """
+        external = df.copy()
+        external['date'] = external['date'].dt.strftime(DATE_FORMAT)
+        for column in CATEGORICAL_COLUMNS:
+            external[column] = external[column].astype(object)
+        external['amount'] = external['amount'].round(2)
+        return external
+
+    def parse_amount(self, amount, record_type=None):
+        """
+        Parses an amount, making it negative for expenses.
+
+        Args:
+            amount (float or str): The amount.
+            record_type (str, optional): The type of the record.
+
+        Returns:
+            float: The signed amount.
+
+        Raises:
+            ValueError: If the amount is not a valid number.
+        """
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            raise ValueError("The amount must be a valid number.")
+        if record_type and record_type.lower() == 'expense':
+            amount = -abs(amount)
+        return amount
+
+    def period_bounds(self, month=None, year=None, start_date=None, end_date=None):
+        """
+        Combines the year/month filters and a date range into one inclusive range of dates.
+
+        Args:
+            month (int, optional): The month to keep (1-12).
+            year (int, optional): The year to keep.
+            start_date (str, optional): First date to include.
+            end_date (str, optional): Last date to include.
+
+        Returns:
+            tuple: (start, end, month), the first and last dates to keep (None leaves that
+                side open) and the month each row must still be checked against, which is
+                only set for a month without a year.
+
+        Raises:
+            ValueError: If a date cannot be parsed or start_date is after end_date.
+        """
+        start = self.parse_date(start_date) if start_date is not None else None
+        end = self.parse_date(end_date) if end_date is not None else None
+        if start is not None and end is not None and start > end:
+            raise ValueError("The start_date must not be after the end_date.")
+        if year is not None:
+            # Gemini passes NUMBER arguments as floats
+            period_start = pd.Timestamp(year=int(year), month=int(month or 1), day=1)
+            period_end = period_start + (pd.offsets.MonthEnd(0) if month is not None else pd.offsets.YearEnd(0))
+            start = period_start if start is None else max(start, period_start)
+            end = period_end if end is None else min(end, period_end)
+            month = None
+        return start, end, month
+
+    def parse_date(self, date):
+        """
+        Parses a date to a midnight Timestamp.
+
+        Raises:
+            ValueError: If the date cannot be parsed.
+        """
+        try:
+            return pd.to_datetime(date).normalize()
+        except Exception:
+            raise ValueError("The date must be in a valid format (e.g., YYYY-MM-DD).")
+
+    def validate_batch(self, records):
+        """
+        Validates and normalizes a batch of records in one vectorized pass.
+
+        Args:
+            records (list): Dictionaries with 'type', 'amount', 'note', 'category' and 'date'.
+
+        Returns:
+            pd.DataFrame: The records with str type/category, signed float amounts
+                rounded to cents and normalized datetime64 dates.
+
+        Raises:
+            ValueError: If records is not a non-empty list.
+            BatchValidationError: If any record is invalid; `errors` maps record index to the reason.
+        """
+        if not records or not isinstance(records, list):
+            raise ValueError("Records must be a non-empty list")
+
+        required = ['type', 'amount', 'note', 'category', 'date']
+        errors = {}
+        if not all(isinstance(record, dict) for record in records):
+            records = [record if isinstance(record, dict) else {} for record in records]
+
+        batch = pd.DataFrame(records, columns=required)
+        for index in batch.index[batch.isna().any(axis=1)]:
+            errors[index] = "must contain type, amount, note, category, and date"
+
+        # Parse amounts and dates for the whole batch at once
+        amounts = pd.to_numeric(batch['amount'], errors='coerce')
+        dates = pd.to_datetime(batch['date'], format=DATE_FORMAT, errors='coerce')
+        retry = dates.isna() & batch['date'].notna()
+        if retry.any():
+            dates[retry] = pd.to_datetime(batch.loc[retry, 'date'].astype(str), format='mixed', errors='coerce')
+        types = batch['type'].astype(str)
+
+        for index in batch.index[amounts.isna() | ~amounts.map(math.isfinite)]:
+            errors.setdefault(index, f"amount {batch.at[index, 'amount']!r} must be a valid number")
+        for index in batch.index[dates.isna()]:
+            errors.setdefault(index, f"date {batch.at[index, 'date']!r} must be in a valid format (e.g., YYYY-MM-DD)")
+
+        if errors:
+            raise BatchValidationError(errors)
+
+        # if the record is an expense, convert to negative
+        is_expense = types.str.lower() == 'expense'
+        amounts = amounts.where(~is_expense, -amounts.abs()).round(2)
+
+        return pd.DataFrame({
+            'type': types,
+            'amount': amounts.astype('float64'),
+            'note': batch['note'],
+            'category': batch['category'].astype(str),
+            'date': dates.dt.normalize(),
+        })
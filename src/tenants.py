@@ -0,0 +1,324 @@
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+
+from src.executor import run_blocking
+from src.tracing import fields, logger, span, traced
+
+TENANT_HEADER = b"x-tenant-id"
+TENANT_PATH_PREFIX = "/tenants/"
+# Tenant ids become file names, so they are limited to a safe alphabet.
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Idle ledgers are looked for at most this often on the fast path.
+SWEEP_INTERVAL_SECONDS = 1.0
+
+# The ledger of the request being served; run_blocking copies it into worker threads.
+current_ledger = contextvars.ContextVar("current_ledger", default=None)
+
+
+def validate_tenant(tenant):
+    """
+    Checks that a tenant id is safe to use as a file name.
+
+    Raises:
+        ValueError: If it is not 1-64 letters, digits, '-' or '_'.
+    """
+    if not TENANT_ID_PATTERN.match(tenant):
+        raise ValueError("Invalid tenant id. Use 1-64 letters, digits, '-' or '_'.")
+    return tenant
+
+
+
+class ResidentLedger:
+    """
+    A loaded ledger with the number of requests using it, when it was last
+    used and its estimated memory.
+    """
+
+    __slots__ = ("ledger", "leases", "last_used", "size")
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.size = ledger.memory_usage()
+
+
+
+class Ledger_Pool:
+    """
+    Per-tenant ledgers, opened on first access and kept in an LRU that is
+    bounded by the number of ledgers, their estimated memory and idle time.
+    Memory therefore follows the number of active tenants, not all tenants.
+
+    Requests lease a ledger with acquire() and hand it back with release().
+    Only ledgers without leases are evicted. Eviction flushes them first
+    (save_database) and then closes them. Opening and evicting are serialized,
+    so a tenant is never open twice.
+    """
+
+    def __init__(self, open_ledger, max_ledgers=64, max_bytes=512 * 2**20, idle_seconds=600.0):
+        """
+        Args:
+            open_ledger (callable): Opens the ledger of a tenant id (None for the default ledger).
+            max_ledgers (int, optional): Maximum number of resident ledgers.
+            max_bytes (int, optional): Memory budget for resident ledgers, from StorageEngine.memory_usage().
+            idle_seconds (float, optional): Ledgers unused for this long are evicted.
+        """
+        self.open_ledger = open_ledger
+        self.max_ledgers = max_ledgers
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.entries = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def acquire(self, tenant=None):
+        """
+        Returns a tenant's ledger, opening it if it is not resident, and leases
+        it until release() is called. Blocks while the ledger is opened.
+
+        Args:
+            tenant (str, optional): The tenant id; None for the default ledger.
+
+        Returns:
+            StorageEngine: The ledger.
+        """
+        with self._lock:
+            entry = self.entries.get(tenant)
+            if entry is not None:
+                self._lease(tenant, entry)
+
+        if entry is None:
+            with self._load_lock:
+                with self._lock:
+                    entry = self.entries.get(tenant)
+                    if entry is not None:
+                        self._lease(tenant, entry)
+                if entry is None:
+                    entry = ResidentLedger(self.open_ledger(tenant))
+                    with self._lock:
+                        self.entries[tenant] = entry
+                        self._lease(tenant, entry)
+                        self.loads += 1
+                    logger.info("Opened ledger", extra=fields(tenant=tenant or "default", mib=round(entry.size / 2**20, 1)))
+                self._evict()
+        elif time.monotonic() - self._last_sweep >= SWEEP_INTERVAL_SECONDS and self._load_lock.acquire(blocking=False):
+            try:
+                self._evict()
+            finally:
+                self._load_lock.release()
+        return entry.ledger
+
+    def release(self, tenant=None):
+        """
+        Ends a lease taken with acquire().
+        """
+        with self._lock:
+            entry = self.entries.get(tenant)
+            if entry is not None:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def _lease(self, tenant, entry):
+        entry.leases += 1
+        entry.last_used = time.monotonic()
+        self.entries.move_to_end(tenant)
+
+    def _evict(self):
+        """
+        Flushes and closes least recently used ledgers until the pool is within
+        its limits, and any ledger idle for too long. Callers hold _load_lock.
+        """
+        # Ledgers grow after they are opened; refresh the estimates before choosing
+        for entry in list(self.entries.values()):
+            entry.size = entry.ledger.memory_usage()
+
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            self._last_sweep = now
+            resident = len(self.entries)
+            total = sum(entry.size for entry in self.entries.values())
+            for tenant, entry in list(self.entries.items()):
+                over_limit = resident > self.max_ledgers or total > self.max_bytes
+                if entry.leases or not (over_limit or now - entry.last_used > self.idle_seconds):
+                    continue
+                del self.entries[tenant]
+                resident -= 1
+                total -= entry.size
+                victims.append((tenant, entry))
+
+        for tenant, entry in victims:
+            self._flush(tenant, entry)
+
+    def _flush(self, tenant, entry):
+        try:
+            entry.ledger.save_database()
+        except ValueError:
+            # An empty ledger has nothing to save
+            pass
+        finally:
+            entry.ledger.close()
+        self.evictions += 1
+        logger.info("Evicted ledger", extra=fields(tenant=tenant or "default"))
+
+    def close(self):
+        """
+        Flushes and closes every resident ledger, e.g. on shutdown.
+        """
+        with self._load_lock:
+            with self._lock:
+                victims = list(self.entries.items())
+                self.entries.clear()
+            for tenant, entry in victims:
+                self._flush(tenant, entry)
+
+    def row_counts(self):
+        """
+        Returns {tenant: number of records} for the resident ledgers. They are
+        leased while they are counted, so they cannot be evicted meanwhile.
+        """
+        with self._lock:
+            entries = list(self.entries.items())
+            for _, entry in entries:
+                entry.leases += 1
+        try:
+            return {tenant: entry.ledger.row_count() for tenant, entry in entries}
+        finally:
+            with self._lock:
+                for _, entry in entries:
+                    entry.leases -= 1
+
+    def stats(self):
+        """
+        Returns the number of resident ledgers, their estimated memory, and the
+        load and eviction counters.
+        """
+        with self._lock:
+            return {
+                "resident": len(self.entries),
+                "resident_bytes": sum(entry.size for entry in self.entries.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "max_ledgers": self.max_ledgers,
+                "max_bytes": self.max_bytes,
+                "idle_seconds": self.idle_seconds,
+            }
+
+
+
+class Ledger_Proxy:
+    """
+    Stands in for "the ledger of the current request", so tool functions can
+    keep calling `database.<method>` while every request works on its own
+    tenant's ledger. Outside a request it resolves to the default ledger,
+    leased from the pool for each call so it cannot be evicted and closed
+    while the call runs.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        ledger = current_ledger.get()
+        if ledger is None:
+            return self._leased(name)
+        # During a request every ledger call is recorded as a span of its trace
+        return traced(f"db.{name}", getattr(ledger, name))
+
+    def _leased(self, name):
+        """
+        Reads an attribute of the default ledger under a lease. Methods are
+        returned as callables that take their own lease for the duration of
+        each call, on whichever ledger is resident at that time.
+        """
+        pool = self._pool
+        try:
+            value = getattr(pool.acquire(None), name)
+        finally:
+            pool.release(None)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(pool.acquire(None), name)(*args, **kwargs)
+            finally:
+                pool.release(None)
+        return call
+
+
+
+class TenantMiddleware:
+    """
+    ASGI middleware that picks the tenant of each request from the X-Tenant-ID
+    header or a /tenants/{tenant_id} path prefix (which is stripped before
+    routing). It leases that tenant's ledger from the pool for the whole
+    request, including a streamed response body.
+    """
+
+    def __init__(self, app, pool, path_prefixes):
+        """
+        Args:
+            app: The wrapped ASGI application.
+            pool (Ledger_Pool): The ledgers to lease from.
+            path_prefixes (tuple): Routes that work on a ledger; other routes are passed through.
+        """
+        self.app = app
+        self.pool = pool
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            tenant, scope = self.resolve_tenant(scope)
+        except ValueError as e:
+            await JSONResponse({"detail": str(e)}, status_code=400)(scope, receive, send)
+            return
+
+        if not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        with span("ledger.acquire", tenant=tenant or "default"):
+            ledger = await run_blocking(self.pool.acquire, tenant)
+        token = current_ledger.set(ledger)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_ledger.reset(token)
+            self.pool.release(tenant)
+
+    def resolve_tenant(self, scope):
+        """
+        Returns (tenant, scope), with the tenant prefix removed from the scope's path.
+
+        Raises:
+            ValueError: If the tenant id is invalid.
+        """
+        path = scope["path"]
+        if path.startswith(TENANT_PATH_PREFIX):
+            tenant, _, rest = path[len(TENANT_PATH_PREFIX):].partition("/")
+            validate_tenant(tenant)
+            prefix = TENANT_PATH_PREFIX + tenant
+            scope = dict(scope, path="/" + rest)
+            raw_path = scope.get("raw_path")
+            if raw_path is not None and raw_path.startswith(prefix.encode()):
+                scope["raw_path"] = raw_path[len(prefix):] or b"/"
+            return tenant, scope
+
+        for name, value in scope["headers"]:
+            if name == TENANT_HEADER:
+                return validate_tenant(value.decode("latin-1").strip()), scope
+        return None, scope
@@ -0,0 +1,282 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import reprlib
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Share of requests whose trace is logged; errors and slow requests are always logged.
+TRACE_SAMPLE_RATE = float(os.environ.get("BOOKKEEPING_TRACE_SAMPLE_RATE", "0.1"))
+# Requests slower than this are logged even when they were not sampled.
+TRACE_SLOW_MS = float(os.environ.get("BOOKKEEPING_TRACE_SLOW_MS", "1000"))
+# Logged payloads (arguments, results, prompts) are cut to about this many characters.
+LOG_PAYLOAD_CHARS = int(os.environ.get("BOOKKEEPING_LOG_PAYLOAD_CHARS", "200"))
+LOG_LEVEL = os.environ.get("BOOKKEEPING_LOG_LEVEL", "INFO").upper()
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Client-supplied request ids are kept only if they look like ids.
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+logger = logging.getLogger("bookkeeping")
+
+# The trace of the request being served and its innermost open span; run_blocking copies both into worker threads.
+current_trace = contextvars.ContextVar("current_trace", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+_payload_repr = reprlib.Repr()
+_payload_repr.maxstring = LOG_PAYLOAD_CHARS
+_payload_repr.maxother = LOG_PAYLOAD_CHARS
+_payload_repr.maxlist = _payload_repr.maxtuple = _payload_repr.maxdict = _payload_repr.maxset = 8
+_payload_repr.maxlevel = 3
+
+
+
+def truncate(value):
+    """
+    Returns a loggable form of a payload that is at most about LOG_PAYLOAD_CHARS
+    long. Large containers are abbreviated without being rendered in full.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= LOG_PAYLOAD_CHARS else value[:LOG_PAYLOAD_CHARS] + f"... ({len(value)} chars)"
+    text = _payload_repr.repr(value)
+    return text if len(text) <= LOG_PAYLOAD_CHARS else text[:LOG_PAYLOAD_CHARS] + "..."
+
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line. Fields passed with
+    extra={"fields": {...}} are merged in, and records logged during a request
+    carry its request id.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps records with the current request id. Runs in the thread that logs,
+    before the record is queued, so the id is still known.
+    """
+
+    def filter(self, record):
+        trace = current_trace.get()
+        if trace is not None:
+            record.request_id = trace.request_id
+        return True
+
+
+
+def configure_logging(stream=None):
+    """
+    Sends the "bookkeeping" loggers to `stream` (default stderr) as JSON lines.
+    Records are handed to a background thread through a queue, so formatting
+    and I/O stay off the request path. Does nothing if the application has
+    already configured handlers for the logger.
+    """
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(queue_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+
+def fields(**values):
+    """
+    Builds the `extra` argument for structured fields, e.g.
+    logger.info("Opened ledger", extra=fields(tenant="acme")).
+    """
+    return {"fields": values}
+
+
+
+class Span:
+    """
+    One timed step of a request, such as a Gemini call or a database
+    operation. Attributes keep references to payloads; they are truncated only
+    if the trace is logged.
+    """
+
+    __slots__ = ("name", "start", "duration", "attributes", "error")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+
+    def to_dict(self, trace_start):
+        entry = {
+            "name": self.name,
+            "start_ms": round((self.start - trace_start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+        }
+        if self.attributes:
+            entry["attributes"] = {key: truncate(value) for key, value in self.attributes.items()}
+        if self.error is not None:
+            entry["error"] = self.error
+        return entry
+
+
+
+class Trace:
+    """
+    The spans of one request under a request id. Whether it is logged is
+    decided when it finishes: sampled traces, failed requests and slow
+    requests are logged.
+    """
+
+    def __init__(self, request_id, sampled):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self.error = None
+
+    def finish(self, **attributes):
+        """
+        Logs the trace if it was sampled, failed or was slow.
+        """
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        status = attributes.get("status", 200)
+        failed = self.error is not None or status >= 500
+        if not (self.sampled or failed or duration_ms >= TRACE_SLOW_MS):
+            return
+        record = {
+            "duration_ms": round(duration_ms, 3),
+            **{key: truncate(value) for key, value in {**attributes, **self.attributes}.items()},
+            "sampled": self.sampled,
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        logger.log(logging.ERROR if failed else logging.INFO, "request", extra=fields(**record))
+
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Records the enclosed block as a span of the current request's trace.
+    Outside a request it does nothing.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    entry = Span(name, attributes)
+    trace.spans.append(entry)
+    token = current_span.set(entry)
+    try:
+        yield entry
+    except BaseException as e:
+        entry.error = f"{type(e).__name__}: {truncate(str(e))}"
+        raise
+    finally:
+        entry.duration = time.perf_counter() - entry.start
+        current_span.reset(token)
+
+
+def annotate(**attributes):
+    """
+    Adds attributes to the innermost open span, or to the request's trace
+    when no span is open. Outside a request it does nothing.
+    """
+    target = current_span.get() or current_trace.get()
+    if target is not None:
+        target.attributes.update(attributes)
+
+
+def traced(name, method):
+    """
+    Wraps a callable so every call is recorded as a span. Returns the callable
+    unchanged outside a request.
+    """
+    if current_trace.get() is None or not callable(method):
+        return method
+
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that starts a trace for every HTTP request. The request id
+    comes from the X-Request-ID header (or is generated) and is returned in
+    the response's X-Request-ID header.
+    """
+
+    def __init__(self, app, sample_rate=TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1").strip()
+                break
+        if request_id is None or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+
+        trace = Trace(request_id, sampled=random.random() < self.sample_rate)
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except BaseException as e:
+            trace.error = f"{type(e).__name__}: {truncate(str(e))}"
+            raise
+        finally:
+            trace.finish(method=scope["method"], path=scope["path"], status=status)
+            current_trace.reset(token)
@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.executor import run_blocking
+
+# Rows formatted per chunk; bounds the memory used by a response regardless of ledger size.
+STREAM_CHUNK_ROWS = 1000
+DAY_NAMES = np.array(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], dtype=object)
+
+
+def format_api_dates(dates):
+    """
+    Formats dates as MM.DD.YYYY by rearranging the characters of numpy's ISO
+    strings, which avoids a strftime call per row.
+
+    Args:
+        dates (pd.Series): datetime64 values.
+
+    Returns:
+        np.ndarray: The formatted dates.
+    """
+    iso = np.datetime_as_string(dates.to_numpy(dtype='datetime64[D]'), unit='D').astype('<U10')
+    # YYYY-MM-DD -> MM.DD.YYYY
+    chars = iso.view('<U1').reshape(-1, 10)[:, [5, 6, 4, 8, 9, 4, 0, 1, 2, 3]]
+    chars[:, [2, 5]] = '.'
+    return np.ascontiguousarray(chars).view('<U10').ravel().astype(object)
+
+
+def format_transactions(chunk):
+    """
+    Converts typed ledger rows into the /transactions representation: dates as
+    MM.DD.YYYY plus the abbreviated day of the week, formatted column-wise.
+
+    Args:
+        chunk (pd.DataFrame): Rows with typed columns.
+
+    Returns:
+        pd.DataFrame: The rows with the API columns and plain Python-friendly types.
+    """
+    dates = chunk['date']
+    return pd.DataFrame({
+        'id': chunk['id'].to_numpy(dtype='int64'),
+        'type': chunk['type'].astype(object).to_numpy(),
+        'amount': chunk['amount'].round(2).to_numpy(),
+        'note': chunk['note'].to_numpy(),
+        'category': chunk['category'].astype(object).to_numpy(),
+        'date': format_api_dates(dates),
+        'day': DAY_NAMES[dates.dt.dayofweek.to_numpy()],
+    })
+
+
+def chunk_to_json(frame, positions):
+    # A JSON array without its brackets, so chunks can be joined with commas
+    return format_transactions(frame.iloc[positions]).to_json(orient='records')[1:-1]
+
+
+def chunk_to_ndjson(frame, positions):
+    return format_transactions(frame.iloc[positions]).to_json(orient='records', lines=True).rstrip('\n') + '\n'
+
+
+async def iter_json(frame, positions, timestamp, next_cursor=None, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Streams a page of transactions inside the standard response envelope
+    ({"success", "data", "message", "timestamp", "next_cursor"}), one chunk of
+    rows at a time.
+
+    Args:
+        frame (pd.DataFrame): The ledger returned by Database_Tools.select_rows.
+        positions (np.ndarray): The row positions of the page.
+        timestamp (str): The response timestamp in ISO format.
+        next_cursor (str, optional): Cursor of the next page for keyset pagination.
+        chunk_size (int, optional): Rows formatted per chunk.
+
+    Yields:
+        str: Pieces of the JSON document.
+    """
+    yield '{"success":true,"data":['
+    for start in range(0, len(positions), chunk_size):
+        body = await run_blocking(chunk_to_json, frame, positions[start:start + chunk_size])
+        yield body if start == 0 else ',' + body
+    yield '],"message":null,"timestamp":' + json.dumps(timestamp) + ',"next_cursor":' + json.dumps(next_cursor) + '}'
+
+
+async def iter_ndjson(frame, positions, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Streams a page of transactions as newline-delimited JSON, one object per line.
+
+    Args:
+        frame (pd.DataFrame): The ledger returned by Database_Tools.select_rows.
+        positions (np.ndarray): The row positions of the page.
+        chunk_size (int, optional): Rows formatted per chunk.
+
+    Yields:
+        str: Lines of the NDJSON document.
+    """
+    for start in range(0, len(positions), chunk_size):
+        yield await run_blocking(chunk_to_ndjson, frame, positions[start:start + chunk_size])
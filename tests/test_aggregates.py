@@ -0,0 +1,116 @@
+"""
+The CSV engine keeps its aggregate store, date index and note index up to date
+incrementally. After every kind of mutation, and after a compaction and a
+reload, they must equal a full rescan of the rows (verify_aggregates).
+"""
+import pytest
+
+from benchmarks.synthetic_ledger import write_ledger
+from src.database_tools import Database_Tools
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A large threshold keeps compaction under the test's control
+    engine = Database_Tools(write_ledger(str(tmp_path), 500), compact_threshold=2**40)
+    # Build the note index so it is checked too
+    engine.search_notes("coffee")
+    yield engine
+    engine.close()
+
+
+def test_mutations_keep_aggregates_consistent(database):
+    assert database.verify_aggregates()
+
+    database.insert_data("expense", 12.5, "Lunch", "Food", "2024-03-15")
+    assert database.verify_aggregates()
+
+    database.insert_data("Expense", 3, "Coffee", "Food", "2024-03-16")
+    assert database.verify_aggregates()
+
+    database.update_data(3, amount=99.99)
+    assert database.verify_aggregates()
+
+    database.update_data(4, record_type="pay", amount=10, category="Refund", note="Returned shoes", date="2021-01-31")
+    assert database.verify_aggregates()
+
+    database.delete_data(5)
+    assert database.verify_aggregates()
+
+    database.delete_data()
+    assert database.verify_aggregates()
+
+    database.batch_insert_data([
+        {"type": "expense", "amount": 40, "note": "Weekly Groceries", "category": "Groceries", "date": "2024-03-15"},
+        {"type": "pay", "amount": 250, "note": "Freelance Work", "category": "Salary", "date": "2023-07-01"},
+        {"type": "expense", "amount": 8, "note": "Bus Pass", "category": "New Category", "date": "2024-12-31"},
+    ])
+    assert database.verify_aggregates()
+
+
+def test_aggregates_survive_compaction_and_reload(database, tmp_path):
+    database.insert_data("expense", 12.5, "Lunch", "Food", "2024-03-15")
+    database.update_data(7, amount=1, note="Tea")
+    database.delete_data(8)
+    total = database.calculate_total_amount()
+
+    database.compact()
+    assert database.verify_aggregates()
+
+    database.insert_data("pay", 100, "Bonus", "Bonus", "2024-05-01")
+    with database.write_lock:
+        database.reload()
+    assert database.verify_aggregates()
+    assert database.calculate_total_amount() == pytest.approx(total + 100)
+
+    # A fresh process loads the compacted snapshot and replays the journal written after it
+    reopened = Database_Tools(database.file_path, compact_threshold=2**40)
+    try:
+        reopened.search_notes("tea")
+        assert reopened.verify_aggregates()
+        assert reopened.calculate_total_amount() == pytest.approx(total + 100)
+    finally:
+        reopened.close()
+
+
+def test_date_index_pages_across_buffered_writes(database, monkeypatch):
+    # A small threshold makes the writes below cross several merges of the date index
+    monkeypatch.setattr("src.date_index.MERGE_THRESHOLD", 8)
+    for day in range(1, 29):
+        database.insert_data("expense", day, "Snack", "Food", f"2024-02-{day:02d}")
+    for record_id in range(1, 40, 3):
+        database.delete_data(record_id)
+    database.update_data(2, date="2024-02-10")
+    assert database.verify_aggregates()
+
+    expected = database.data.sort_values(['date', 'id'])['id'].tolist()
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        frame, positions, cursor = database.query_page(50, cursor=cursor)
+        seen += frame.iloc[positions]['id'].tolist()
+    assert seen == expected
+
+    frame, positions = database.select_rows(start_date="2024-02-10", end_date="2024-02-12")
+    february = database.data[(database.data['date'] >= "2024-02-10") & (database.data['date'] <= "2024-02-12")]
+    assert sorted(frame.iloc[positions]['id']) == sorted(february['id'])
+
+
+def test_min_and_max_follow_deletes_of_the_extremes(database):
+    store = database.aggregates
+    frame = database.data
+    expenses = frame[frame['type'].astype(str).str.lower() == "expense"]
+    cheapest = expenses.loc[expenses['amount'].idxmax()]
+    dearest = expenses.loc[expenses['amount'].idxmin()]
+    assert store.maximum(frame, "expense") == pytest.approx(cheapest['amount'])
+    assert store.minimum(frame, "expense") == pytest.approx(dearest['amount'])
+
+    # Deleting a bucket's extreme leaves it stale until it is asked for again
+    database.delete_data(int(dearest['id']))
+    database.delete_data(int(cheapest['id']))
+    frame = database.data
+    expenses = frame[frame['type'].astype(str).str.lower() == "expense"]
+    assert store.minimum(frame, "expense") == pytest.approx(expenses['amount'].min())
+    assert store.maximum(frame, "expense") == pytest.approx(expenses['amount'].max())
+    assert not any(bucket.stale for bucket in store.buckets.values() if bucket.count)
+    assert database.verify_aggregates()
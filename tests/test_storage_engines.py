@@ -0,0 +1,218 @@
+"""
+Behaviour shared by every storage engine. Each test runs against the CSV
+engine (Database_Tools) and the SQLite engine (SQLite_Tools), both opened on
+the same small ledger, so the engines cannot drift apart.
+"""
+import pandas as pd
+import pytest
+
+from src.database_tools import Database_Tools, open_database
+from src.sqlite_tools import SQLite_Tools
+from src.storage import BatchValidationError
+
+LEDGER = pd.DataFrame(
+    [
+        (1, "expense", -12.50, "Coffee", "Food", "2024-03-05"),
+        (2, "expense", -40.00, "Weekly Groceries", "Groceries", "2024-03-15"),
+        (3, "pay", 1200.00, "Monthly Income", "Salary", "2024-03-01"),
+        (4, "expense", -900.00, "Monthly Rent", "Housing", "2024-04-01"),
+        (5, "expense", -4.25, "Coffee beans", "Food", "2024-04-20"),
+        (6, "pay", 250.00, "Freelance Work", "Salary", "2023-12-20"),
+    ],
+    columns=["id", "type", "amount", "note", "category", "date"],
+)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def database(request, tmp_path):
+    csv_path = tmp_path / "database.csv"
+    LEDGER.to_csv(csv_path, index=False)
+    if request.param == "sqlite":
+        engine = SQLite_Tools(str(tmp_path / "database.sqlite3"), import_csv=str(csv_path))
+    else:
+        engine = Database_Tools(str(csv_path))
+    yield engine
+    engine.close()
+
+
+def ids(frame, positions):
+    return frame.iloc[positions]['id'].astype(int).tolist()
+
+
+def test_insert_data(database):
+    message = database.insert_data("expense", 8.75, "Lunch", "Food", "2024-03-20")
+
+    assert "ID: 7" in message
+    record = database.get_record(7)
+    assert record['amount'] == -8.75
+    assert record['note'] == "Lunch"
+    assert record['date'] == pd.Timestamp("2024-03-20")
+    assert database.row_count() == 7
+
+
+def test_batch_insert_data(database):
+    new_ids = database.batch_insert_data([
+        {"type": "expense", "amount": 10, "note": "Taxi", "category": "Transportation", "date": "2024-03-21"},
+        {"type": "pay", "amount": 50, "note": "Refund", "category": "Refund", "date": "2024-03-22"},
+    ])
+
+    assert new_ids == [7, 8]
+    assert database.get_record(7)['amount'] == -10.0
+    assert database.get_record(8)['amount'] == 50.0
+    assert database.row_count() == 8
+
+
+def test_batch_insert_data_rejects_invalid_records(database):
+    with pytest.raises(BatchValidationError) as error:
+        database.batch_insert_data([
+            {"type": "expense", "amount": 10, "note": "Taxi", "category": "Transportation", "date": "2024-03-21"},
+            {"type": "expense", "amount": "ten", "note": "Bus", "category": "Transportation", "date": "2024-03-21"},
+            {"type": "expense", "amount": 5, "note": "Tea", "category": "Food", "date": "not a date"},
+            {"type": "expense", "amount": 5, "category": "Food", "date": "2024-03-21"},
+        ])
+
+    assert set(error.value.errors) == {1, 2, 3}
+    assert database.row_count() == len(LEDGER)
+
+    with pytest.raises(ValueError):
+        database.batch_insert_data([])
+
+
+def test_update_data(database):
+    database.update_data(2, record_type="expense", amount=50, note="Groceries")
+
+    record = database.get_record(2)
+    assert record['amount'] == -50.0
+    assert record['note'] == "Groceries"
+    assert database.calculate_monthly_total("expense", 3, 2024) == -62.5
+
+    with pytest.raises(KeyError):
+        database.update_data(99, amount=1)
+
+
+def test_delete_data(database):
+    database.delete_data(1)
+
+    assert not database.has_record(1)
+    assert database.row_count() == len(LEDGER) - 1
+    with pytest.raises(KeyError):
+        database.delete_data(1)
+
+    # Without an id the newest record is deleted
+    database.delete_data()
+    assert not database.has_record(6)
+
+
+def test_period_totals(database):
+    assert database.calculate_total_amount("pay") == 1450.0
+    assert database.calculate_monthly_total("expense", 3, 2024) == -52.5
+    assert database.calculate_monthly_total("expense", year=2024) == -956.75
+    assert database.calculate_monthly_total("pay", year=2023) == 250.0
+    assert database.calculate_monthly_total("expense", start_date="2024-03-10", end_date="2024-04-10") == -940.0
+    assert database.calculate_monthly_total("expense", 5, 2024) == 0
+
+
+def test_period_totals_reject_inverted_range(database):
+    with pytest.raises(ValueError):
+        database.calculate_monthly_total("expense", start_date="2024-04-01", end_date="2024-03-01")
+
+
+def test_average_amount(database):
+    assert database.calculate_average_amount("expense", 3, 2024) == -26.25
+    assert database.calculate_average_amount("pay") == 725.0
+    assert database.calculate_average_amount("expense", start_date="2024-04-01", end_date="2024-04-30") == -452.12
+
+
+def test_summarize(database):
+    summary = database.summarize(["category"], "expense", year=2024)
+
+    assert summary == [
+        {"category": "Food", "total": -16.75, "count": 2, "average": -8.38},
+        {"category": "Groceries", "total": -40.0, "count": 1, "average": -40.0},
+        {"category": "Housing", "total": -900.0, "count": 1, "average": -900.0},
+    ]
+
+
+def test_select_rows_pages(database):
+    frame, positions = database.select_rows(offset=1, limit=2)
+    assert ids(frame, positions) == [2, 3]
+
+    frame, positions = database.select_rows("expense", year=2024, offset=2)
+    assert ids(frame, positions) == [4, 5]
+
+
+def test_select_rows_pages_unsorted_ledgers_by_id(tmp_path):
+    # Ledgers edited by hand are not always sorted by id; both engines page in id order
+    csv_path = tmp_path / "database.csv"
+    LEDGER.iloc[[3, 5, 0, 4, 1, 2]].to_csv(csv_path, index=False)
+    engines = [Database_Tools(str(csv_path)), SQLite_Tools(str(tmp_path / "database.sqlite3"), import_csv=str(csv_path))]
+    try:
+        for engine in engines:
+            engine.insert_data("expense", 3, "Tea", "Food", "2024-03-02")
+            assert ids(*engine.select_rows()) == [1, 2, 3, 4, 5, 6, 7]
+            assert ids(*engine.select_rows(offset=2, limit=3)) == [3, 4, 5]
+            assert ids(*engine.select_rows("expense", month=3, year=2024, offset=1)) == [2, 7]
+    finally:
+        for engine in engines:
+            engine.close()
+
+
+def test_query_page_walks_the_ledger_by_date(database):
+    for descending in (False, True):
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            frame, positions, cursor = database.query_page(2, cursor=cursor, descending=descending)
+            seen += ids(frame, positions)
+        expected = [6, 3, 1, 2, 4, 5]
+        assert seen == (expected[::-1] if descending else expected)
+
+    frame, positions, cursor = database.query_page(10, record_type="expense", month=3, year=2024)
+    assert ids(frame, positions) == [1, 2]
+    assert cursor is None
+
+
+def test_search_notes(database):
+    assert ids(*database.search_notes("coff")) == [5, 1]
+    assert ids(*database.search_notes("coffees ")) == [5, 1]
+    assert ids(*database.search_notes("coffee bean")) == [5]
+    assert ids(*database.search_notes("monthly", record_type="pay")) == [3]
+    assert ids(*database.search_notes("monthly", year=2024, month=4)) == [4]
+    assert ids(*database.search_notes("coffee", limit=1)) == [5]
+    assert ids(*database.search_notes("tea")) == []
+
+
+def test_search_notes_follows_mutations(database):
+    database.insert_data("expense", 5, "Starbucks latte", "Food", "2024-03-22")
+    database.update_data(1, note="Starbucks")
+    database.delete_data(5)
+
+    assert ids(*database.search_notes("starbucks")) == [7, 1]
+    assert ids(*database.search_notes("coffee")) == []
+
+
+def test_sqlite_import_leaves_the_source_ledger_untouched(tmp_path):
+    csv_path = tmp_path / "ledger" / "database.csv"
+    csv_path.parent.mkdir()
+    LEDGER.to_csv(csv_path, index=False)
+
+    engine = SQLite_Tools(str(tmp_path / "database.sqlite3"), import_csv=str(csv_path))
+    try:
+        assert engine.row_count() == len(LEDGER)
+    finally:
+        engine.close()
+    assert [path.name for path in csv_path.parent.iterdir()] == ["database.csv"]
+
+
+def test_open_database_imports_the_configured_ledger_into_sqlite(tmp_path, monkeypatch):
+    csv_path = tmp_path / "books.csv"
+    LEDGER.to_csv(csv_path, index=False)
+    monkeypatch.setenv("BOOKKEEPING_DATABASE_PATH", str(csv_path))
+
+    engine = open_database("sqlite")
+    try:
+        assert isinstance(engine, SQLite_Tools)
+        assert engine.row_count() == len(LEDGER)
+    finally:
+        engine.close()
+    assert (tmp_path / "books.sqlite3").exists()